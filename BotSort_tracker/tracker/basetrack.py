@@ -1,6 +1,8 @@
 import numpy as np
 from collections import OrderedDict
 
+from ByteTrack_tracker.basetrack import TableBacked, TableColumn, TrackTable
+
 
 class TrackState(object):
     New = 0
@@ -10,24 +12,31 @@ class TrackState(object):
     Removed = 4
 
 
-class BaseTrack(object):
+class BaseTrack(TableBacked):
+    __slots__ = ('_table', '_row', '_track_id', '_score', '_start_frame', '_frame_id', '_state',
+                 'is_activated', 'time_since_update')
+
     _count = 0
 
-    track_id = 0
-    is_activated = False
-    state = TrackState.New
+    track_id = TableColumn(0)
+    score = TableColumn(0)
+    start_frame = TableColumn(0)
+    frame_id = TableColumn(0)
+    state = TableColumn(TrackState.New)
 
     history = OrderedDict()
     features = []
     curr_feature = None
-    score = 0
-    start_frame = 0
-    frame_id = 0
-    time_since_update = 0
 
     # multi-camera
     location = (np.inf, np.inf)
 
+    def __init__(self):
+        self._table = None
+        self._row = None
+        self.is_activated = False
+        self.time_since_update = 0
+
     @property
     def end_frame(self):
         return self.frame_id
@@ -54,6 +63,7 @@ class BaseTrack(object):
 
     def mark_removed(self):
         self.state = TrackState.Removed
+        self.detach()
 
     @staticmethod
     def clear_count():
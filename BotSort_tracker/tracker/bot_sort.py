@@ -5,16 +5,27 @@ from collections import deque
 
 from BotSort_tracker.tracker import matching
 from BotSort_tracker.tracker.gmc import GMC
-from BotSort_tracker.tracker.basetrack import BaseTrack, TrackState
+from BotSort_tracker.tracker.basetrack import BaseTrack, TrackState, TableColumn, TrackTable
 from BotSort_tracker.tracker.kalman_filter import KalmanFilter
+from BotSort_tracker.tracker.reid import AppearanceEmbedder
 
 # from fast_reid.fast_reid_interfece import FastReIDInterface
 
 
 class STrack(BaseTrack):
+    __slots__ = ('_tlwh', 'kalman_filter', '_mean', '_covariance', '_cls', '_tracklet_len',
+                 'smooth_feat', 'curr_feat', 'features', 'feat_history', 'alpha')
+
     shared_kalman = KalmanFilter()
 
+    # 激活后存放在跟踪器的 TrackTable 中
+    mean = TableColumn()
+    covariance = TableColumn()
+    cls = TableColumn(nullable=True)
+    tracklet_len = TableColumn(0)
+
     def __init__(self, tlwh, score, cls=None, feat=None, feat_history=50):
+        super(STrack, self).__init__()
 
         # wait activate
         self._tlwh = np.asarray(tlwh, dtype=np.float64)
@@ -28,10 +39,27 @@ class STrack(BaseTrack):
 
         self.smooth_feat = None
         self.curr_feat = None
+        # 特征历史只在有ReID特征时才创建
+        self.features = None
+        self.feat_history = feat_history
+        self.alpha = 0.9
         if feat is not None:
             self.update_features(feat)
-        self.features = deque([], maxlen=feat_history)
-        self.alpha = 0.9
+
+    @staticmethod
+    def make_table(capacity=64):
+        """Track table holding the state of all activated tracks of one tracker"""
+        return TrackTable({
+            'mean': ((8,), np.float64, np.nan),
+            'covariance': ((8, 8), np.float64, np.nan),
+            'track_id': ((), np.int64, 0),
+            'score': ((), np.float64, 0),
+            'cls': ((), np.float64, np.nan),
+            'start_frame': ((), np.int64, 0),
+            'frame_id': ((), np.int64, 0),
+            'tracklet_len': ((), np.int64, 0),
+            'state': ((), np.int8, TrackState.New),
+        }, capacity)
 
     def update_features(self, feat):
         feat /= np.linalg.norm(feat)
@@ -40,6 +68,8 @@ class STrack(BaseTrack):
             self.smooth_feat = feat
         else:
             self.smooth_feat = self.alpha * self.smooth_feat + (1 - self.alpha) * feat
+        if self.features is None:
+            self.features = deque([], maxlen=self.feat_history)
         self.features.append(feat)
         self.smooth_feat /= np.linalg.norm(self.smooth_feat)
 
@@ -54,37 +84,89 @@ class STrack(BaseTrack):
     @staticmethod
     def multi_predict(stracks):
         if len(stracks) > 0:
-            multi_mean = np.asarray([st.mean.copy() for st in stracks])
-            multi_covariance = np.asarray([st.covariance for st in stracks])
-            for i, st in enumerate(stracks):
-                if st.state != TrackState.Tracked:
-                    multi_mean[i][6] = 0
-                    multi_mean[i][7] = 0
+            table, rows, multi_mean, multi_covariance = STrack.gather_state(stracks)
+            if table is not None:
+                not_tracked = table.state[rows] != TrackState.Tracked
+            else:
+                not_tracked = np.array([st.state != TrackState.Tracked for st in stracks])
+            multi_mean[not_tracked, 6:8] = 0
             multi_mean, multi_covariance = STrack.shared_kalman.multi_predict(multi_mean, multi_covariance)
-            for i, (mean, cov) in enumerate(zip(multi_mean, multi_covariance)):
-                stracks[i].mean = mean
-                stracks[i].covariance = cov
+            STrack.scatter_state(stracks, table, rows, multi_mean, multi_covariance)
 
     @staticmethod
     def multi_gmc(stracks, H=np.eye(2, 3)):
+        """Warp the tracks by a 2x3 affine, or a 3x3 homography (linearized at each track center)"""
         if len(stracks) > 0:
-            multi_mean = np.asarray([st.mean.copy() for st in stracks])
-            multi_covariance = np.asarray([st.covariance for st in stracks])
+            table, rows, multi_mean, multi_covariance = STrack.gather_state(stracks)
+
+            if H.shape[0] == 3:
+                # 单应变换: 中心点精确投影，其余状态用该点处的雅可比矩阵做局部仿射
+                x, y = multi_mean[:, 0], multi_mean[:, 1]
+                w = H[2, 0] * x + H[2, 1] * y + H[2, 2]
+                u = (H[0, 0] * x + H[0, 1] * y + H[0, 2]) / w
+                v = (H[1, 0] * x + H[1, 1] * y + H[1, 2]) / w
+                J = np.empty((len(stracks), 2, 2))
+                J[:, 0, 0] = (H[0, 0] - u * H[2, 0]) / w
+                J[:, 0, 1] = (H[0, 1] - u * H[2, 1]) / w
+                J[:, 1, 0] = (H[1, 0] - v * H[2, 0]) / w
+                J[:, 1, 1] = (H[1, 1] - v * H[2, 1]) / w
+                J8x8 = np.zeros((len(stracks), 8, 8))
+                for k in range(4):
+                    J8x8[:, 2 * k:2 * k + 2, 2 * k:2 * k + 2] = J
+
+                multi_mean = np.einsum('nij,nj->ni', J8x8, multi_mean)
+                multi_mean[:, 0], multi_mean[:, 1] = u, v
+                multi_covariance = np.matmul(np.matmul(J8x8, multi_covariance), J8x8.transpose(0, 2, 1))
+                STrack.scatter_state(stracks, table, rows, multi_mean, multi_covariance)
+                return
 
             R = H[:2, :2]
             R8x8 = np.kron(np.eye(4, dtype=float), R)
             t = H[:2, 2]
 
-            for i, (mean, cov) in enumerate(zip(multi_mean, multi_covariance)):
-                mean = R8x8.dot(mean)
-                mean[:2] += t
-                cov = R8x8.dot(cov).dot(R8x8.transpose())
+            # 所有轨迹一次完成仿射变换: mean' = R mean + t, cov' = R cov R^T
+            multi_mean = np.dot(multi_mean, R8x8.T)
+            multi_mean[:, :2] += t
+            multi_covariance = np.matmul(np.matmul(R8x8, multi_covariance), R8x8.T)
+            STrack.scatter_state(stracks, table, rows, multi_mean, multi_covariance)
 
-                stracks[i].mean = mean
-                stracks[i].covariance = cov
+    @staticmethod
+    def multi_update(stracks, new_tracks, frame_id, reactivate=None):
+        """
+        Batched Kalman correction for matched pairs (stracks[i] <- new_tracks[i]).
+        reactivate[i] True means stracks[i] was lost and is re-activated
+        (same as re_activate), otherwise it is a normal update.
+        """
+        if len(stracks) == 0:
+            return
+        if reactivate is None:
+            reactivate = [False] * len(stracks)
+
+        table, rows, multi_mean, multi_covariance = STrack.gather_state(stracks)
+        measurements = np.asarray([STrack.tlwh_to_xywh(nt.tlwh) for nt in new_tracks])
+        multi_mean, multi_covariance = STrack.shared_kalman.multi_update(multi_mean, multi_covariance, measurements)
+        STrack.scatter_state(stracks, table, rows, multi_mean, multi_covariance)
 
-    def activate(self, kalman_filter, frame_id):
-        """Start a new tracklet"""
+        for st, nt, refind in zip(stracks, new_tracks, reactivate):
+            st._mark_updated(nt, frame_id, refind)
+
+    def _mark_updated(self, new_track, frame_id, reactivate=False):
+        """Bookkeeping after the Kalman correction of update / re_activate"""
+        self.frame_id = frame_id
+        if reactivate:
+            self.tracklet_len = 0
+        else:
+            self.tracklet_len += 1
+
+        if new_track.curr_feat is not None:
+            self.update_features(new_track.curr_feat)
+
+        self.state = TrackState.Tracked
+        self.is_activated = True
+        self.score = new_track.score
+
+    def activate(self, kalman_filter, frame_id, table=None):
+        """Start a new tracklet, its state moves into `table` when given"""
         self.kalman_filter = kalman_filter
         self.track_id = self.next_id()
 
@@ -96,19 +178,15 @@ class STrack(BaseTrack):
             self.is_activated = True
         self.frame_id = frame_id
         self.start_frame = frame_id
+        if table is not None:
+            self.attach(table)
 
     def re_activate(self, new_track, frame_id, new_id=False):
 
         self.mean, self.covariance = self.kalman_filter.update(self.mean, self.covariance, self.tlwh_to_xywh(new_track.tlwh))
-        if new_track.curr_feat is not None:
-            self.update_features(new_track.curr_feat)
-        self.tracklet_len = 0
-        self.state = TrackState.Tracked
-        self.is_activated = True
-        self.frame_id = frame_id
+        self._mark_updated(new_track, frame_id, reactivate=True)
         if new_id:
             self.track_id = self.next_id()
-        self.score = new_track.score
 
     def update(self, new_track, frame_id):
         """
@@ -118,20 +196,10 @@ class STrack(BaseTrack):
         :type update_feature: bool
         :return:
         """
-        self.frame_id = frame_id
-        self.tracklet_len += 1
-
         new_tlwh = new_track.tlwh
 
         self.mean, self.covariance = self.kalman_filter.update(self.mean, self.covariance, self.tlwh_to_xywh(new_tlwh))
-
-        if new_track.curr_feat is not None:
-            self.update_features(new_track.curr_feat)
-
-        self.state = TrackState.Tracked
-        self.is_activated = True
-
-        self.score = new_track.score
+        self._mark_updated(new_track, frame_id)
 
     @property
     def tlwh(self):
@@ -144,6 +212,18 @@ class STrack(BaseTrack):
         ret[:2] -= ret[2:] / 2
         return ret
 
+    @staticmethod
+    def multi_tlbr(stracks):
+        """[N,4] tlbr boxes of the tracks, from their track table rows without per-track property calls"""
+        table, rows = STrack.table_rows(stracks)
+        if table is not None:
+            ret = table.mean[rows, :4]
+            ret[:, :2] -= ret[:, 2:] / 2
+        else:
+            ret = np.asarray([st.tlwh for st in stracks], dtype=np.float64).reshape(-1, 4)
+        ret[:, 2:] += ret[:, :2]
+        return ret
+
     @property
     def tlbr(self):
         """Convert bounding box to format `(min x, min y, max x, max y)`, i.e.,
@@ -201,11 +281,13 @@ class STrack(BaseTrack):
 
 
 class BoTSORT(object):
-    def __init__(self):
+    def __init__(self, cmc_method="adaptive", with_reid=False):
 
         self.tracked_stracks = []  # type: list[STrack]
         self.lost_stracks = []  # type: list[STrack]
         self.removed_stracks = []  # type: list[STrack]
+        self.max_removed_stracks = 1000  # 只保留最近移除的轨迹，避免长时间跟踪时无限增长
+        self.track_table = STrack.make_table()
         BaseTrack.clear_count()
 
         self.frame_id = 0
@@ -223,16 +305,72 @@ class BoTSORT(object):
         # ReID module
         self.proximity_thresh = 0.5
         self.appearance_thresh = 0.25
-        self.with_reid = False
+        self.with_reid = with_reid  # 外观特征关联，默认关闭，输出与纯运动关联一致
+        self.reid_interval = 5  # 每隔几帧提取一次外观特征，关联有歧义时立即提取
 
         # if self.with_reid:
         #     self.encoder = FastReIDInterface(args.fast_reid_config, args.fast_reid_weights, args.device)
+        self.encoder = AppearanceEmbedder(interval=self.reid_interval) if self.with_reid else None
 
-        self.cmc_method = "sparseOptFlow"
+        self.cmc_method = cmc_method  # sparseOptFlow / adaptive / telemetry / ecc / orb / sift / none
         self.gmc = GMC(method=self.cmc_method, verbose=[None, False])
         self.match_thresh = 0.8
 
-    def update(self, output_results, img):
+        # 稀疏关联：只对有重叠的轨迹-检测对计算代价，结果与稠密IoU矩阵一致
+        self.sparse_association = True
+        self.motion_gating = False  # 额外用卡尔曼马氏距离门限剔除候选对
+
+    def dense_association(self, tracks, detections, thresh, features=None):
+        """IoU (fused with detection scores and appearance) association on the full cost matrix"""
+        raw_ious_dists = matching.iou_distance(tracks, detections)
+
+        # if not self.args.mot20:
+        #     print('111111111111111111111111111111')
+        ious_dists = matching.fuse_score(raw_ious_dists, detections)
+
+        if features is not None and ious_dists.size > 0:
+            emb_dists = (1 - features[0] @ features[1].T) / 2.0
+            ious_dists = matching.fuse_appearance(ious_dists, raw_ious_dists, emb_dists,
+                                                  self.proximity_thresh, self.appearance_thresh)
+
+            # Popular ReID method (JDE / FairMOT)
+            # raw_emb_dists = matching.embedding_distance(tracks, detections)
+            # dists = matching.fuse_motion(self.kalman_filter, raw_emb_dists, tracks, detections)
+            # emb_dists = dists
+
+            # IoU making ReID
+            # dists = matching.embedding_distance(tracks, detections)
+            # dists[ious_dists_mask] = 1.0
+        # else:
+        dists = ious_dists
+
+        if self.motion_gating:
+            dists = matching.gate_cost_matrix(self.kalman_filter, dists, tracks, detections)
+
+        return matching.linear_assignment(dists, thresh=thresh)
+
+    def association_ambiguous(self, tracks, detections):
+        """
+        True when a track or detection has several close candidates (IoU cost <= proximity_thresh).
+        Appearance only takes part for close pairs, so it can not change a one-to-one IoU match.
+        """
+        atlbrs, btlbrs = matching.tlbrs(tracks), matching.tlbrs(detections)
+        rows, cols = matching.candidate_pairs(atlbrs, btlbrs)
+        close = 1 - matching.pair_ious(atlbrs, btlbrs, rows, cols) <= self.proximity_thresh
+        if not close.any():
+            return False
+        return np.bincount(rows[close]).max() > 1 or np.bincount(cols[close]).max() > 1
+
+    def track_features(self, tracks):
+        """Cached embeddings of the tracks, zero rows (never matched by appearance) for tracks without one"""
+        features, _ = self.encoder.track_features([track.track_id for track in tracks])
+        return features
+
+    def update(self, output_results, img, ego_motion=None, camera_pose=None):
+        """
+        :param ego_motion: optional UAV kinematics (or body angular velocity) passed to GMC as a camera motion hint
+        :param camera_pose: camera pose of this frame, required by the 'telemetry' GMC method
+        """
         self.frame_id += 1
         activated_starcks = []
         refind_stracks = []
@@ -278,10 +416,6 @@ class BoTSORT(object):
             scores_keep = []
             classes_keep = []
 
-        '''Extract embeddings '''
-        # if self.args.with_reid:
-        #     features_keep = self.encoder.inference(img, dets)
-
         if len(dets) > 0:
             '''Detections'''
             detections = [STrack(STrack.tlbr_to_tlwh(tlbr), s, cls=c) for
@@ -306,47 +440,37 @@ class BoTSORT(object):
         STrack.multi_predict(strack_pool)
 
         # Fix camera motion
-        warp = self.gmc.apply(img, dets)
+        warp = self.gmc.apply(img, dets, ego_motion, camera_pose)
         STrack.multi_gmc(strack_pool, warp)
         STrack.multi_gmc(unconfirmed, warp)
 
-        # Associate with high score detection boxes
-        ious_dists = matching.iou_distance(strack_pool, detections)
-        ious_dists_mask = (ious_dists > self.proximity_thresh)
-
-        # if not self.args.mot20:
-        #     print('111111111111111111111111111111')
-        ious_dists = matching.fuse_score(ious_dists, detections)
-
-        # if self.args.with_reid:
-        #     emb_dists = matching.embedding_distance(strack_pool, detections) / 2.0
-        #     raw_emb_dists = emb_dists.copy()
-        #     emb_dists[emb_dists > self.appearance_thresh] = 1.0
-        #     emb_dists[ious_dists_mask] = 1.0
-        #     dists = np.minimum(ious_dists, emb_dists)
-
-            # Popular ReID method (JDE / FairMOT)
-            # raw_emb_dists = matching.embedding_distance(strack_pool, detections)
-            # dists = matching.fuse_motion(self.kalman_filter, raw_emb_dists, strack_pool, detections)
-            # emb_dists = dists
-
-            # IoU making ReID
-            # dists = matching.embedding_distance(strack_pool, detections)
-            # dists[ious_dists_mask] = 1.0
-        # else:
-        dists = ious_dists
-
-        matches, u_track, u_detection = matching.linear_assignment(dists, thresh=self.match_thresh)
+        '''Extract embeddings '''
+        # 只对高分检测框提取外观特征，且每隔 reid_interval 帧或关联有歧义时才运行
+        features_keep = None
+        if self.with_reid and len(detections) > 0 and self.encoder.should_run(
+                self.frame_id, len(strack_pool) > 0 and self.association_ambiguous(strack_pool, detections)):
+            features_keep = self.encoder.extract(img, dets)
+        features = (self.track_features(strack_pool), features_keep) if features_keep is not None else None
 
-        for itracked, idet in matches:
-            track = strack_pool[itracked]
-            det = detections[idet]
-            if track.state == TrackState.Tracked:
-                track.update(detections[idet], self.frame_id)
-                activated_starcks.append(track)
-            else:
-                track.re_activate(det, self.frame_id, new_id=False)
+        # Associate with high score detection boxes
+        gating_kf = self.kalman_filter if self.motion_gating else None
+        if self.sparse_association:
+            matches, u_track, u_detection = matching.sparse_iou_assignment(
+                strack_pool, detections, self.match_thresh, fuse_det_score=True, kf=gating_kf, features=features,
+                proximity_thresh=self.proximity_thresh, appearance_thresh=self.appearance_thresh)
+        else:
+            matches, u_track, u_detection = self.dense_association(strack_pool, detections, self.match_thresh, features)
+
+        matched_tracks = [strack_pool[itracked] for itracked, _ in matches]
+        if features_keep is not None:
+            self.encoder.update([track.track_id for track in matched_tracks], features_keep[[idet for _, idet in matches]])
+        reactivate = [track.state != TrackState.Tracked for track in matched_tracks]
+        STrack.multi_update(matched_tracks, [detections[idet] for _, idet in matches], self.frame_id, reactivate)
+        for track, refind in zip(matched_tracks, reactivate):
+            if refind:
                 refind_stracks.append(track)
+            else:
+                activated_starcks.append(track)
 
         ''' Step 3: Second association, with low score detection boxes'''
         if len(scores):
@@ -370,17 +494,22 @@ class BoTSORT(object):
             detections_second = []
 
         r_tracked_stracks = [strack_pool[i] for i in u_track if strack_pool[i].state == TrackState.Tracked]
-        dists = matching.iou_distance(r_tracked_stracks, detections_second)
-        matches, u_track, u_detection_second = matching.linear_assignment(dists, thresh=0.5)
-        for itracked, idet in matches:
-            track = r_tracked_stracks[itracked]
-            det = detections_second[idet]
-            if track.state == TrackState.Tracked:
-                track.update(det, self.frame_id)
-                activated_starcks.append(track)
-            else:
-                track.re_activate(det, self.frame_id, new_id=False)
+        if self.sparse_association:
+            matches, u_track, u_detection_second = matching.sparse_iou_assignment(
+                r_tracked_stracks, detections_second, 0.5, kf=gating_kf)
+        else:
+            dists = matching.iou_distance(r_tracked_stracks, detections_second)
+            if self.motion_gating:
+                dists = matching.gate_cost_matrix(self.kalman_filter, dists, r_tracked_stracks, detections_second)
+            matches, u_track, u_detection_second = matching.linear_assignment(dists, thresh=0.5)
+        matched_tracks = [r_tracked_stracks[itracked] for itracked, _ in matches]
+        reactivate = [track.state != TrackState.Tracked for track in matched_tracks]
+        STrack.multi_update(matched_tracks, [detections_second[idet] for _, idet in matches], self.frame_id, reactivate)
+        for track, refind in zip(matched_tracks, reactivate):
+            if refind:
                 refind_stracks.append(track)
+            else:
+                activated_starcks.append(track)
 
         for it in u_track:
             track = r_tracked_stracks[it]
@@ -390,23 +519,21 @@ class BoTSORT(object):
 
         '''Deal with unconfirmed tracks, usually tracks with only one beginning frame'''
         detections = [detections[i] for i in u_detection]
-        ious_dists = matching.iou_distance(unconfirmed, detections)
-        ious_dists_mask = (ious_dists > self.proximity_thresh)
-        ious_dists = matching.fuse_score(ious_dists, detections)
-
-        # if self.args.with_reid:
-        #     emb_dists = matching.embedding_distance(unconfirmed, detections) / 2.0
-        #     raw_emb_dists = emb_dists.copy()
-        #     emb_dists[emb_dists > self.appearance_thresh] = 1.0
-        #     emb_dists[ious_dists_mask] = 1.0
-        #     dists = np.minimum(ious_dists, emb_dists)
-        # else:
-        dists = ious_dists
-
-        matches, u_unconfirmed, u_detection = matching.linear_assignment(dists, thresh=0.7)
-        for itracked, idet in matches:
-            unconfirmed[itracked].update(detections[idet], self.frame_id)
-            activated_starcks.append(unconfirmed[itracked])
+        if features_keep is not None:
+            features_keep = features_keep[np.asarray(u_detection, dtype=int)]
+            features = (self.track_features(unconfirmed), features_keep)
+        if self.sparse_association:
+            matches, u_unconfirmed, u_detection = matching.sparse_iou_assignment(
+                unconfirmed, detections, 0.7, fuse_det_score=True, kf=gating_kf, features=features,
+                proximity_thresh=self.proximity_thresh, appearance_thresh=self.appearance_thresh)
+        else:
+            matches, u_unconfirmed, u_detection = self.dense_association(unconfirmed, detections, 0.7, features)
+        STrack.multi_update([unconfirmed[itracked] for itracked, _ in matches],
+                            [detections[idet] for _, idet in matches], self.frame_id)
+        if features_keep is not None:
+            self.encoder.update([unconfirmed[itracked].track_id for itracked, _ in matches],
+                                features_keep[[idet for _, idet in matches]])
+        activated_starcks.extend(unconfirmed[itracked] for itracked, _ in matches)
         for it in u_unconfirmed:
             track = unconfirmed[it]
             track.mark_removed()
@@ -418,8 +545,10 @@ class BoTSORT(object):
             if track.score < self.new_track_thresh:
                 continue
 
-            track.activate(self.kalman_filter, self.frame_id)
+            track.activate(self.kalman_filter, self.frame_id, self.track_table)
             activated_starcks.append(track)
+            if features_keep is not None:
+                self.encoder.update([track.track_id], features_keep[[inew]])
 
         """ Step 5: Update state"""
         for track in self.lost_stracks:
@@ -434,51 +563,83 @@ class BoTSORT(object):
         self.lost_stracks = sub_stracks(self.lost_stracks, self.tracked_stracks)
         self.lost_stracks.extend(lost_stracks)
         self.lost_stracks = sub_stracks(self.lost_stracks, self.removed_stracks)
+        self.tracked_stracks, self.lost_stracks = remove_duplicate_stracks(self.tracked_stracks, self.lost_stracks,
+                                                                           removed_stracks)
         self.removed_stracks.extend(removed_stracks)
-        self.tracked_stracks, self.lost_stracks = remove_duplicate_stracks(self.tracked_stracks, self.lost_stracks)
+        if self.with_reid:
+            self.encoder.forget([track.track_id for track in removed_stracks])
+        if len(self.removed_stracks) > self.max_removed_stracks:
+            del self.removed_stracks[:-self.max_removed_stracks]
 
         # output_stracks = [track for track in self.tracked_stracks if track.is_activated]
         output_stracks = [track for track in self.tracked_stracks]
 
         return output_stracks
 
+    def predict(self, img, ego_motion=None, camera_pose=None):
+        """
+        Propagate the tracks to a frame without detections: Kalman prediction plus camera
+        motion compensation, no association. Track states, ids and scores are unchanged.
+        """
+        self.frame_id += 1
+        unconfirmed = [track for track in self.tracked_stracks if not track.is_activated]
+        tracked_stracks = [track for track in self.tracked_stracks if track.is_activated]
+        strack_pool = joint_stracks(tracked_stracks, self.lost_stracks)
+        STrack.multi_predict(strack_pool)
+
+        # 没有检测框，用预测的轨迹框遮挡前景
+        boxes = matching.tlbrs(self.tracked_stracks) if len(self.tracked_stracks) > 0 else None
+        warp = self.gmc.apply(img, boxes, ego_motion, camera_pose)
+        STrack.multi_gmc(strack_pool, warp)
+        STrack.multi_gmc(unconfirmed, warp)
+
+        return [track for track in self.tracked_stracks]
+
 
 def joint_stracks(tlista, tlistb):
-    exists = {}
+    exists = set()
     res = []
     for t in tlista:
-        exists[t.track_id] = 1
+        exists.add(t.track_id)
         res.append(t)
     for t in tlistb:
         tid = t.track_id
-        if not exists.get(tid, 0):
-            exists[tid] = 1
+        if tid not in exists:
+            exists.add(tid)
             res.append(t)
     return res
 
 
 def sub_stracks(tlista, tlistb):
+    removed = {t.track_id for t in tlistb}
     stracks = {}
     for t in tlista:
-        stracks[t.track_id] = t
-    for t in tlistb:
         tid = t.track_id
-        if stracks.get(tid, 0):
-            del stracks[tid]
+        if tid not in removed:
+            stracks[tid] = t
     return list(stracks.values())
 
 
-def remove_duplicate_stracks(stracksa, stracksb):
-    pdist = matching.iou_distance(stracksa, stracksb)
-    pairs = np.where(pdist < 0.15)
-    dupa, dupb = list(), list()
+def remove_duplicate_stracks(stracksa, stracksb, removed=None):
+    # 只有重叠的轨迹对才可能是重复轨迹
+    atlbrs, btlbrs = matching.tlbrs(stracksa), matching.tlbrs(stracksb)
+    rows, cols = matching.candidate_pairs(atlbrs, btlbrs)
+    pdist = 1 - matching.pair_ious(atlbrs, btlbrs, rows, cols)
+    pairs = (rows[pdist < 0.15], cols[pdist < 0.15])
+    dupa, dupb = set(), set()
     for p, q in zip(*pairs):
         timep = stracksa[p].frame_id - stracksa[p].start_frame
         timeq = stracksb[q].frame_id - stracksb[q].start_frame
         if timep > timeq:
-            dupb.append(q)
+            dupb.add(q)
         else:
-            dupa.append(p)
-    resa = [t for i, t in enumerate(stracksa) if not i in dupa]
-    resb = [t for i, t in enumerate(stracksb) if not i in dupb]
+            dupa.add(p)
+    resa = [t for i, t in enumerate(stracksa) if i not in dupa]
+    resb = [t for i, t in enumerate(stracksb) if i not in dupb]
+    if removed is not None:
+        # 丢弃的重复轨迹与其它被移除的轨迹一样归还 track table 中的行
+        for tracks, dup in ((stracksa, dupa), (stracksb, dupb)):
+            for i in sorted(dup):
+                tracks[i].mark_removed()
+                removed.append(tracks[i])
     return resa, resb
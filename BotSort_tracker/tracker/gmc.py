@@ -1,12 +1,39 @@
 import cv2
+import json
 import matplotlib.pyplot as plt
 import numpy as np
 import copy
 import time
 
 
+def load_camera_fov(settings_path='settings/settings.json', image_type=0, default=90.):
+    """Horizontal FOV in degrees of the scene camera from the AirSim settings.json"""
+    try:
+        with open(settings_path, 'r') as f:
+            settings = json.load(f)
+    except (OSError, ValueError):
+        return default
+    for capture in settings.get('CameraDefaults', {}).get('CaptureSettings', []):
+        if capture.get('ImageType') == image_type:
+            return float(capture.get('FOV_Degrees', default))
+    return default
+
+
+def quaternion_to_rotation(w, x, y, z):
+    """Rotation matrix (body -> world) of a unit quaternion"""
+    return np.array([
+        [1 - 2 * (y * y + z * z), 2 * (x * y - w * z), 2 * (x * z + w * y)],
+        [2 * (x * y + w * z), 1 - 2 * (x * x + z * z), 2 * (y * z - w * x)],
+        [2 * (x * z - w * y), 2 * (y * z + w * x), 1 - 2 * (x * x + y * y)]])
+
+
+# AirSim camera axes (x forward, y right, z down) -> optical axes (x right, y down, z forward)
+CAMERA_TO_OPTICAL = np.array([[0., 1., 0.], [0., 0., 1.], [1., 0., 0.]])
+
+
 class GMC:
-    def __init__(self, method='sparseOptFlow', downscale=2, verbose=None):
+    def __init__(self, method='sparseOptFlow', downscale=2, verbose=None, static_angular_speed=0.02, max_skip_frames=5,
+                 fov_degrees=None, settings_path='settings/settings.json', ground_z=0.):
         super(GMC, self).__init__()
 
         self.method = method
@@ -33,6 +60,30 @@ class GMC:
                                        useHarrisDetector=False, k=0.04)
             # self.gmc_file = open('GMC_results.txt', 'w')
 
+        elif self.method == 'adaptive':
+            # Sparse optical flow that keeps tracking its keypoints across frames and only
+            # re-detects them when too few survive. Estimation is skipped while the
+            # ego-motion hint (body angular velocity) says the camera is static.
+            self.feature_params = dict(maxCorners=400, qualityLevel=0.01, minDistance=8, blockSize=3,
+                                       useHarrisDetector=False, k=0.04)
+            self.lk_params = dict(winSize=(21, 21), maxLevel=3,
+                                  criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 30, 0.01))
+            self.min_keypoints = 100
+            self.static_angular_speed = static_angular_speed  # rad/s
+            # The hint does not see gimbal moves, so re-check the image at least every few frames
+            self.max_skip_frames = max_skip_frames
+            self.skipped_frames = 0
+            self.prevDetections = None
+            self.stats = dict(frames=0, skipped=0, redetected=0)
+
+        elif self.method == 'telemetry':
+            # Warp from consecutive camera poses reported by the simulator, no image registration.
+            # Translation is compensated with the homography of the ground plane z = ground_z (NED).
+            self.fov_degrees = load_camera_fov(settings_path) if fov_degrees is None else float(fov_degrees)
+            self.ground_z = ground_z
+            self.min_ground_distance = 1.0  # closer than this only the rotation is compensated
+            self.prevPose = None
+
         elif self.method == 'file' or self.method == 'files':
             seqName = verbose[0]
             ablation = verbose[1]
@@ -63,13 +114,23 @@ class GMC:
 
         self.initializedFirstFrame = False
 
-    def apply(self, raw_frame, detections=None):
+    def apply(self, raw_frame, detections=None, ego_motion=None, camera_pose=None):
+        """
+        :param ego_motion: optional hint for the 'adaptive' method, an AirSim KinematicsState
+            (e.g. UAVController.get_kinematics()) or the body angular velocity (x, y, z) in rad/s
+        :param camera_pose: camera pose of this frame for the 'telemetry' method, an AirSim Pose
+            (e.g. UAVController.get_camera_pose()) or ((x, y, z), (w, qx, qy, qz)) in NED
+        """
         if self.method == 'orb' or self.method == 'sift':
             return self.applyFeaures(raw_frame, detections)
         elif self.method == 'ecc':
             return self.applyEcc(raw_frame, detections)
         elif self.method == 'sparseOptFlow':
             return self.applySparseOptFlow(raw_frame, detections)
+        elif self.method == 'adaptive':
+            return self.applyAdaptiveOptFlow(raw_frame, detections, ego_motion)
+        elif self.method == 'telemetry':
+            return self.applyTelemetry(raw_frame, camera_pose)
         elif self.method == 'file':
             return self.applyFile(raw_frame, detections)
         elif self.method == 'none':
@@ -268,16 +329,9 @@ class GMC:
         matchedKeypoints, status, err = cv2.calcOpticalFlowPyrLK(self.prevFrame, frame, self.prevKeyPoints, None)
 
         # leave good correspondences only
-        prevPoints = []
-        currPoints = []
-
-        for i in range(len(status)):
-            if status[i]:
-                prevPoints.append(self.prevKeyPoints[i])
-                currPoints.append(matchedKeypoints[i])
-
-        prevPoints = np.array(prevPoints)
-        currPoints = np.array(currPoints)
+        good = status.ravel().astype(bool)
+        prevPoints = self.prevKeyPoints[good]
+        currPoints = matchedKeypoints[good]
 
         # Find rigid matrix
         if (np.size(prevPoints, 0) > 4) and (np.size(prevPoints, 0) == np.size(prevPoints, 0)):
@@ -302,6 +356,148 @@ class GMC:
 
         return H
 
+    @staticmethod
+    def angular_speed(ego_motion):
+        """Norm of the body angular velocity in an ego-motion hint, None without a hint"""
+        if ego_motion is None:
+            return None
+        velocity = getattr(ego_motion, 'angular_velocity', ego_motion)
+        if hasattr(velocity, 'x_val'):
+            velocity = (velocity.x_val, velocity.y_val, velocity.z_val)
+        return float(np.linalg.norm(np.asarray(velocity, dtype=np.float64)))
+
+    def backgroundMask(self, frame, detections):
+        height, width = frame.shape[:2]
+        mask = np.zeros_like(frame)
+        mask[int(0.02 * height): int(0.98 * height), int(0.02 * width): int(0.98 * width)] = 255
+        if detections is not None:
+            for det in detections:
+                tlbr = np.maximum(np.asarray(det[:4]) / self.downscale, 0).astype(np.int_)
+                mask[tlbr[1]:tlbr[3], tlbr[0]:tlbr[2]] = 0
+        return mask
+
+    def applyAdaptiveOptFlow(self, raw_frame, detections=None, ego_motion=None):
+
+        # Initialize
+        height, width, _ = raw_frame.shape
+        frame = cv2.cvtColor(raw_frame, cv2.COLOR_BGR2GRAY)
+        H = np.eye(2, 3)
+        self.stats['frames'] += 1
+
+        # Downscale image
+        if self.downscale > 1.0:
+            frame = cv2.resize(frame, (width // self.downscale, height // self.downscale))
+
+        # Handle first frame
+        if not self.initializedFirstFrame:
+            self.prevFrame = frame
+            self.prevKeyPoints = None
+            self.prevDetections = None if detections is None else np.array(detections, copy=True)
+            self.initializedFirstFrame = True
+            return H
+
+        # Camera is static: keep the previous frame and keypoints, so the next estimated
+        # warp covers all skipped frames at once
+        speed = self.angular_speed(ego_motion)
+        if speed is not None and speed < self.static_angular_speed and self.skipped_frames < self.max_skip_frames:
+            self.skipped_frames += 1
+            self.stats['skipped'] += 1
+            return H
+        self.skipped_frames = 0
+
+        # Re-detect keypoints on the previous frame (objects masked out) only when too few are left
+        if self.prevKeyPoints is None or len(self.prevKeyPoints) < self.min_keypoints:
+            self.prevKeyPoints = cv2.goodFeaturesToTrack(self.prevFrame, mask=self.backgroundMask(self.prevFrame, self.prevDetections),
+                                                         **self.feature_params)
+            self.stats['redetected'] += 1
+
+        keepPoints = None
+        if self.prevKeyPoints is not None and len(self.prevKeyPoints) > 0:
+            # find correspondences
+            matchedKeypoints, status, err = cv2.calcOpticalFlowPyrLK(self.prevFrame, frame, self.prevKeyPoints, None,
+                                                                     **self.lk_params)
+
+            # leave good correspondences inside the frame only
+            pts = matchedKeypoints.reshape(-1, 2)
+            good = status.ravel().astype(bool) & (pts[:, 0] >= 0) & (pts[:, 1] >= 0) & \
+                (pts[:, 0] < frame.shape[1]) & (pts[:, 1] < frame.shape[0])
+            prevPoints = self.prevKeyPoints[good]
+            currPoints = matchedKeypoints[good]
+            keepPoints = currPoints
+
+            # Find rigid matrix
+            if np.size(prevPoints, 0) > 4:
+                estimate, inliers = cv2.estimateAffinePartial2D(prevPoints, currPoints, cv2.RANSAC)
+                if estimate is not None:
+                    H = estimate
+                    # Points on moving objects are RANSAC outliers, do not carry them on
+                    keepPoints = currPoints[inliers.ravel().astype(bool)]
+
+                    # Handle downscale
+                    if self.downscale > 1.0:
+                        H[0, 2] *= self.downscale
+                        H[1, 2] *= self.downscale
+            else:
+                print('Warning: not enough matching points')
+
+        # Store to next iteration
+        self.prevFrame = frame
+        self.prevKeyPoints = keepPoints
+        self.prevDetections = None if detections is None else np.array(detections, copy=True)
+
+        return H
+
+    @staticmethod
+    def pose_to_matrix(camera_pose):
+        """(camera center, camera -> world rotation) of a camera pose"""
+        if hasattr(camera_pose, 'position'):
+            p, q = camera_pose.position, camera_pose.orientation
+            return np.array([p.x_val, p.y_val, p.z_val]), quaternion_to_rotation(q.w_val, q.x_val, q.y_val, q.z_val)
+        position, orientation = camera_pose
+        return np.asarray(position, dtype=np.float64), quaternion_to_rotation(*orientation)
+
+    def telemetryHomography(self, prevPose, currPose, width, height):
+        """3x3 image homography from the previous to the current camera pose"""
+        C1, R1 = self.pose_to_matrix(prevPose)
+        C2, R2 = self.pose_to_matrix(currPose)
+
+        # camera 1 -> camera 2 (AirSim camera axes): X2 = R X1 + t
+        R = R2.T @ R1
+        t = R2.T @ (C1 - C2)
+        M = R
+
+        # ground plane n^T X1 = d in camera 1, n is the world down axis
+        n = R1.T @ np.array([0., 0., 1.])
+        d = self.ground_z - C1[2]
+        if d > self.min_ground_distance:
+            M = M + np.outer(t, n) / d
+
+        f = width / 2. / np.tan(np.radians(self.fov_degrees) / 2.)
+        K = np.array([[f, 0., width / 2.], [0., f, height / 2.], [0., 0., 1.]])
+        H = K @ CAMERA_TO_OPTICAL @ M @ CAMERA_TO_OPTICAL.T @ np.linalg.inv(K)
+        return H / H[2, 2]
+
+    def applyTelemetry(self, raw_frame, camera_pose=None):
+        """
+        Returns the 3x3 ground-plane homography between the previous and this frame
+        (identity 2x3 for the first frame or without a pose). A single affine cannot
+        follow the perspective of a pitched-down camera, the tracker linearizes the
+        homography at each track instead.
+        """
+        height, width = raw_frame.shape[:2]
+        H = np.eye(2, 3)
+
+        if camera_pose is None:
+            # no telemetry for this frame, start over from the next one
+            self.prevPose = None
+            return H
+
+        if self.prevPose is not None:
+            H = self.telemetryHomography(self.prevPose, camera_pose, width, height)
+
+        self.prevPose = camera_pose
+        return H
+
     def applyFile(self, raw_frame, detections=None):
         line = self.gmcFile.readline()
         tokens = line.split("\t")
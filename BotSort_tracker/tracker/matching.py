@@ -1,10 +1,10 @@
 import numpy as np
 import scipy
-import lap
 from scipy.spatial.distance import cdist
 
-from cython_bbox import bbox_overlaps as bbox_ious
 from ByteTrack_tracker import kalman_filter
+# IoU / assignment backends (cython_bbox and lap when installed, NumPy / SciPy otherwise)
+from ByteTrack_tracker.matching import IOU_BACKEND, ASSIGNMENT_BACKEND, linear_assignment, ious, tlbrs
 
 
 def merge_matches(m1, m2, shape):
@@ -35,40 +35,6 @@ def _indices_to_matches(cost_matrix, indices, thresh):
     return matches, unmatched_a, unmatched_b
 
 
-def linear_assignment(cost_matrix, thresh):
-    if cost_matrix.size == 0:
-        return np.empty((0, 2), dtype=int), tuple(range(cost_matrix.shape[0])), tuple(range(cost_matrix.shape[1]))
-    matches, unmatched_a, unmatched_b = [], [], []
-    cost, x, y = lap.lapjv(cost_matrix, extend_cost=True, cost_limit=thresh)
-    for ix, mx in enumerate(x):
-        if mx >= 0:
-            matches.append([ix, mx])
-    unmatched_a = np.where(x < 0)[0]
-    unmatched_b = np.where(y < 0)[0]
-    matches = np.asarray(matches)
-    return matches, unmatched_a, unmatched_b
-
-
-def ious(atlbrs, btlbrs):
-    """
-    Compute cost based on IoU
-    :type atlbrs: list[tlbr] | np.ndarray
-    :type atlbrs: list[tlbr] | np.ndarray
-
-    :rtype ious np.ndarray
-    """
-    ious = np.zeros((len(atlbrs), len(btlbrs)), dtype=np.float64)
-    if ious.size == 0:
-        return ious
-
-    ious = bbox_ious(
-        np.ascontiguousarray(atlbrs, dtype=np.float64),
-        np.ascontiguousarray(btlbrs, dtype=np.float64)
-    )
-
-    return ious
-
-
 def tlbr_expand(tlbr, scale=1.2):
     w = tlbr[2] - tlbr[0]
     h = tlbr[3] - tlbr[1]
@@ -92,13 +58,7 @@ def iou_distance(atracks, btracks):
     :rtype cost_matrix np.ndarray
     """
 
-    if (len(atracks)>0 and isinstance(atracks[0], np.ndarray)) or (len(btracks) > 0 and isinstance(btracks[0], np.ndarray)):
-        atlbrs = atracks
-        btlbrs = btracks
-    else:
-        atlbrs = [track.tlbr for track in atracks]
-        btlbrs = [track.tlbr for track in btracks]
-    _ious = ious(atlbrs, btlbrs)
+    _ious = ious(tlbrs(atracks), tlbrs(btracks))
     cost_matrix = 1 - _ious
 
     return cost_matrix
@@ -143,6 +103,26 @@ def embedding_distance(tracks, detections, metric='cosine'):
     return cost_matrix
 
 
+def multi_gating_distance(kf, tracks, measurements, only_position=False, metric='maha'):
+    """
+    Squared Mahalanobis (or Euclidean) distance of every track to every measurement, one batched
+    Cholesky solve instead of a gating_distance call per track
+    :return: [len(tracks), len(measurements)] distances
+    """
+    _, _, mean, covariance = tracks[0].gather_state(tracks)
+    mean, covariance = kf.multi_project(mean, covariance)
+    if only_position:
+        mean, covariance = mean[:, :2], covariance[:, :2, :2]
+        measurements = measurements[:, :2]
+
+    d = measurements[None, :, :] - mean[:, None, :]
+    if metric == 'gaussian':
+        return np.sum(d * d, axis=2)
+    cholesky_factor = np.linalg.cholesky(covariance)
+    z = np.linalg.solve(cholesky_factor, d.transpose(0, 2, 1))
+    return np.sum(z * z, axis=1)
+
+
 def gate_cost_matrix(kf, cost_matrix, tracks, detections, only_position=False):
     if cost_matrix.size == 0:
         return cost_matrix
@@ -150,10 +130,8 @@ def gate_cost_matrix(kf, cost_matrix, tracks, detections, only_position=False):
     gating_threshold = kalman_filter.chi2inv95[gating_dim]
     # measurements = np.asarray([det.to_xyah() for det in detections])
     measurements = np.asarray([det.to_xywh() for det in detections])
-    for row, track in enumerate(tracks):
-        gating_distance = kf.gating_distance(
-            track.mean, track.covariance, measurements, only_position)
-        cost_matrix[row, gating_distance > gating_threshold] = np.inf
+    gating_distance = multi_gating_distance(kf, tracks, measurements, only_position)
+    cost_matrix[gating_distance > gating_threshold] = np.inf
     return cost_matrix
 
 
@@ -164,11 +142,9 @@ def fuse_motion(kf, cost_matrix, tracks, detections, only_position=False, lambda
     gating_threshold = kalman_filter.chi2inv95[gating_dim]
     # measurements = np.asarray([det.to_xyah() for det in detections])
     measurements = np.asarray([det.to_xywh() for det in detections])
-    for row, track in enumerate(tracks):
-        gating_distance = kf.gating_distance(
-            track.mean, track.covariance, measurements, only_position, metric='maha')
-        cost_matrix[row, gating_distance > gating_threshold] = np.inf
-        cost_matrix[row] = lambda_ * cost_matrix[row] + (1 - lambda_) * gating_distance
+    gating_distance = multi_gating_distance(kf, tracks, measurements, only_position, metric='maha')
+    cost_matrix[gating_distance > gating_threshold] = np.inf
+    cost_matrix = lambda_ * cost_matrix + (1 - lambda_) * gating_distance
     return cost_matrix
 
 
@@ -191,7 +167,153 @@ def fuse_score(cost_matrix, detections):
         return cost_matrix
     iou_sim = 1 - cost_matrix
     det_scores = np.array([det.score for det in detections])
-    det_scores = np.expand_dims(det_scores, axis=0).repeat(cost_matrix.shape[0], axis=0)
-    fuse_sim = iou_sim * det_scores
+    fuse_sim = iou_sim * det_scores[None, :]
     fuse_cost = 1 - fuse_sim
-    return fuse_cost
\ No newline at end of file
+    return fuse_cost
+
+
+def fuse_appearance(cost, iou_cost, emb_cost, proximity_thresh, appearance_thresh):
+    """
+    BoT-SORT IoU-ReID fusion, elementwise on a matrix or on pair arrays: the appearance
+    distance only counts for close pairs (IoU cost <= proximity_thresh) with similar
+    appearance, and the lower of the two costs is used.
+    """
+    emb_cost = np.where((emb_cost > appearance_thresh) | (iou_cost > proximity_thresh), 1.0, emb_cost)
+    return np.minimum(cost, emb_cost)
+
+
+# ---------------- Sparse, spatially gated association ----------------
+# Boxes that do not overlap have IoU 0, i.e. cost 1, and can never be matched below
+# the association thresholds. Only overlapping pairs are generated and scored.
+
+def candidate_pairs(atlbrs, btlbrs):
+    """
+    Overlapping (a, b) box pairs, found with an interval index on the left edges of b
+    (sort + searchsorted), O((N + M) log M + K) for K candidate pairs
+    :return: (rows, cols) index arrays, sorted by row
+    """
+    a = np.asarray(atlbrs, dtype=np.float64).reshape(-1, 4)
+    b = np.asarray(btlbrs, dtype=np.float64).reshape(-1, 4)
+    if len(a) == 0 or len(b) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    # +1 keeps the pixel-inclusive overlap test of the IoU (boxes 1px apart still touch)
+    order = np.argsort(b[:, 0], kind='stable')
+    left = b[order, 0]
+    max_width = np.max(b[:, 2] - b[:, 0])
+    lo = np.searchsorted(left, a[:, 0] - max_width - 1, side='left')
+    hi = np.searchsorted(left, a[:, 2] + 1, side='right')
+
+    counts = np.maximum(hi - lo, 0)
+    rows = np.repeat(np.arange(len(a)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    cols = order[np.repeat(lo, counts) + offsets]
+
+    overlap = (np.minimum(a[rows, 2], b[cols, 2]) - np.maximum(a[rows, 0], b[cols, 0]) + 1 > 0) & \
+              (np.minimum(a[rows, 3], b[cols, 3]) - np.maximum(a[rows, 1], b[cols, 1]) + 1 > 0)
+    return rows[overlap], cols[overlap]
+
+
+def pair_ious(atlbrs, btlbrs, rows, cols):
+    """IoU of the listed pairs only, same +1 pixel convention as ious()"""
+    a = np.asarray(atlbrs, dtype=np.float64).reshape(-1, 4)[rows]
+    b = np.asarray(btlbrs, dtype=np.float64).reshape(-1, 4)[cols]
+    area_a = (a[:, 2] - a[:, 0] + 1) * (a[:, 3] - a[:, 1] + 1)
+    area_b = (b[:, 2] - b[:, 0] + 1) * (b[:, 3] - b[:, 1] + 1)
+    iw = np.maximum(np.minimum(a[:, 2], b[:, 2]) - np.maximum(a[:, 0], b[:, 0]) + 1, 0)
+    ih = np.maximum(np.minimum(a[:, 3], b[:, 3]) - np.maximum(a[:, 1], b[:, 1]) + 1, 0)
+    inter = iw * ih
+    return inter / (area_a + area_b - inter)
+
+
+def pair_gating_distance(kf, tracks, measurements, rows, cols, only_position=False):
+    """Squared Mahalanobis distance of the listed (track, measurement) pairs, batched"""
+    _, _, mean, covariance = tracks[0].gather_state(tracks)
+    mean, covariance = kf.multi_project(mean, covariance)
+    if only_position:
+        mean, covariance = mean[:, :2], covariance[:, :2, :2]
+        measurements = measurements[:, :2]
+
+    cholesky_factor = np.linalg.cholesky(covariance)
+    d = measurements[cols] - mean[rows]
+    z = np.linalg.solve(cholesky_factor[rows], d[:, :, None])[:, :, 0]
+    return np.sum(z * z, axis=1)
+
+
+def sparse_linear_assignment(rows, cols, costs, shape, thresh):
+    """
+    linear_assignment for a sparse cost matrix given as (rows, cols, costs), missing pairs
+    can not be matched. Pairs whose track and detection have no other candidate are matched
+    directly, only the remaining (crowded) part goes to the dense solver.
+    :return: matches [K,2] sorted by row, unmatched rows, unmatched cols
+    """
+    n, m = shape
+    keep = costs < thresh
+    rows, cols, costs = rows[keep], cols[keep], costs[keep]
+
+    single = (np.bincount(rows, minlength=n)[rows] == 1) & (np.bincount(cols, minlength=m)[cols] == 1)
+    matches = np.stack([rows[single], cols[single]], axis=1)
+
+    if not single.all():
+        r_ids, r_pos = np.unique(rows[~single], return_inverse=True)
+        c_ids, c_pos = np.unique(cols[~single], return_inverse=True)
+        dense = np.full((len(r_ids), len(c_ids)), thresh + 1.)
+        dense[r_pos, c_pos] = costs[~single]
+        sub_matches, _, _ = linear_assignment(dense, thresh)
+        sub_matches = np.asarray(sub_matches, dtype=int).reshape(-1, 2)
+        matches = np.concatenate([matches, np.stack([r_ids[sub_matches[:, 0]], c_ids[sub_matches[:, 1]]], axis=1)])
+        matches = matches[np.argsort(matches[:, 0], kind='stable')]
+
+    unmatched_a = np.ones(n, dtype=bool)
+    unmatched_a[matches[:, 0]] = False
+    unmatched_b = np.ones(m, dtype=bool)
+    unmatched_b[matches[:, 1]] = False
+    return matches, np.flatnonzero(unmatched_a), np.flatnonzero(unmatched_b)
+
+
+def sparse_iou_assignment(tracks, detections, thresh, fuse_det_score=False, kf=None, only_position=False,
+                          features=None, proximity_thresh=0.5, appearance_thresh=0.25, dense_limit=100 * 100):
+    """
+    IoU association on overlapping pairs only, equivalent to
+    linear_assignment(iou_distance (+ fuse_score), thresh) on the dense matrix.
+    With a Kalman filter `kf`, pairs outside the chi2 95% Mahalanobis gate are dropped as well.
+    With `features` = (track embeddings, detection embeddings), both L2-normalized (all-zero rows
+    for tracks without one), the cost is fused with the appearance distance (fuse_appearance).
+    Below dense_limit track-detection pairs the dense matrix is cheaper and used instead.
+    """
+    n, m = len(tracks), len(detections)
+    if n == 0 or m == 0:
+        return np.empty((0, 2), dtype=int), np.arange(n), np.arange(m)
+
+    if n * m <= dense_limit:
+        dists = iou_distance(tracks, detections)
+        iou_dists = dists
+        if fuse_det_score:
+            dists = fuse_score(dists, detections)
+        if features is not None:
+            emb_dists = (1 - features[0] @ features[1].T) / 2.0
+            dists = fuse_appearance(dists, iou_dists, emb_dists, proximity_thresh, appearance_thresh)
+        if kf is not None:
+            dists = gate_cost_matrix(kf, dists, tracks, detections, only_position)
+        return linear_assignment(dists, thresh)
+
+    atlbrs, btlbrs = tlbrs(tracks), tlbrs(detections)
+    rows, cols = candidate_pairs(atlbrs, btlbrs)
+    costs = 1 - pair_ious(atlbrs, btlbrs, rows, cols)
+    iou_costs = costs
+    if fuse_det_score:
+        det_scores = np.array([det.score for det in detections])
+        costs = 1 - (1 - costs) * det_scores[cols]
+    if features is not None:
+        emb_costs = (1 - np.sum(features[0][rows] * features[1][cols], axis=1)) / 2.0
+        costs = fuse_appearance(costs, iou_costs, emb_costs, proximity_thresh, appearance_thresh)
+
+    if kf is not None and len(rows) > 0:
+        # detection boxes tlbr -> xywh
+        measurements = btlbrs.copy()
+        measurements[:, 2:] -= measurements[:, :2]
+        measurements[:, :2] += measurements[:, 2:] / 2
+        gating_threshold = kalman_filter.chi2inv95[2 if only_position else 4]
+        costs[pair_gating_distance(kf, tracks, measurements, rows, cols, only_position) > gating_threshold] = np.inf
+
+    return sparse_linear_assignment(rows, cols, costs, (n, m), thresh)
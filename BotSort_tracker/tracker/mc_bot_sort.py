@@ -8,7 +8,11 @@ from ByteTrack_tracker.gmc import GMC
 from ByteTrack_tracker.basetrack import BaseTrack, TrackState
 from ByteTrack_tracker.kalman_filter import KalmanFilter
 
-from fast_reid.fast_reid_interfece import FastReIDInterface
+try:
+    from fast_reid.fast_reid_interfece import FastReIDInterface
+except ImportError:
+    # fast_reid is not shipped with this project, only needed with args.with_reid
+    FastReIDInterface = None
 
 
 class STrack(BaseTrack):
@@ -17,7 +21,7 @@ class STrack(BaseTrack):
     def __init__(self, tlwh, score, cls, feat=None, feat_history=50):
 
         # wait activate
-        self._tlwh = np.asarray(tlwh, dtype=np.float)
+        self._tlwh = np.asarray(tlwh, dtype=np.float64)
         self.kalman_filter = None
         self.mean, self.covariance = None, None
         self.is_activated = False
@@ -249,6 +253,8 @@ class BoTSORT(object):
         self.appearance_thresh = args.appearance_thresh
 
         if args.with_reid:
+            if FastReIDInterface is None:
+                raise ImportError("args.with_reid requires the fast_reid package")
             self.encoder = FastReIDInterface(args.fast_reid_config, args.fast_reid_weights, args.device)
 
         self.gmc = GMC(method=args.cmc_method, verbose=[args.name, args.ablation])
@@ -0,0 +1,113 @@
+import cv2
+import numpy as np
+from collections import OrderedDict
+
+
+class AppearanceEmbedder:
+    """
+    Lightweight CPU appearance embedding for vehicle crops.
+
+    Crops of all boxes are sampled from the frame with a single cv2.remap call, then
+    described by spatial HSV color histograms (2x2 cells) and a coarse luminance layout.
+    Smoothed embeddings are cached per track id, so the embedder only has to run every
+    `interval` frames or when the IoU association is ambiguous.
+    """
+
+    def __init__(self, crop_size=(32, 32), interval=5, alpha=0.9, max_cache_size=500):
+        self.crop_h, self.crop_w = crop_size
+        self.interval = max(1, int(interval))
+        self.alpha = alpha
+        self.max_cache_size = max_cache_size
+        self.cache = OrderedDict()  # track id -> smoothed embedding
+        self.stats = dict(frames=0, runs=0, crops=0)
+
+        # Lookup tables: 8 hue x 4 saturation bins, and the 2x2 cell offset of every crop pixel
+        self._hue_bins = (np.minimum(np.arange(256) * 8 // 180, 7) * 4).astype(np.int32)
+        self._sat_bins = (np.arange(256) * 4 // 256).astype(np.int32)
+        rows = np.arange(self.crop_h) * 2 // self.crop_h
+        cols = np.arange(self.crop_w) * 2 // self.crop_w
+        self._cell_bins = ((rows[:, None] * 2 + cols[None, :]) * 32).astype(np.int32)
+
+    @property
+    def dim(self):
+        return 4 * 8 * 4 + 64
+
+    def should_run(self, frame_id, ambiguous=False):
+        """Run on every `interval`-th frame, or earlier when the motion/IoU association is ambiguous"""
+        self.stats['frames'] += 1
+        run = ambiguous or frame_id % self.interval == 0
+        if run:
+            self.stats['runs'] += 1
+        return run
+
+    def crops(self, frame, tlbrs):
+        """[N, crop_h, crop_w, 3] crops of the boxes, one remap call for the whole batch"""
+        boxes = np.asarray(tlbrs, dtype=np.float32).reshape(-1, 4)
+        height, width = frame.shape[:2]
+        x1 = np.clip(boxes[:, 0], 0, width - 1)
+        y1 = np.clip(boxes[:, 1], 0, height - 1)
+        x2 = np.clip(boxes[:, 2], x1 + 1, width)
+        y2 = np.clip(boxes[:, 3], y1 + 1, height)
+
+        # Sampling grid of every crop (pixel centers), stacked vertically into one map
+        grid_x = (np.arange(self.crop_w, dtype=np.float32) + 0.5) / self.crop_w
+        grid_y = (np.arange(self.crop_h, dtype=np.float32) + 0.5) / self.crop_h
+        xs = x1[:, None] + grid_x[None, :] * (x2 - x1)[:, None] - 0.5
+        ys = y1[:, None] + grid_y[None, :] * (y2 - y1)[:, None] - 0.5
+        map_x = np.repeat(xs, self.crop_h, axis=0)
+        map_y = np.repeat(ys.reshape(-1, 1), self.crop_w, axis=1)
+
+        batch = cv2.remap(frame, map_x, map_y, cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+        return batch.reshape(len(boxes), self.crop_h, self.crop_w, -1)
+
+    def extract(self, frame, tlbrs):
+        """[N, dim] L2-normalized embeddings of the boxes (tlbr, frame coordinates)"""
+        n = len(tlbrs)
+        if n == 0:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        self.stats['crops'] += n
+
+        batch = self.crops(frame, tlbrs)
+        hsv = cv2.cvtColor(batch.reshape(-1, self.crop_w, 3), cv2.COLOR_BGR2HSV)
+        h, s, v = cv2.split(hsv)
+
+        # Hue x saturation histogram per 2x2 cell, weighted by brightness (hue is noise in the dark)
+        bins = self._hue_bins[h] + self._sat_bins[s]
+        bins = bins.reshape(n, self.crop_h, self.crop_w) + self._cell_bins + (np.arange(n, dtype=np.int32) * 128)[:, None, None]
+        hist = np.bincount(bins.ravel(), weights=v.ravel() + 1., minlength=n * 128).reshape(n, 128)
+        hist = np.sqrt(hist / hist.sum(axis=1, keepdims=True))
+
+        # Coarse brightness layout, 8x8 block means (one area resize of the stacked crops), zero mean
+        layout = cv2.resize(v, (8, 8 * n), interpolation=cv2.INTER_AREA).reshape(n, 64).astype(np.float32)
+        layout -= layout.mean(axis=1, keepdims=True)
+        layout /= np.linalg.norm(layout, axis=1, keepdims=True) + 1e-6
+
+        features = np.concatenate([0.85 * hist, 0.5 * layout], axis=1)
+        features /= np.linalg.norm(features, axis=1, keepdims=True)
+        return features.astype(np.float32)
+
+    def update(self, track_ids, features):
+        """Blend new embeddings into the cache of the given track ids"""
+        for track_id, feat in zip(track_ids, features):
+            cached = self.cache.pop(track_id, None)
+            if cached is not None:
+                feat = self.alpha * cached + (1 - self.alpha) * feat
+                feat = feat / np.linalg.norm(feat)
+            self.cache[track_id] = feat
+        while len(self.cache) > self.max_cache_size:
+            self.cache.popitem(last=False)
+
+    def track_features(self, track_ids):
+        """([N, dim] cached embeddings, [N] mask of the ids that have one)"""
+        features = np.zeros((len(track_ids), self.dim), dtype=np.float32)
+        valid = np.zeros(len(track_ids), dtype=bool)
+        for i, track_id in enumerate(track_ids):
+            feat = self.cache.get(track_id)
+            if feat is not None:
+                features[i] = feat
+                valid[i] = True
+        return features, valid
+
+    def forget(self, track_ids):
+        for track_id in track_ids:
+            self.cache.pop(track_id, None)
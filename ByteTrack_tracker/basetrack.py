@@ -9,24 +9,170 @@ class TrackState(object):
     Removed = 3
 
 
-class BaseTrack(object):
+class TrackTable(object):
+    """
+    Struct-of-arrays storage for the live tracks of one tracker.
+
+    Every column is one contiguous array with a row per track (Kalman mean,
+    covariance, ids, scores, ages ...). Rows of removed tracks are recycled
+    through a free list, so a long tracking session does not keep allocating
+    per-track arrays.
+    """
+
+    def __init__(self, columns, capacity=64):
+        """
+        :param columns: dict name -> (row shape, dtype, fill value)
+        """
+        self.columns = columns
+        self.capacity = 0
+        self._size = 0
+        self._free = []
+        for name, (shape, dtype, fill) in columns.items():
+            setattr(self, name, np.full((0,) + shape, fill, dtype=dtype))
+        self._grow(capacity)
+
+    def _grow(self, capacity):
+        for name, (shape, dtype, fill) in self.columns.items():
+            column = np.full((capacity,) + shape, fill, dtype=dtype)
+            column[:self.capacity] = getattr(self, name)
+            setattr(self, name, column)
+        self.capacity = capacity
+
+    def allocate(self):
+        if self._free:
+            return self._free.pop()
+        if self._size == self.capacity:
+            self._grow(max(2 * self.capacity, 16))
+        self._size += 1
+        return self._size - 1
+
+    def release(self, row):
+        for name, (_, _, fill) in self.columns.items():
+            getattr(self, name)[row] = fill
+        self._free.append(row)
+
+    def __len__(self):
+        return self._size - len(self._free)
+
+
+class TableColumn(object):
+    """
+    Track attribute that lives in a TrackTable column once the track owns a row,
+    and in a private slot before that (detections) or after it (removed tracks).
+    """
+
+    def __init__(self, default=None, nullable=False):
+        self.default = default
+        self.nullable = nullable    # NaN in the table reads back as None
+
+    def __set_name__(self, owner, name):
+        self.name = name
+        self.local = '_' + name
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        table = getattr(obj, '_table', None)
+        if table is None:
+            return getattr(obj, self.local, self.default)
+        value = getattr(table, self.name)[obj._row]
+        if value.ndim == 0:
+            value = value.item()
+            if self.nullable and value != value:
+                return None
+        return value
+
+    def __set__(self, obj, value):
+        table = getattr(obj, '_table', None)
+        if table is None:
+            setattr(obj, self.local, value)
+        else:
+            getattr(table, self.name)[obj._row] = np.nan if value is None and self.nullable else value
+
+
+class TableBacked(object):
+    """Mixin for tracks whose TableColumn attributes can move into a TrackTable row"""
+    __slots__ = ()
+
+    def attach(self, table):
+        """Move the track's state into a row of the table"""
+        if getattr(self, '_table', None) is not None:
+            return
+        values = [(name, getattr(self, name)) for name in table.columns]
+        self._row = table.allocate()
+        self._table = table
+        for name, value in values:
+            if value is not None:
+                setattr(self, name, value)
+
+    def detach(self):
+        """Copy the row back into the track and give the row back to the table"""
+        table = getattr(self, '_table', None)
+        if table is None:
+            return
+        values = [(name, getattr(self, name)) for name in table.columns]
+        values = [(name, value.copy() if isinstance(value, np.ndarray) else value) for name, value in values]
+        row = self._row
+        self._table, self._row = None, None
+        table.release(row)
+        for name, value in values:
+            setattr(self, name, value)
+
+    @staticmethod
+    def table_rows(stracks):
+        """(table, row indices) if all tracks share one table, else (None, None)"""
+        if len(stracks) == 0:
+            return None, None
+        table = getattr(stracks[0], '_table', None)
+        if table is None or any(getattr(st, '_table', None) is not table for st in stracks):
+            return None, None
+        return table, np.fromiter((st._row for st in stracks), dtype=np.int64, count=len(stracks))
+
+    @staticmethod
+    def gather_state(stracks):
+        """Stack the Kalman state of the tracks -> (table, rows, Nx8 means, Nx8x8 covariances)"""
+        table, rows = TableBacked.table_rows(stracks)
+        if table is not None:
+            return table, rows, table.mean[rows], table.covariance[rows]
+        return None, None, np.asarray([st.mean for st in stracks]), np.asarray([st.covariance for st in stracks])
+
+    @staticmethod
+    def scatter_state(stracks, table, rows, mean, covariance):
+        """Write stacked Kalman state back, in one assignment when the tracks share a table"""
+        if table is not None:
+            table.mean[rows] = mean
+            table.covariance[rows] = covariance
+        else:
+            for i, st in enumerate(stracks):
+                st.mean = mean[i]
+                st.covariance = covariance[i]
+
+
+class BaseTrack(TableBacked):
+    __slots__ = ('_table', '_row', '_track_id', '_score', '_start_frame', '_frame_id', '_state',
+                 'is_activated', 'time_since_update')
+
     _count = 0
 
-    track_id = 0
-    is_activated = False
-    state = TrackState.New
+    track_id = TableColumn(0)
+    score = TableColumn(0)
+    start_frame = TableColumn(0)
+    frame_id = TableColumn(0)
+    state = TableColumn(TrackState.New)
 
     history = OrderedDict()
     features = []
     curr_feature = None
-    score = 0
-    start_frame = 0
-    frame_id = 0
-    time_since_update = 0
 
     # multi-camera
     location = (np.inf, np.inf)
 
+    def __init__(self):
+        self._table = None
+        self._row = None
+        self.is_activated = False
+        self.time_since_update = 0
+
     @property
     def end_frame(self):
         return self.frame_id
@@ -50,3 +196,4 @@ class BaseTrack(object):
 
     def mark_removed(self):
         self.state = TrackState.Removed
+        self.detach()
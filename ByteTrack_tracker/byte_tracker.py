@@ -8,21 +8,47 @@ import torch.nn.functional as F
 
 from .kalman_filter import KalmanFilter
 from ByteTrack_tracker import matching
-from .basetrack import BaseTrack, TrackState
+from .basetrack import BaseTrack, TrackState, TableColumn, TrackTable
 
 class STrack(BaseTrack):
+    __slots__ = ('_tlwh', 'kalman_filter', '_mean', '_covariance', '_cls', '_tracklet_len')
+
     shared_kalman = KalmanFilter()
-    def __init__(self, tlwh, score):
+
+    # 激活后存放在跟踪器的 TrackTable 中
+    mean = TableColumn()
+    covariance = TableColumn()
+    cls = TableColumn(nullable=True)
+    tracklet_len = TableColumn(0)
+
+    def __init__(self, tlwh, score, cls=None):
+        super(STrack, self).__init__()
 
         # wait activate
-        self._tlwh = np.asarray(tlwh, dtype=np.float)
+        self._tlwh = np.asarray(tlwh, dtype=np.float64)
         self.kalman_filter = None
         self.mean, self.covariance = None, None
         self.is_activated = False
 
         self.score = score
+        self.cls = cls  # 类别，检测结果不带类别时为 None
         self.tracklet_len = 0
 
+    @staticmethod
+    def make_table(capacity=64):
+        """Track table holding the state of all activated tracks of one tracker"""
+        return TrackTable({
+            'mean': ((8,), np.float64, np.nan),
+            'covariance': ((8, 8), np.float64, np.nan),
+            'track_id': ((), np.int64, 0),
+            'score': ((), np.float64, 0),
+            'cls': ((), np.float64, np.nan),
+            'start_frame': ((), np.int64, 0),
+            'frame_id': ((), np.int64, 0),
+            'tracklet_len': ((), np.int64, 0),
+            'state': ((), np.int8, TrackState.New),
+        }, capacity)
+
     def predict(self):
         mean_state = self.mean.copy()
         if self.state != TrackState.Tracked:
@@ -32,18 +58,17 @@ class STrack(BaseTrack):
     @staticmethod
     def multi_predict(stracks):
         if len(stracks) > 0:
-            multi_mean = np.asarray([st.mean.copy() for st in stracks])
-            multi_covariance = np.asarray([st.covariance for st in stracks])
-            for i, st in enumerate(stracks):
-                if st.state != TrackState.Tracked:
-                    multi_mean[i][7] = 0
+            table, rows, multi_mean, multi_covariance = STrack.gather_state(stracks)
+            if table is not None:
+                not_tracked = table.state[rows] != TrackState.Tracked
+            else:
+                not_tracked = np.array([st.state != TrackState.Tracked for st in stracks])
+            multi_mean[not_tracked, 7] = 0
             multi_mean, multi_covariance = STrack.shared_kalman.multi_predict(multi_mean, multi_covariance)
-            for i, (mean, cov) in enumerate(zip(multi_mean, multi_covariance)):
-                stracks[i].mean = mean
-                stracks[i].covariance = cov
+            STrack.scatter_state(stracks, table, rows, multi_mean, multi_covariance)
 
-    def activate(self, kalman_filter, frame_id):
-        """Start a new tracklet"""
+    def activate(self, kalman_filter, frame_id, table=None):
+        """Start a new tracklet, its state moves into `table` when given"""
         self.kalman_filter = kalman_filter
         self.track_id = self.next_id()
         self.mean, self.covariance = self.kalman_filter.initiate(self.tlwh_to_xyah(self._tlwh))
@@ -55,6 +80,8 @@ class STrack(BaseTrack):
         # self.is_activated = True
         self.frame_id = frame_id
         self.start_frame = frame_id
+        if table is not None:
+            self.attach(table)
 
     def re_activate(self, new_track, frame_id, new_id=False):
         self.mean, self.covariance = self.kalman_filter.update(
@@ -100,6 +127,19 @@ class STrack(BaseTrack):
         ret[:2] -= ret[2:] / 2
         return ret
 
+    @staticmethod
+    def multi_tlbr(stracks):
+        """[N,4] tlbr boxes of the tracks, from their track table rows without per-track property calls"""
+        table, rows = STrack.table_rows(stracks)
+        if table is not None:
+            ret = table.mean[rows, :4]
+            ret[:, 2] *= ret[:, 3]
+            ret[:, :2] -= ret[:, 2:] / 2
+        else:
+            ret = np.asarray([st.tlwh for st in stracks], dtype=np.float64).reshape(-1, 4)
+        ret[:, 2:] += ret[:, :2]
+        return ret
+
     @property
     # @jit(nopython=True)
     def tlbr(self):
@@ -147,6 +187,8 @@ class BYTETracker(object):
         self.tracked_stracks = []  # type: list[STrack]
         self.lost_stracks = []  # type: list[STrack]
         self.removed_stracks = []  # type: list[STrack]
+        self.max_removed_stracks = 1000  # 只保留最近移除的轨迹，避免长时间跟踪时无限增长
+        self.track_table = STrack.make_table()
         
         self.frame_id = 0
         #self.args = args
@@ -165,14 +207,22 @@ class BYTETracker(object):
         refind_stracks = []
         lost_stracks = []
         removed_stracks = []
-        print(output_results.shape)
+        if not isinstance(output_results, np.ndarray):
+            output_results = output_results.cpu().numpy()
+        classes = None
         if output_results.shape[1] == 5:
             scores = output_results[:, 4]
-            bboxes = output_results[:, :4]
+            bboxes = output_results[:, :4].copy()
+        elif output_results.shape[1] == 6:
+            # x1y1x2y2, score, class (YOLOv7 detections)
+            scores = output_results[:, 4]
+            bboxes = output_results[:, :4].copy()
+            classes = output_results[:, 5]
         else:
-            output_results = output_results.cpu().numpy()
             scores = output_results[:, 4] * output_results[:, 5]
-            bboxes = output_results[:, :4]  # x1y1x2y2
+            bboxes = output_results[:, :4].copy()  # x1y1x2y2
+        if classes is None:
+            classes = np.full(len(scores), np.nan)
         img_h, img_w = img_info[0], img_info[1]
         scale = min(img_size[0] / float(img_h), img_size[1] / float(img_w))
         bboxes /= scale
@@ -186,11 +236,13 @@ class BYTETracker(object):
         dets = bboxes[remain_inds]
         scores_keep = scores[remain_inds]
         scores_second = scores[inds_second]
+        classes_keep = classes[remain_inds]
+        classes_second = classes[inds_second]
 
         if len(dets) > 0:
             '''Detections'''
-            detections = [STrack(STrack.tlbr_to_tlwh(tlbr), s) for
-                          (tlbr, s) in zip(dets, scores_keep)]
+            detections = [STrack(STrack.tlbr_to_tlwh(tlbr), s, c) for
+                          (tlbr, s, c) in zip(dets, scores_keep, classes_keep)]
         else:
             detections = []
 
@@ -226,8 +278,8 @@ class BYTETracker(object):
         # association the untrack to the low score detections
         if len(dets_second) > 0:
             '''Detections'''
-            detections_second = [STrack(STrack.tlbr_to_tlwh(tlbr), s) for
-                          (tlbr, s) in zip(dets_second, scores_second)]
+            detections_second = [STrack(STrack.tlbr_to_tlwh(tlbr), s, c) for
+                          (tlbr, s, c) in zip(dets_second, scores_second, classes_second)]
         else:
             detections_second = []
         r_tracked_stracks = [strack_pool[i] for i in u_track if strack_pool[i].state == TrackState.Tracked]
@@ -268,7 +320,7 @@ class BYTETracker(object):
             track = detections[inew]
             if track.score < self.det_thresh:
                 continue
-            track.activate(self.kalman_filter, self.frame_id)
+            track.activate(self.kalman_filter, self.frame_id, self.track_table)
             activated_starcks.append(track)
         """ Step 5: Update state"""
         for track in self.lost_stracks:
@@ -284,50 +336,68 @@ class BYTETracker(object):
         self.lost_stracks = sub_stracks(self.lost_stracks, self.tracked_stracks)
         self.lost_stracks.extend(lost_stracks)
         self.lost_stracks = sub_stracks(self.lost_stracks, self.removed_stracks)
+        self.tracked_stracks, self.lost_stracks = remove_duplicate_stracks(self.tracked_stracks, self.lost_stracks,
+                                                                           removed_stracks)
         self.removed_stracks.extend(removed_stracks)
-        self.tracked_stracks, self.lost_stracks = remove_duplicate_stracks(self.tracked_stracks, self.lost_stracks)
+        if len(self.removed_stracks) > self.max_removed_stracks:
+            del self.removed_stracks[:-self.max_removed_stracks]
         # get scores of lost tracks
         output_stracks = [track for track in self.tracked_stracks if track.is_activated]
 
         return output_stracks
 
+    def predict(self):
+        """
+        Propagate the tracks to a frame without detections (Kalman prediction only, no association).
+        Track states, ids and scores are unchanged; lost tracks keep aging.
+        """
+        self.frame_id += 1
+        tracked_stracks = [track for track in self.tracked_stracks if track.is_activated]
+        STrack.multi_predict(joint_stracks(tracked_stracks, self.lost_stracks))
+        return tracked_stracks
+
 
 def joint_stracks(tlista, tlistb):
-    exists = {}
+    exists = set()
     res = []
     for t in tlista:
-        exists[t.track_id] = 1
+        exists.add(t.track_id)
         res.append(t)
     for t in tlistb:
         tid = t.track_id
-        if not exists.get(tid, 0):
-            exists[tid] = 1
+        if tid not in exists:
+            exists.add(tid)
             res.append(t)
     return res
 
 
 def sub_stracks(tlista, tlistb):
+    removed = {t.track_id for t in tlistb}
     stracks = {}
     for t in tlista:
-        stracks[t.track_id] = t
-    for t in tlistb:
         tid = t.track_id
-        if stracks.get(tid, 0):
-            del stracks[tid]
+        if tid not in removed:
+            stracks[tid] = t
     return list(stracks.values())
 
 
-def remove_duplicate_stracks(stracksa, stracksb):
+def remove_duplicate_stracks(stracksa, stracksb, removed=None):
     pdist = matching.iou_distance(stracksa, stracksb)
     pairs = np.where(pdist < 0.15)
-    dupa, dupb = list(), list()
+    dupa, dupb = set(), set()
     for p, q in zip(*pairs):
         timep = stracksa[p].frame_id - stracksa[p].start_frame
         timeq = stracksb[q].frame_id - stracksb[q].start_frame
         if timep > timeq:
-            dupb.append(q)
+            dupb.add(q)
         else:
-            dupa.append(p)
-    resa = [t for i, t in enumerate(stracksa) if not i in dupa]
-    resb = [t for i, t in enumerate(stracksb) if not i in dupb]
+            dupa.add(p)
+    resa = [t for i, t in enumerate(stracksa) if i not in dupa]
+    resb = [t for i, t in enumerate(stracksb) if i not in dupb]
+    if removed is not None:
+        # 丢弃的重复轨迹与其它被移除的轨迹一样归还 track table 中的行
+        for tracks, dup in ((stracksa, dupa), (stracksb, dupb)):
+            for i in sorted(dup):
+                tracks[i].mark_removed()
+                removed.append(tracks[i])
     return resa, resb
@@ -1,13 +1,26 @@
 import cv2
 import numpy as np
 import scipy
-import lap
+from scipy.optimize import linear_sum_assignment
 from scipy.spatial.distance import cdist
 
-from cython_bbox import bbox_overlaps as bbox_ious
 from ByteTrack_tracker import kalman_filter
 import time
 
+# The compiled backends are faster but optional, NumPy/SciPy are used when they are not installed
+try:
+    import lap
+except ImportError:
+    lap = None
+
+try:
+    from cython_bbox import bbox_overlaps as bbox_ious
+except ImportError:
+    bbox_ious = None
+
+IOU_BACKEND = 'cython_bbox' if bbox_ious is not None else 'numpy'
+ASSIGNMENT_BACKEND = 'lap' if lap is not None else 'scipy'
+
 def merge_matches(m1, m2, shape):
     O,P,Q = shape
     m1 = np.asarray(m1)
@@ -36,9 +49,11 @@ def _indices_to_matches(cost_matrix, indices, thresh):
     return matches, unmatched_a, unmatched_b
 
 
-def linear_assignment(cost_matrix, thresh):
+def linear_assignment(cost_matrix, thresh, backend=None):
     if cost_matrix.size == 0:
         return np.empty((0, 2), dtype=int), tuple(range(cost_matrix.shape[0])), tuple(range(cost_matrix.shape[1]))
+    if (backend or ASSIGNMENT_BACKEND) == 'scipy':
+        return linear_assignment_scipy(cost_matrix, thresh)
     matches, unmatched_a, unmatched_b = [], [], []
     cost, x, y = lap.lapjv(cost_matrix, extend_cost=True, cost_limit=thresh)
     for ix, mx in enumerate(x):
@@ -50,7 +65,49 @@ def linear_assignment(cost_matrix, thresh):
     return matches, unmatched_a, unmatched_b
 
 
-def ious(atlbrs, btlbrs):
+def linear_assignment_scipy(cost_matrix, thresh):
+    """
+    Same problem as lap.lapjv(extend_cost=True, cost_limit=thresh): every row and column
+    may stay unmatched at a cost of thresh / 2, solved with scipy's linear_sum_assignment
+    """
+    n, m = cost_matrix.shape
+    # a pair costing thresh or more is never better than leaving both unmatched
+    candidates = cost_matrix < thresh
+    rows_a = np.flatnonzero(candidates.any(axis=1))
+    cols_b = np.flatnonzero(candidates.any(axis=0))
+    cost = cost_matrix[np.ix_(rows_a, cols_b)]
+    k, l = cost.shape
+
+    big = 1e6
+    extended = np.full((k + l, l + k), big)
+    extended[:k, :l] = np.where(cost < thresh, cost, big)
+    extended[np.arange(k), l + np.arange(k)] = thresh / 2.
+    extended[k + np.arange(l), np.arange(l)] = thresh / 2.
+    extended[k:, l:] = 0
+    rows, cols = linear_sum_assignment(extended)
+
+    matched = (rows < k) & (cols < l)
+    matches = np.stack([rows_a[rows[matched]], cols_b[cols[matched]]], axis=1)
+    unmatched_a = np.setdiff1d(np.arange(n), matches[:, 0])
+    unmatched_b = np.setdiff1d(np.arange(m), matches[:, 1])
+    return matches, unmatched_a, unmatched_b
+
+
+def bbox_ious_numpy(atlbrs, btlbrs):
+    """Broadcasting IoU of two [N,4] / [M,4] tlbr arrays, same +1 pixel convention as cython_bbox"""
+    a = np.asarray(atlbrs, dtype=np.float64).reshape(-1, 4)
+    b = np.asarray(btlbrs, dtype=np.float64).reshape(-1, 4)
+    area_a = (a[:, 2] - a[:, 0] + 1) * (a[:, 3] - a[:, 1] + 1)
+    area_b = (b[:, 2] - b[:, 0] + 1) * (b[:, 3] - b[:, 1] + 1)
+    iw = np.minimum(a[:, None, 2], b[None, :, 2]) - np.maximum(a[:, None, 0], b[None, :, 0]) + 1
+    ih = np.minimum(a[:, None, 3], b[None, :, 3]) - np.maximum(a[:, None, 1], b[None, :, 1]) + 1
+    np.maximum(iw, 0, out=iw)
+    np.maximum(ih, 0, out=ih)
+    inter = iw * ih
+    return inter / (area_a[:, None] + area_b[None, :] - inter)
+
+
+def ious(atlbrs, btlbrs, backend=None):
     """
     Compute cost based on IoU
     :type atlbrs: list[tlbr] | np.ndarray
@@ -58,18 +115,32 @@ def ious(atlbrs, btlbrs):
 
     :rtype ious np.ndarray
     """
-    ious = np.zeros((len(atlbrs), len(btlbrs)), dtype=np.float)
+    ious = np.zeros((len(atlbrs), len(btlbrs)), dtype=np.float64)
     if ious.size == 0:
         return ious
 
+    if (backend or IOU_BACKEND) == 'numpy':
+        return bbox_ious_numpy(atlbrs, btlbrs)
+
     ious = bbox_ious(
-        np.ascontiguousarray(atlbrs, dtype=np.float),
-        np.ascontiguousarray(btlbrs, dtype=np.float)
+        np.ascontiguousarray(atlbrs, dtype=np.float64),
+        np.ascontiguousarray(btlbrs, dtype=np.float64)
     )
 
     return ious
 
 
+def tlbrs(tracks):
+    """[N,4] tlbr boxes of a track list, read from the track table in one go when the tracks have one"""
+    if isinstance(tracks, np.ndarray):
+        return tracks
+    if len(tracks) > 0 and isinstance(tracks[0], np.ndarray):
+        return np.asarray(tracks)
+    if len(tracks) > 0 and hasattr(tracks[0], 'multi_tlbr'):
+        return tracks[0].multi_tlbr(tracks)
+    return np.asarray([track.tlbr for track in tracks], dtype=np.float64).reshape(-1, 4)
+
+
 def iou_distance(atracks, btracks):
     """
     Compute cost based on IoU
@@ -79,13 +150,7 @@ def iou_distance(atracks, btracks):
     :rtype cost_matrix np.ndarray
     """
 
-    if (len(atracks)>0 and isinstance(atracks[0], np.ndarray)) or (len(btracks) > 0 and isinstance(btracks[0], np.ndarray)):
-        atlbrs = atracks
-        btlbrs = btracks
-    else:
-        atlbrs = [track.tlbr for track in atracks]
-        btlbrs = [track.tlbr for track in btracks]
-    _ious = ious(atlbrs, btlbrs)
+    _ious = ious(tlbrs(atracks), tlbrs(btracks))
     cost_matrix = 1 - _ious
 
     return cost_matrix
@@ -118,13 +183,13 @@ def embedding_distance(tracks, detections, metric='cosine'):
     :return: cost_matrix np.ndarray
     """
 
-    cost_matrix = np.zeros((len(tracks), len(detections)), dtype=np.float)
+    cost_matrix = np.zeros((len(tracks), len(detections)), dtype=np.float64)
     if cost_matrix.size == 0:
         return cost_matrix
-    det_features = np.asarray([track.curr_feat for track in detections], dtype=np.float)
+    det_features = np.asarray([track.curr_feat for track in detections], dtype=np.float64)
     #for i, track in enumerate(tracks):
         #cost_matrix[i, :] = np.maximum(0.0, cdist(track.smooth_feat.reshape(1,-1), det_features, metric))
-    track_features = np.asarray([track.smooth_feat for track in tracks], dtype=np.float)
+    track_features = np.asarray([track.smooth_feat for track in tracks], dtype=np.float64)
     cost_matrix = np.maximum(0.0, cdist(track_features, det_features, metric))  # Nomalized features
     return cost_matrix
 
@@ -178,4 +243,38 @@ def fuse_score(cost_matrix, detections):
     det_scores = np.expand_dims(det_scores, axis=0).repeat(cost_matrix.shape[0], axis=0)
     fuse_sim = iou_sim * det_scores
     fuse_cost = 1 - fuse_sim
-    return fuse_cost
\ No newline at end of file
+    return fuse_cost
+
+def benchmark_matching(sizes=(10, 30, 100), repeats=200, thresh=0.8, seed=0):
+    """
+    Time the available IoU and assignment backends on random boxes (N tracks x N detections)
+    返回: 每个规模一行的字典列表，时间单位为微秒
+    """
+    rng = np.random.default_rng(seed)
+    iou_backends = ['numpy'] + (['cython_bbox'] if bbox_ious is not None else [])
+    assignment_backends = ['scipy'] + (['lap'] if lap is not None else [])
+
+    rows = []
+    for n in sizes:
+        tl = rng.uniform(0, 700, (n, 2))
+        a = np.concatenate([tl, tl + rng.uniform(10, 80, (n, 2))], axis=1)
+        b = a + rng.normal(0, 5, a.shape)
+        row = {'n': n}
+        for backend in iou_backends:
+            t0 = time.perf_counter()
+            for _ in range(repeats):
+                cost = 1 - ious(a, b, backend=backend)
+            row['iou_' + backend] = (time.perf_counter() - t0) / repeats * 1e6
+        for backend in assignment_backends:
+            t0 = time.perf_counter()
+            for _ in range(repeats):
+                linear_assignment(cost, thresh, backend=backend)
+            row['assign_' + backend] = (time.perf_counter() - t0) / repeats * 1e6
+        rows.append(row)
+    return rows
+
+
+if __name__ == '__main__':
+    print('IoU backend: {}, assignment backend: {}'.format(IOU_BACKEND, ASSIGNMENT_BACKEND))
+    for row in benchmark_matching():
+        print(', '.join('{}: {:.1f}'.format(k, v) if isinstance(v, float) else '{}: {}'.format(k, v) for k, v in row.items()))
@@ -1,5 +1,6 @@
 # 无人机的目标检测代码
 from utils.UAV_navigater import *
+from utils.frame_capture import FrameCapture
 
 
 # 无人机的工作类
@@ -11,13 +12,16 @@ class UAV(Navigator):
         self.__default_work_mode = 'normal'  # ['normal', 'detect', 'track'] # 工作模式
         self.__work_mode = None                            # 当前工作模式
         self.__started = False                             # 是否开始UAV
+        self.__capture = FrameCapture(self.get_origin_frame)  # 异步采集线程，工作循环只处理最新的帧
 
     # 工作函数
     def __work(self):
         self.__work_mode = self.__default_work_mode
 
         while self.__started:
-            origin_frame = self.get_origin_frame()
+            origin_frame = self.__capture.get_latest_frame()
+            if origin_frame is None:
+                continue
 
             if self.__work_mode == 'normal':
                 self.set_move_flag(True)
@@ -43,12 +47,14 @@ class UAV(Navigator):
         self.land()
         # 停止工作
         self.__started = False
+        self.__capture.stop()
 
     # 无人机开始工作函数
     def start(self):
         if self.is_connected():
             if not self.__started:
                 self.__started = True
+                self.__capture.start()
                 work_thread = threading.Thread(target=self.__work)  # 让另一个线程执行，无人机的工作函数
                 work_thread.start()
             else:
@@ -67,6 +73,10 @@ class UAV(Navigator):
     # 获取无人机是否正在工作的状态
     def is_started(self):
         return self.__started
+
+    # 获取采集线程的统计信息（帧龄、丢帧数等）
+    def get_capture_stats(self):
+        return self.__capture.get_stats()
     
     # 设置无人机的默认工作模式
     def set_default_work_mode(self, work_mode):
@@ -11,9 +11,10 @@ import asyncio
 from utils.CommandDecorator import command,CommandType
 from utils.utils import vis,run_bat_file,restart_UE
 from utils.map_controller import MapController
-import xml.etree.ElementTree as ET
+from utils.telemetry import TelemetrySampler
+from utils.capture import CaptureService
+from utils.flight_log import FlightLogWriter, FLIGHT_LOG_SUFFIX, entries_to_xml, export_flight_log_xml, flight_log_entries
 from datetime import datetime
-from xml.dom.minidom import parseString
 from PyQt5.QtCore import QObject, pyqtSignal
 
 
@@ -46,13 +47,26 @@ class UAVController:
         self.__FOV_degree = 90.             # 水平视场角
         self.__frame = np.array([0])                       # 存储无人机当前图像
         self.__last_controlled_time = 0      # 上一次控制无人机的时间
-        self.__lock = threading.Lock()
+        # 图像与控制两个客户端各自加锁，大图像请求不会阻塞状态查询与控制指令
+        self.__image_lock = threading.Lock()
+        self.__control_lock = threading.Lock()
+        self.__capture_service = None       # 多模态拍照服务
+
+        # 状态快照，同一个周期内的多个查询共用一次RPC
+        # kinematics: getMultirotorState 的 kinematics_estimated；camera: simGetCameraInfo 的相机位姿
+        self.__snapshots = {"kinematics": (None, 0.), "camera": (None, 0.)}   # 名称 -> (数据, 获取时间)
+        self.__snapshot_max_age = 0.02       # 快照最大有效时间（秒）
+        self.__snapshot_lock = threading.Lock()
+        self.__snapshot_requests = {"kinematics": 0, "camera": 0}           # getter 查询次数
+        self.__snapshot_rpcs = {"kinematics": 0, "camera": 0}               # 实际发出的RPC次数
         self.map_controller = MapController()
         self.move_flag = True
 
-        # 记录功能
+        # 记录功能：记录、监控等都订阅同一个遥测采样线程，每个节拍只查询一次状态
+        self.__telemetry = TelemetrySampler(self.__sample_telemetry)
         self.__recording = False  # 控制记录状态
-        self.__log_data = []  # 存储记录的数据
+        self.__log_path = None  # 记录文件路径
+        self.__log_writer = None  # 飞行中逐条写入记录文件
         self.__recording_interval = 0.2  # 记录间隔（秒）
         
         self.__monitoring = False  # 控制记录状态
@@ -214,6 +228,13 @@ class UAVController:
                 print(f"发生 RuntimeError: {e}")
             except Exception as e:
                 print(f"发生其他异常: {e}")
+            # 结束记录（关闭记录文件），之后可以重新 start_logging / start_monitoring
+            self.stop_logging()
+            self.__monitoring = False
+            self.__telemetry.stop()
+            if self.__capture_service is not None:
+                self.__capture_service.close()
+                self.__capture_service = None
     
     # 无人机停止工作函数
     def stop(self):
@@ -233,9 +254,8 @@ class UAVController:
 
     # 起飞
     def take_off(self):
-        self.__lock.acquire()
-        self.__control_client.takeoffAsync(vehicle_name=self.__name)
-        self.__lock.release()
+        with self.__control_lock:
+            self.__control_client.takeoffAsync(vehicle_name=self.__name)
 
     # 异步降落
     def land_async(self):
@@ -244,9 +264,8 @@ class UAVController:
 
     # 降落
     def land(self):
-        self.__lock.acquire()
-        self.__control_client.landAsync(vehicle_name=self.__name)
-        self.__lock.release()
+        with self.__control_lock:
+            self.__control_client.landAsync(vehicle_name=self.__name)
 
     # 异步悬停
     def hover_async(self):
@@ -255,90 +274,115 @@ class UAVController:
 
     # 悬停
     def hover(self):
-        self.__lock.acquire()
-        self.__control_client.moveByVelocityAsync(0, 0, 0, self.__instruction_duration, vehicle_name=self.__name)
-        self.__lock.release()
+        with self.__control_lock:
+            self.__control_client.moveByVelocityAsync(0, 0, 0, self.__instruction_duration, vehicle_name=self.__name)
 
     # 设置每条指令执行时间
     def set_instruction_duration(self, instruction_duration):
         self.__instruction_duration = instruction_duration
 
-    def get_all_frame(self):
-        frame_dict = {}
-
-        # 构造请求列表
-        image_requests = [
-            airsim.ImageRequest(0, airsim.ImageType.__dict__[capture_type], pixels_as_float=False, compress=False)
-            for capture_type in self.__capture_type
-        ]
+    # 多模态拍照服务，第一次使用时创建
+    def __get_capture_service(self):
+        if self.__capture_service is None:
+            self.__capture_service = CaptureService(self.__image_client, self.__image_lock, self.__name)
+        self.__capture_service.vehicle_name = self.__name
+        return self.__capture_service
 
-        # 批量获取图像
-        with self.__lock:
-            responses = self.__image_client.simGetImages(image_requests, vehicle_name=self.__name)
-
-        # 解压并解析响应
-        for i, response in enumerate(responses):
-            capture_type = self.__capture_type[i]
-            # 解压缩图像
-            frame = np.frombuffer(response.image_data_uint8, dtype=np.uint8).reshape(response.height, response.width, 3)
-            frame_dict[capture_type] = frame
+    def get_all_frame(self):
+        """ 一次请求获取所有捕获类型的图像: {图像类型: 图像}，深度类图像为 [h, w] float32 """
+        return self.__get_capture_service().fetch(self.__capture_type)
 
-        return frame_dict
+    def capture_all_async(self, callback=None):
+        """ 拍照并在后台保存所有捕获类型的图像到 data/capture_imgs，立即返回，不阻塞界面
+            callback(paths): 全部保存后调用，paths 为 {图像类型: 文件路径}
+        """
+        return self.__get_capture_service().capture_async(self.__capture_type, callback)
 
+    # 拍照统计：RPC、解码、写盘耗时与写盘队列长度
+    def get_capture_stats(self):
+        return self.__get_capture_service().get_stats()
 
-    
     # 获取无人机图像
     def get_origin_frame(self):
 
-        self.__lock.acquire()
-        responses = self.__image_client.simGetImages(
-            [airsim.ImageRequest(0, airsim.ImageType.Scene, pixels_as_float=False, compress=False)])
+        with self.__image_lock:
+            responses = self.__image_client.simGetImages(
+                [airsim.ImageRequest(0, airsim.ImageType.Scene, pixels_as_float=False, compress=False)])
         frame_1d = np.frombuffer(responses[0].image_data_uint8, dtype=np.uint8)
-        self.__lock.release()
 
         origin_frame = frame_1d.reshape(responses[0].height, responses[0].width, 3)
         return origin_frame
     
+    # 获取状态快照，超过 max_age 秒才重新向仿真器查询
+    def __get_snapshot(self, name, fetch, max_age=None):
+        if max_age is None:
+            max_age = self.__snapshot_max_age
+        with self.__snapshot_lock:
+            self.__snapshot_requests[name] += 1
+            data, timestamp = self.__snapshots[name]
+            if data is None or time.time() - timestamp > max_age:
+                with self.__control_lock:
+                    data = fetch()
+                self.__snapshot_rpcs[name] += 1
+                self.__snapshots[name] = (data, time.time())
+            return data
+
+    # 获取无人机运动学状态快照
+    def get_kinematics(self, max_age=None):
+        return self.__get_snapshot(
+            "kinematics", lambda: self.__control_client.getMultirotorState(self.__name).kinematics_estimated, max_age)
+
+    # 获取无人机相机位姿快照
+    def get_camera_pose(self, max_age=None):
+        return self.__get_snapshot(
+            "camera", lambda: self.__control_client.simGetCameraInfo(0, vehicle_name=self.__name).pose, max_age)
+
+    # 使快照失效，下一次查询会重新获取（如直接设置了位姿之后），name 为空时全部失效
+    def invalidate_state_snapshot(self, name=None):
+        with self.__snapshot_lock:
+            for key in self.__snapshots:
+                if name is None or key == name:
+                    self.__snapshots[key] = (None, 0.)
+
+    # 设置状态快照的最大有效时间
+    def set_snapshot_max_age(self, max_age):
+        self.__snapshot_max_age = max_age
+
+    def get_snapshot_max_age(self):
+        return self.__snapshot_max_age
+
+    # 获取状态查询的RPC统计：查询次数、实际RPC次数、节省的RPC次数
+    def get_rpc_stats(self):
+        with self.__snapshot_lock:
+            return {name: {"requests": self.__snapshot_requests[name],
+                           "rpcs": self.__snapshot_rpcs[name],
+                           "saved": self.__snapshot_requests[name] - self.__snapshot_rpcs[name]}
+                    for name in self.__snapshots}
+
     # 获取无人机姿态角
     def get_body_eularian_angle(self):
-        self.__lock.acquire()
-        state = self.__control_client.getMultirotorState(self.__name)
-        self.__lock.release()
-
-        orientation = state.kinematics_estimated.orientation
+        orientation = self.get_kinematics().orientation
         pitch, roll, yaw = airsim.to_eularian_angles(orientation)
 
         return pitch, roll, yaw
 
     # 获取无人机摄像机的姿态角
     def get_camera_eularian_angle(self):
-        self.__lock.acquire()
-        camera_info = self.__control_client.simGetCameraInfo(0, vehicle_name=self.__name)
-        self.__lock.release()
-
-        orientation = camera_info.pose.orientation
+        orientation = self.get_camera_pose().orientation
         pitch, roll, yaw = airsim.to_eularian_angles(orientation)
 
         return pitch, roll, yaw
 
     #  获取无人机的位置坐标
     def get_body_position(self):
-        self.__lock.acquire()
-        state = self.__control_client.getMultirotorState(self.__name)
-        self.__lock.release()
-
-        position = state.kinematics_estimated.position
+        position = self.get_kinematics().position
         x_NED, y_NED, z_NED = position.x_val, position.y_val, position.z_val
 
         return x_NED, y_NED, z_NED
 
     # 获取无人机摄像机的位置坐标
     def get_camera_position(self):
-        self.__lock.acquire()
-        camera_info = self.__control_client.simGetCameraInfo(0, vehicle_name=self.__name)
-        self.__lock.release()
-
-        position = camera_info.pose.position
+        position = self.get_camera_pose().position
         x_NED, y_NED, z_NED = position.x_val, position.y_val, position.z_val
 
         return x_NED, y_NED, z_NED
@@ -352,18 +396,16 @@ class UAVController:
 
     # 无人机移动, 面朝方向不变
     def move_by_velocity_with_same_direction(self, v_front, v_right, vz, duration, yaw_mode=airsim.YawMode()):
-        self.__lock.acquire()
-        state = self.__control_client.getMultirotorState(self.__name)
-        orientation = state.kinematics_estimated.orientation
+        kinematics = self.get_kinematics()
+        orientation = kinematics.orientation
         _, _, yaw = airsim.to_eularian_angles(orientation)
 
         vx_NED, vy_NED, vz_NED = velocity_body_frame_to_NED(v_front, v_right, vz, yaw)
         #print("NED", vx_NED, vy_NED, vz_NED, duration, airsim.DrivetrainType.MaxDegreeOfFreedom, yaw_mode, self.__name)
-        state = self.__control_client.getMultirotorState(self.__name)
-        current_altitude = state.kinematics_estimated.position.z_val
+        current_altitude = kinematics.position.z_val
         #print(f"Current altitude: {current_altitude}")
 
-        body_vx_NED, body_vy_NED, body_vz_NED = state.kinematics_estimated.linear_velocity
+        body_vx_NED, body_vy_NED, body_vz_NED = kinematics.linear_velocity
         a = 1
         eps = 1e-3
         if vz_NED - body_vz_NED > eps:
@@ -381,10 +423,10 @@ class UAVController:
         elif body_vy_NED - vy_NED > eps:
             vy_NED = max(vy_NED, body_vy_NED - a)
 
-        self.__control_client.moveByVelocityAsync(vx_NED, vy_NED, vz_NED, duration,
-                                                  airsim.DrivetrainType.MaxDegreeOfFreedom,
-                                                  yaw_mode, vehicle_name=self.__name)
-        self.__lock.release()
+        with self.__control_lock:
+            self.__control_client.moveByVelocityAsync(vx_NED, vy_NED, vz_NED, duration,
+                                                      airsim.DrivetrainType.MaxDegreeOfFreedom,
+                                                      yaw_mode, vehicle_name=self.__name)
 
     # 无人机异步移动, 面朝速度方向
     def move_by_velocity_face_direction_async(self, v_front, v_right, vz, duration):
@@ -393,10 +435,7 @@ class UAVController:
         self.move_by_velocity_face_direction(v_front, v_right, vz, duration)
 
     def move_by_velocity_new(self, vx, vy, vz, duration):
-        self.__lock.acquire()
-
-        state = self.__control_client.getMultirotorState(self.__name)
-        body_vx_NED, body_vy_NED, body_vz_NED = state.kinematics_estimated.linear_velocity
+        body_vx_NED, body_vy_NED, body_vz_NED = self.get_kinematics().linear_velocity
 
         a = 1
         eps = 1e-3
@@ -415,20 +454,18 @@ class UAVController:
         elif body_vy_NED - vy > eps:
             vy = max(vy, body_vy_NED - a) 
 
-        self.__control_client.moveByVelocityAsync(vx, vy, vz, duration,yaw_mode=airsim.YawMode(False, 0), vehicle_name=self.__name)
-        self.__lock.release()
+        with self.__control_lock:
+            self.__control_client.moveByVelocityAsync(vx, vy, vz, duration,yaw_mode=airsim.YawMode(False, 0), vehicle_name=self.__name)
 
     # 无人机移动, 面朝速度方向
     def move_by_velocity_face_direction(self, v_front, v_right, vz, duration):  # 前, 右, 下
-        self.__lock.acquire()
-
-        state = self.__control_client.getMultirotorState(self.__name)
-        orientation = state.kinematics_estimated.orientation
+        kinematics = self.get_kinematics()
+        orientation = kinematics.orientation
         _, _, yaw = airsim.to_eularian_angles(orientation)
 
         vx_NED, vy_NED, vz_NED = velocity_body_frame_to_NED(v_front, v_right, vz, yaw)
 
-        body_vx_NED, body_vy_NED, body_vz_NED = state.kinematics_estimated.linear_velocity
+        body_vx_NED, body_vy_NED, body_vz_NED = kinematics.linear_velocity
         a = 2
         eps = 1e-3
         if vz_NED - body_vz_NED > eps:
@@ -446,9 +483,9 @@ class UAVController:
         elif body_vy_NED - vy_NED > eps:
             vy_NED = max(vy_NED, body_vy_NED - a)
 
-        self.__control_client.moveByVelocityAsync(vx_NED, vy_NED, vz_NED, duration, airsim.DrivetrainType.ForwardOnly,
-                                                  airsim.YawMode(False, 0), vehicle_name=self.__name)
-        self.__lock.release()
+        with self.__control_lock:
+            self.__control_client.moveByVelocityAsync(vx_NED, vy_NED, vz_NED, duration, airsim.DrivetrainType.ForwardOnly,
+                                                      airsim.YawMode(False, 0), vehicle_name=self.__name)
 
     def set_position_directly(self, target_position, target_orientation=(0, 0, 0)):
         """
@@ -467,15 +504,14 @@ class UAVController:
             airsim.to_quaternion(target_orientation[0], target_orientation[1], target_orientation[2])  # pitch, roll, yaw
         )
         
-        self.__lock.acquire()
         try:
-            self.__control_client.simSetVehiclePose(pose, ignore_collison=True, vehicle_name=self.__name)
-            return True
+            with self.__control_lock:
+                self.__control_client.simSetVehiclePose(pose, ignore_collison=True, vehicle_name=self.__name)
         except Exception as e:
             print(f"设置位置失败: {e}")
             return False
-        finally:
-            self.__lock.release()
+        self.invalidate_state_snapshot()
+        return True
 
     # 异步旋转无人机摄像头
     def rotate_camera_async(self, camera_rotation_rate, duration):
@@ -496,54 +532,57 @@ class UAVController:
         camera_pose = airsim.Pose(airsim.Vector3r(0, 0, 0),
                                   airsim.to_quaternion(self.__camera_rotation, 0, 0))  # 前, 右, 下,向上抬,向右倾,向右转
 
-        self.__lock.acquire()
-        self.__control_client.simSetCameraPose(0, camera_pose, vehicle_name=self.__name)
-        self.__lock.release()
+        with self.__control_lock:
+            self.__control_client.simSetCameraPose(0, camera_pose, vehicle_name=self.__name)
+        self.invalidate_state_snapshot("camera")
 
     ### > ----  以下为记录数据的代码(xml)，记录内容有[位置，]  ---- < ###
+    # 遥测采样线程每个节拍调用一次：一次 getMultirotorState，同时刷新运动学快照
+    def __sample_telemetry(self):
+        kinematics = self.get_kinematics(max_age=0.)
+        position, velocity = kinematics.position, kinematics.linear_velocity
+        angular_velocity = kinematics.angular_velocity
+        pitch, roll, yaw = airsim.to_eularian_angles(kinematics.orientation)
+        return (position.x_val, position.y_val, position.z_val,
+                velocity.x_val, velocity.y_val, velocity.z_val,
+                pitch, roll, yaw,
+                angular_velocity.x_val, angular_velocity.y_val, angular_velocity.z_val)
+
     def start_logging(self, recording_interval=0.2):
         """ 启动记录
             recording_interval: 记录间隔，单位为秒, 默认为：0.2 秒
+            记录在飞行中逐条写入 data/state_logs 下的二进制记录文件，程序崩溃时已记录的数据不会丢失
         """
         self.__recording_interval = recording_interval
         if not self.__recording:
             self.__recording = True
-            self.__log_data = []  # 清空以前的记录
-            self._log_data()  # 开始记录
-
-    # 停止记录
+            current_time = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+            self.__log_path = f"data/state_logs/uav_state_data_{current_time}{FLIGHT_LOG_SUFFIX}"
+            self.__log_writer = FlightLogWriter(self.__log_path, root="UAVLogs", interval=recording_interval)
+            self.__telemetry.subscribe("logging", recording_interval, callback=self.__log_writer.write_entry,
+                                       collect=False)
+
+    # 停止记录，记录文件已在飞行中写好，这里只需关闭文件；返回记录文件路径
+    # 读取记录、导出 XML 与评估较慢，交给后台线程（见 threads.EvaluationThread）
     def stop_logging(self) -> str:
         if self.__recording:
             self.__recording = False
-            # 记录结束后自动保存到XML文件
-            return self._save_to_xml()
+            self.__telemetry.unsubscribe("logging")
+            self.__log_writer.close()
+            print(f"数据已保存到 {self.__log_path}")
+            return self.__log_path
 
-    # 定时记录无人机的状态
-    def _log_data(self):
+    def get_log_data(self):
+        """ 获取记录的数据（从记录文件读出，与原来的字典格式相同） """
+        if self.__log_path is None:
+            return []
         if self.__recording:
-            # 获取无人机的状态信息
-            position = self.get_body_position()  # 获取位置
-            velocity = self.get_velocity()  # 获取速度
-            euler_angles = self.get_body_eularian_angle()  # 获取姿态角
-            angular_velocity = self.get_angular_velocity()  # 获取角速度变化率
-
-            # 存储记录
-            log_entry = {
-                'timestamp': time.time(),
-                'position': position,
-                'velocity': velocity,
-                'euler_angles': euler_angles,
-                'angular_velocity': angular_velocity
-            }
-            self.__log_data.append(log_entry)
-
-            # 每隔一定时间再次调用记录函数
-            threading.Timer(self.__recording_interval, self._log_data).start()
+            self.__log_writer.flush()
+        return flight_log_entries(self.__log_path)
 
-
-    def get_log_data(self):
-        """ 获取记录的数据 """
-        return self.__log_data
+    def get_log_path(self):
+        """ 获取最近一次记录的记录文件路径 """
+        return self.__log_path
     
     # monitoring
 
@@ -554,151 +593,61 @@ class UAVController:
         self.__monitoring_interval = monitoring_interval
         if not self.__monitoring:
             self.__monitoring = True
-            self.__monitoring_data = []  # 清空以前的记录
-            self._monitoring_data()  # 开始记录
+            # 开始记录，清空以前的记录
+            self.__monitoring_data = self.__telemetry.subscribe("monitoring", monitoring_interval).entries
 
     # 停止记录
     def stop_monitoring(self) -> str:
         if self.__monitoring:
             self.__monitoring = False
+            self.__telemetry.unsubscribe("monitoring")
             # 记录结束后自动保存到XML文件
             return self._save_to_xml_monitoring()
 
-    # 定时记录无人机的状态
-    def _monitoring_data(self):
-        if self.__monitoring:
-            # 获取无人机的状态信息
-            position = self.get_body_position()  # 获取位置
-            velocity = self.get_velocity()  # 获取速度
-            euler_angles = self.get_body_eularian_angle()  # 获取姿态角
-            angular_velocity = self.get_angular_velocity()  # 获取角速度变化率
-
-            # 存储记录
-            monitoring_entry = {
-                'timestamp': time.time(),
-                'position': position,
-                'velocity': velocity,
-                'euler_angles': euler_angles,
-                'angular_velocity': angular_velocity
-            }
-            self.__monitoring_data.append(monitoring_entry)
-
-            # 每隔一定时间再次调用记录函数
-            threading.Timer(self.__monitoring_interval, self._monitoring_data).start()
-
-
     def get_monitoring_data(self):
         """ 获取记录的数据 """
         return self.__monitoring_data
 
+    # 订阅遥测（如轨迹显示），callback(entry) 在采样线程中调用，entry 与记录数据格式相同
+    def subscribe_telemetry(self, name, interval, callback=None, collect=False):
+        return self.__telemetry.subscribe(name, interval, callback, collect)
+
+    def unsubscribe_telemetry(self, name):
+        return self.__telemetry.unsubscribe(name)
+
+    # 最近 n 个遥测采样 -> (时间戳 [n], 数值 [n, 12])，列为位置、速度、姿态角、角速度
+    def get_telemetry_samples(self, n=None):
+        return self.__telemetry.latest(n)
+
+    # 遥测采样统计：节拍、跳过的节拍、查询耗时、采样抖动
+    def get_telemetry_stats(self):
+        return self.__telemetry.get_stats()
+
 
     # 获取无人机的速度
     def get_velocity(self):
-        self.__lock.acquire()
-        velocity = self.__control_client.getMultirotorState(self.__name).kinematics_estimated.linear_velocity
-        self.__lock.release()
+        velocity = self.get_kinematics().linear_velocity
         return (velocity.x_val, velocity.y_val, velocity.z_val)
 
     # 获取无人机的角速度变化率
     def get_angular_velocity(self):
-        self.__lock.acquire()
-        angular_velocity = self.__control_client.getMultirotorState(self.__name).kinematics_estimated.angular_velocity
-        self.__lock.release()
+        angular_velocity = self.get_kinematics().angular_velocity
         return angular_velocity.x_val, angular_velocity.y_val, angular_velocity.z_val
 
-    # 将记录保存到 XML 文件
+    # 将记录导出为 XML 文件
     def _save_to_xml(self,flag = True) -> str:
-        """ 将记录的数据写入格式化 XML 文件 """
-        # 获取当前时间并格式化为字符串
-        current_time = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        xml_filename = f"data/state_logs/uav_state_data_{current_time}.xml"  # 使用当前时间作为文件名
-
-        # 检查文件夹是否存在，如果不存在则创建
-        folder_path = os.path.dirname(xml_filename)
-        if not os.path.exists(folder_path):
-            os.makedirs(folder_path)  # 创建文件夹（递归创建）
-
-        # 创建 XML 根元素
-        root = ET.Element("UAVLogs")
-
-        # 遍历所有记录
-        for entry in self.__log_data:
-            log_entry_element = ET.SubElement(root, "LogEntry")
-
-            # 添加每个记录的子元素
-            ET.SubElement(log_entry_element, "Timestamp").text = str(entry['timestamp'])
-            position = ET.SubElement(log_entry_element, "Position")
-            ET.SubElement(position, "X").text = str(entry['position'][0])
-            ET.SubElement(position, "Y").text = str(entry['position'][1])
-            ET.SubElement(position, "Z").text = str(entry['position'][2])
-
-            velocity = ET.SubElement(log_entry_element, "Velocity")
-            ET.SubElement(velocity, "VX").text = str(entry['velocity'][0])
-            ET.SubElement(velocity, "VY").text = str(entry['velocity'][1])
-            ET.SubElement(velocity, "VZ").text = str(entry['velocity'][2])
-
-            euler_angles = ET.SubElement(log_entry_element, "EulerAngles")
-            ET.SubElement(euler_angles, "Pitch").text = str(entry['euler_angles'][0])
-            ET.SubElement(euler_angles, "Roll").text = str(entry['euler_angles'][1])
-            ET.SubElement(euler_angles, "Yaw").text = str(entry['euler_angles'][2])
-
-            angular_velocity = ET.SubElement(log_entry_element, "AngularVelocity")
-            ET.SubElement(angular_velocity, "RollRate").text = str(entry['angular_velocity'][0])
-            ET.SubElement(angular_velocity, "PitchRate").text = str(entry['angular_velocity'][1])
-            ET.SubElement(angular_velocity, "YawRate").text = str(entry['angular_velocity'][2])
-
-        # 转换为字符串并格式化
-        raw_xml = ET.tostring(root, encoding="utf-8")
-        dom = parseString(raw_xml)
-        formatted_xml = dom.toprettyxml(indent="  ")
-
-        # 保存格式化后的 XML 到文件
-        with open(xml_filename, "w", encoding="utf-8") as xml_file:
-            xml_file.write(formatted_xml)
-
-        print(f"数据已保存到 {xml_filename}")
+        """ 将记录文件导出为格式化 XML 文件（与记录文件同名），返回 XML 字符串 """
+        if self.__log_path is None:
+            return entries_to_xml([], root="UAVLogs")
+        if self.__recording:
+            self.__log_writer.flush()
+        formatted_xml = export_flight_log_xml(self.__log_path)
+        print(f"数据已导出到 {os.path.splitext(self.__log_path)[0]}.xml")
         return formatted_xml
     
     def _save_to_xml_monitoring(self,flag = True) -> str:
         """ 将记录的数据写入格式化 XML """
-        # 获取当前时间并格式化为字符串
-        current_time = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-
-        # 创建 XML 根元素
-        root = ET.Element("UAVMonitoring")
-
-        # 遍历所有记录
-        for entry in self.__monitoring_data:
-            log_entry_element = ET.SubElement(root, "LogEntry")
-
-            # 添加每个记录的子元素
-            ET.SubElement(log_entry_element, "Timestamp").text = str(entry['timestamp'])
-            position = ET.SubElement(log_entry_element, "Position")
-            ET.SubElement(position, "X").text = str(entry['position'][0])
-            ET.SubElement(position, "Y").text = str(entry['position'][1])
-            ET.SubElement(position, "Z").text = str(entry['position'][2])
-
-            velocity = ET.SubElement(log_entry_element, "Velocity")
-            ET.SubElement(velocity, "VX").text = str(entry['velocity'][0])
-            ET.SubElement(velocity, "VY").text = str(entry['velocity'][1])
-            ET.SubElement(velocity, "VZ").text = str(entry['velocity'][2])
-
-            euler_angles = ET.SubElement(log_entry_element, "EulerAngles")
-            ET.SubElement(euler_angles, "Pitch").text = str(entry['euler_angles'][0])
-            ET.SubElement(euler_angles, "Roll").text = str(entry['euler_angles'][1])
-            ET.SubElement(euler_angles, "Yaw").text = str(entry['euler_angles'][2])
-
-            angular_velocity = ET.SubElement(log_entry_element, "AngularVelocity")
-            ET.SubElement(angular_velocity, "RollRate").text = str(entry['angular_velocity'][0])
-            ET.SubElement(angular_velocity, "PitchRate").text = str(entry['angular_velocity'][1])
-            ET.SubElement(angular_velocity, "YawRate").text = str(entry['angular_velocity'][2])
-
-        # 转换为字符串并格式化
-        raw_xml = ET.tostring(root, encoding="utf-8")
-        dom = parseString(raw_xml)
-        formatted_xml = dom.toprettyxml(indent="  ")
-
-        return formatted_xml
+        return entries_to_xml(self.__monitoring_data, root="UAVMonitoring")
 
     @command(
         description="将默认无人机飞行到指定位置",
@@ -1,10 +1,12 @@
 import math
+import json
 import airsim
 import time
 import numpy as np
 import sys
 
-from BotSort_tracker.tracker.bot_sort import BoTSORT
+from utils.trackers import TRACKER_BACKENDS, create_tracker
+from utils.detection_scheduler import DetectionScheduler, RoiScheduler
 from BotSort_tracker.visualize import plot_tracking
 # from utils.target_tracking_system import TargetTrackingSystem
 from utils.utils import BaseEngine, tlwh2xyxy, vis_botsort_track_mode
@@ -113,10 +115,21 @@ class TargetTracker(Target):
         return self.__tracking_id
 
     
+# 读取预测器配置（部署模式、推理后端），文件缺失时使用默认值
+def load_predictor_config(config_path="settings/predictor.json"):
+    config = {"deploy": True, "backend": "torch", "quantize": "static", "tracker": "botsort", "detect_interval": 3,
+              "roi_inference": True, "roi_size": 320, "reid": False}
+    try:
+        with open(config_path, "r") as config_file:
+            config.update(json.load(config_file))
+    except FileNotFoundError:
+        print(f"Predictor config not found: {config_path}, using defaults")
+    return config
+
 # 预测器类
 class Predictor(BaseEngine):
-    def __init__(self, engine_path):
-        super(Predictor, self).__init__(engine_path)
+    def __init__(self, engine_path, deploy=True, backend="torch", quantize="static"):
+        super(Predictor, self).__init__(engine_path, deploy=deploy, backend=backend, quantize=quantize)
 
         self.n_classes = 6
         self.class_names = [
@@ -132,7 +145,14 @@ class Navigator(UAVController):
         self.__locating = False              # 定位模式(判断是否距离目标较近)
         self.__botsort_locating = False      # BoT-SORT 定位模式(判断是否距离目标较近)
 
-        self.__botsort_tracker = BoTSORT()  # 实例化 BoT-SORT 跟踪器
+        predictor_config = load_predictor_config()
+        self.tracker_list = list(TRACKER_BACKENDS)        # 可选的跟踪器
+        self.__reid = predictor_config["reid"]         # BoT-SORT 是否使用外观特征关联
+        self.__botsort_tracker = self.__create_tracker(predictor_config["tracker"])  # 跟踪器，BoT-SORT 的相机运动由仿真器位姿计算
+        self.__detection_scheduler = DetectionScheduler(interval=predictor_config["detect_interval"])  # 跟踪模式下的检测调度
+        self.__roi_scheduler = RoiScheduler(input_size=(predictor_config["roi_size"],) * 2)  # 逼近目标时只检测目标附近区域
+        self.__roi_scheduler.enabled = predictor_config["roi_inference"]
+        self.__roi_scheduler.fit_to_tracker(self.__botsort_tracker, self.__detection_scheduler.interval)
         self.__botsort_tracked_targets = []          # 存放 BoT-SORT 跟踪过的目标
         self.__botsort_tracked_targets_id = []       # 存放 BoT-SORT 跟踪过目标的ID
         self.__botsort_target_ids = []       # 待跟踪的目标 ID 列表
@@ -141,10 +161,60 @@ class Navigator(UAVController):
         self.__last_recovery_attempt = 0        # 
         self.__recovery_cooldown = 2.0          # 恢复冷却时间
 
-        self.__pred = Predictor(engine_path=r"data/models/best_epoch_weights_Brushify_100.pth")  # 预测器
+        self.__pred = Predictor(engine_path=r"data/models/best_epoch_weights_Brushify_100.pth",
+                                deploy=predictor_config["deploy"], backend=predictor_config["backend"],
+                                quantize=predictor_config["quantize"])  # 预测器
         self.__pred.inference(np.array([[[0, 0, 0]]], dtype=np.float64), conf=0.1, end2end=False)
         self.__pred.get_fps()
 
+    # 切换跟踪器（botsort / bytetrack / none），新跟踪器从头开始编号
+    def set_tracker(self, name):
+        if name == self.__botsort_tracker.name:
+            return
+        self.__botsort_tracker = self.__create_tracker(name)
+        # 新跟踪器的 ID 从 1 重新编号，原来的目标 ID 会指向其它车辆，需要重新选择目标
+        self.__botsort_tracked_targets_id = []
+        self.__botsort_target_ids = []
+        self.__botsort_current_target_id = None
+        self.__detection_scheduler.reset()
+        self.__roi_scheduler.fit_to_tracker(self.__botsort_tracker, self.__detection_scheduler.interval)
+        self.__roi_scheduler.reset()
+
+    def get_tracker_name(self):
+        return self.__botsort_tracker.name
+
+    # 获取跟踪器每帧耗时统计
+    def get_tracker_stats(self):
+        return self.__botsort_tracker.get_stats()
+
+    # 设置跟踪模式下检测器的运行间隔（帧），1 为每帧检测
+    def set_detect_interval(self, interval):
+        self.__detection_scheduler.set_interval(interval)
+        self.__roi_scheduler.fit_to_tracker(self.__botsort_tracker, self.__detection_scheduler.interval)
+
+    # 获取检测调度统计：实际检测频率、控制循环帧率、检测帧/预测帧耗时直方图
+    def get_detection_stats(self):
+        stats = self.__detection_scheduler.get_stats()
+        stats["roi"] = self.__roi_scheduler.get_stats()
+        return stats
+
+    # 开关 ROI 推理（只检测当前目标附近的区域）
+    def set_roi_inference(self, enabled):
+        self.__roi_scheduler.enabled = bool(enabled)
+        self.__roi_scheduler.reset()
+
+    # 跟踪器需要的相机运动提示：telemetry 方法直接用相机位姿，adaptive 方法用无人机角速度提示相机是否静止
+    def __create_tracker(self, name):
+        kwargs = {"with_reid": self.__reid} if name == "botsort" else {}
+        return create_tracker(name, **kwargs)
+
+    def __tracker_hints(self, tracker):
+        if tracker.cmc_method == "telemetry":
+            return {"camera_pose": self.get_camera_pose()}
+        if tracker.cmc_method == "adaptive":
+            return {"ego_motion": self.get_kinematics()}
+        return {}
+
     def set_botsort_target_ids(self, target_ids):
         """
         设置需要通过BoT-SORT跟踪的目标ID列表。
@@ -382,22 +452,40 @@ class Navigator(UAVController):
         使用BoT-SORT按指定ID跟踪目标车辆，并根据状态标记不同颜色的边界框。
         :param origin_frame: 无人机摄像头捕获的原始图像帧。
         """
-        # 使用YOLO检测目标
-        dets = self.__pred.inference_dets(origin_frame, conf=0.5, end2end=False)
-
-        # print("dets")
-        # print(dets)
-
-        # 若未检测到任何目标，则进入寻找模式
-        if dets is None or len(dets) == 0:
-            self.set_frame(origin_frame)
-            # self.find_target()
-            return
+        tracker = self.__botsort_tracker
+        scheduler = self.__detection_scheduler
+        t0 = time.perf_counter()
+
+        # 轨迹稳定时跳过检测，只用卡尔曼预测 + 相机运动补偿推算当前帧的目标位置
+        if not scheduler.should_detect(tracker):
+            tracked_targets = tracker.predict(origin_frame, **self.__tracker_hints(tracker))
+            scheduler.record(False, time.perf_counter() - t0)
+        else:
+            # 使用YOLO检测目标：有跟踪目标时只检测其预测位置附近的区域，定期或目标丢失时检测全图
+            roi = self.__roi_scheduler.select(tracker, self.__botsort_current_target_id, origin_frame.shape)
+            dets = []
+            if roi is not None:
+                dets = self.__pred.inference_dets_roi(origin_frame, roi, self.__roi_scheduler.input_size, conf=0.5)
+            if len(dets) == 0:  # 区域内没有检测到目标时同一帧立即全图检测
+                roi = None
+                dets = self.__pred.inference_dets(origin_frame, conf=0.5, end2end=False)
+            self.__roi_scheduler.record(roi)
+
+            # print("dets")
+            # print(dets)
+
+            # 若未检测到任何目标，则进入寻找模式
+            if dets is None or len(dets) == 0:
+                scheduler.record(True, time.perf_counter() - t0)
+                self.set_frame(origin_frame)
+                # self.find_target()
+                return
 
-        # print("scores:",dets[:,4])
+            # print("scores:",dets[:,4])
 
-        # 更新BoT-SORT跟踪器
-        tracked_targets = self.__botsort_tracker.update(dets, origin_frame)
+            # 更新BoT-SORT跟踪器
+            tracked_targets = tracker.update(dets, origin_frame, **self.__tracker_hints(tracker))
+            scheduler.record(True, time.perf_counter() - t0)
 
         # print("tracked_targets")
         # print(tracked_targets)
@@ -1108,8 +1196,7 @@ class Navigator(UAVController):
             target_angle (float): 目标旋转角度（单位：度）
         """
         # 获取当前无人机的姿态
-        state = self.get_control_client().getMultirotorState(vehicle_name=self.get_name())
-        orientation = state.kinematics_estimated.orientation
+        orientation = self.get_kinematics(max_age=0.).orientation
         _, _, current_yaw = airsim.to_eularian_angles(orientation)
 
         # 计算目标偏航角（弧度）
@@ -0,0 +1,212 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import airsim
+import cv2
+import numpy as np
+
+## 多模态拍照：一次 simGetImages 批量请求所有模态，普通图像压缩传输（PNG），深度类图像按 float 传输；
+## 保存时 PNG 数据直接写盘，不解码再重新编码，写盘由单独的写线程从有界队列中取出执行，界面线程只负责提交；
+## 需要图像数组时（fetch）才解码，解码放在线程池中并行执行
+
+# 以 float 传输的图像类型（深度 / 视差，单位为米或归一化值），保存为 .npy
+FLOAT_IMAGE_TYPES = ("DepthPlanar", "DepthPerspective", "DisparityNormalized")
+
+
+def image_request(capture_type, camera_name=0):
+    """按图像类型构造请求：深度类为 float，其余为压缩的 PNG"""
+    image_type = getattr(airsim.ImageType, capture_type)
+    if capture_type in FLOAT_IMAGE_TYPES:
+        return airsim.ImageRequest(camera_name, image_type, pixels_as_float=True, compress=False)
+    return airsim.ImageRequest(camera_name, image_type, pixels_as_float=False, compress=True)
+
+
+def decode_response(response):
+    """
+    解码 simGetImages 的一个响应
+    返回: float 图像为 [h, w] float32，其余为 [h, w, 3] uint8 (BGR)
+    """
+    if response.pixels_as_float:
+        return np.asarray(response.image_data_float, dtype=np.float32).reshape(response.height, response.width)
+    data = np.frombuffer(response.image_data_uint8, dtype=np.uint8)
+    if response.compress:
+        frame = cv2.imdecode(data, cv2.IMREAD_UNCHANGED)
+        if frame is None:
+            raise ValueError("invalid compressed image data")
+    else:
+        # 未压缩图像的通道数由数据长度推算
+        frame = data.reshape(response.height, response.width, -1)
+    if frame.ndim == 3 and frame.shape[2] == 4:
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR)
+    return frame
+
+
+class CaptureService(object):
+    def __init__(self, image_client, image_lock, vehicle_name="", save_dir="data/capture_imgs",
+                 decode_workers=4, write_queue_size=32):
+        """
+        image_client / image_lock: 图像客户端及其锁（与视频画面共用）
+        decode_workers: fetch 的解码线程数，cv2.imdecode 会释放 GIL，多个模态可并行解码
+        write_queue_size: 待写盘图像的队列长度，队列满时请求线程等待，内存占用有上限
+        """
+        self.image_client = image_client
+        self.image_lock = image_lock
+        self.vehicle_name = vehicle_name
+        self.save_dir = save_dir
+        # 拍照请求在单独的线程中依次执行，不阻塞调用线程
+        self.__request_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="capture_request")
+        self.__executor = ThreadPoolExecutor(max_workers=decode_workers, thread_name_prefix="capture_decode")
+        self.__write_queue = queue.Queue(maxsize=write_queue_size)
+        self.__writer = threading.Thread(target=self.__write_loop, name="capture_writer", daemon=True)
+        self.__writer.start()
+        self.__unsupported = set()     # 已提示过的不支持的图像类型
+        self.__stats_lock = threading.Lock()
+        self.__stats = {"requests": 0, "captures": 0, "images": 0, "written": 0, "errors": 0,
+                        "rpc_time": 0., "decode_time": 0., "write_time": 0.}
+
+    def fetch(self, capture_types):
+        """
+        一次 RPC 获取多个模态并在线程池中并行解码
+        返回: {图像类型: 图像}，float 图像为 [h, w] float32
+        """
+        responses = self.__request(capture_types)
+        return dict(zip(responses, self.__executor.map(self.__decode, responses.values())))
+
+    def capture_async(self, capture_types, callback=None):
+        """
+        拍照并保存所有模态，立即返回 Future，不阻塞调用线程（如界面线程）
+        callback(paths): 全部写盘完成后在写线程中调用，paths 为 {图像类型: 文件路径}；
+                         没有可拍摄的图像类型时不发送请求，直接以 {} 调用
+        """
+        return self.__request_executor.submit(self.__capture, list(capture_types), callback)
+
+    def __request(self, capture_types):
+        # 去掉重复与不支持的类型，保持顺序
+        types = []
+        for capture_type in capture_types:
+            if capture_type in types:
+                continue
+            if not hasattr(airsim.ImageType, capture_type):
+                if capture_type not in self.__unsupported:
+                    self.__unsupported.add(capture_type)
+                    print(f"Unsupported capture type: {capture_type}")
+                continue
+            types.append(capture_type)
+        if not types:
+            return {}
+        requests = [image_request(capture_type) for capture_type in types]
+        t0 = time.perf_counter()
+        with self.image_lock:
+            responses = self.image_client.simGetImages(requests, vehicle_name=self.vehicle_name)
+        with self.__stats_lock:
+            self.__stats["requests"] += 1
+            self.__stats["rpc_time"] += time.perf_counter() - t0
+        return dict(zip(types, responses))
+
+    def __decode(self, response):
+        t0 = time.perf_counter()
+        frame = decode_response(response)
+        with self.__stats_lock:
+            self.__stats["images"] += 1
+            self.__stats["decode_time"] += time.perf_counter() - t0
+        return frame
+
+    def __capture(self, capture_types, callback):
+        try:
+            responses = self.__request(capture_types)
+        except Exception as e:
+            with self.__stats_lock:
+                self.__stats["errors"] += 1
+            print(f"Capture failed: {e}")
+            return {}
+        if not responses:
+            if callback is not None:
+                callback({})
+            return {}
+        with self.__stats_lock:
+            self.__stats["captures"] += 1
+
+        stamp = datetime.now().strftime('date_%m_%d_%H_%M_%S')
+        pending = {"count": len(responses), "paths": {}, "lock": threading.Lock(), "callback": callback}
+        save_names = {}
+        for capture_type, response in responses.items():
+            path = os.path.join(self.save_dir, capture_type)
+            extension = ".npy" if response.pixels_as_float else ".png"
+            save_names[capture_type] = os.path.join(path, f"capture_{capture_type}_{stamp}_{extension}")
+            # 队列满时在请求线程中等待，不会阻塞界面
+            self.__write_queue.put((capture_type, save_names[capture_type], response, pending))
+        return save_names
+
+    def __write_loop(self):
+        while True:
+            item = self.__write_queue.get()
+            if item is None:
+                self.__write_queue.task_done()
+                break
+            capture_type, save_name, response, pending = item
+            t0 = time.perf_counter()
+            saved = False
+            try:
+                os.makedirs(os.path.dirname(save_name), exist_ok=True)
+                if response.compress:
+                    # 仿真器已压缩为 PNG，原样写盘
+                    with open(save_name, "wb") as f:
+                        f.write(response.image_data_uint8)
+                elif response.pixels_as_float:
+                    np.save(save_name, decode_response(response))
+                else:
+                    cv2.imwrite(save_name, decode_response(response))
+                saved = True
+                with self.__stats_lock:
+                    self.__stats["written"] += 1
+                    self.__stats["write_time"] += time.perf_counter() - t0
+            except Exception as e:
+                with self.__stats_lock:
+                    self.__stats["errors"] += 1
+                print(f"Failed to save {save_name}: {e}")
+
+            with pending["lock"]:
+                if saved:
+                    pending["paths"][capture_type] = save_name
+                pending["count"] -= 1
+                done = pending["count"] == 0
+            if done:
+                print(f"Successful captured! {self.save_dir}")
+                if pending["callback"] is not None:
+                    try:
+                        pending["callback"](pending["paths"])
+                    except Exception as e:
+                        print(f"Capture callback failed: {e}")
+            self.__write_queue.task_done()
+
+    def flush(self):
+        """等待已进入写盘队列的图像全部写完"""
+        self.__write_queue.join()
+
+    def get_stats(self):
+        """拍照统计：请求次数、拍照次数、图像数、写盘数、失败数，以及 RPC / 解码 / 写盘的平均耗时（毫秒）"""
+        with self.__stats_lock:
+            stats = dict(self.__stats)
+        requests, images, written = stats["requests"], stats["images"], stats["written"]
+        return {
+            "requests": requests,
+            "captures": stats["captures"],
+            "images": images,
+            "written": written,
+            "errors": stats["errors"],
+            "queued": self.__write_queue.qsize(),
+            "rpc_ms": stats["rpc_time"] / requests * 1000 if requests else 0.,
+            "decode_ms": stats["decode_time"] / images * 1000 if images else 0.,
+            "write_ms": stats["write_time"] / written * 1000 if written else 0.,
+        }
+
+    def close(self):
+        """写完队列中的图像后停止写线程与线程池"""
+        self.__request_executor.shutdown(wait=True)
+        self.__executor.shutdown(wait=True)
+        self.__write_queue.put(None)
+        self.__writer.join()
@@ -0,0 +1,184 @@
+import time
+from collections import deque
+
+import numpy as np
+
+## 检测调度：每 N 帧运行一次检测器，轨迹不可靠时提前检测，其余帧只用卡尔曼预测 + 相机运动补偿推算轨迹
+
+# 每帧耗时直方图的分箱边界（毫秒），最后一箱为 >= 最大边界
+LATENCY_BINS_MS = (0, 5, 10, 20, 40, 80, 160)
+
+
+class DetectionScheduler(object):
+    def __init__(self, interval=3, min_score=0.5, max_uncertainty=0.15, window=300):
+        """
+        interval: 最多每隔多少帧运行一次检测器，1 表示每帧检测
+        min_score: 轨迹置信度低于此值时下一帧检测
+        max_uncertainty: 卡尔曼位置标准差超过框宽/高的此比例时下一帧检测
+        window: 统计检测频率所用的最近帧数
+        """
+        self.interval = max(1, int(interval))
+        self.min_score = min_score
+        self.max_uncertainty = max_uncertainty
+        self.__window = window
+        self.reset()
+
+    def reset(self):
+        self.__frames_since_detection = self.interval   # 保证第一帧运行检测
+        self.__history = deque(maxlen=self.__window)    # 最近若干帧的 (时间戳, 是否检测)
+        self.__hist = {"detect": np.zeros(len(LATENCY_BINS_MS), dtype=np.int64),
+                       "predict": np.zeros(len(LATENCY_BINS_MS), dtype=np.int64)}
+        self.__total_ms = {"detect": 0., "predict": 0.}
+        self.__triggers = {"interval": 0, "no_tracks": 0, "low_score": 0, "uncertainty": 0}
+
+    def set_interval(self, interval):
+        self.interval = max(1, int(interval))
+
+    def should_detect(self, tracker):
+        """
+        根据跟踪器当前状态决定本帧是否运行检测器
+        tracker: utils.trackers 中的 TrackerBackend
+        """
+        if self.interval == 1 or not tracker.supports_prediction:
+            return True
+        if self.__frames_since_detection + 1 >= self.interval:
+            self.__triggers["interval"] += 1
+            return True
+        score, uncertainty = tracker.confidence()
+        if score is None:
+            self.__triggers["no_tracks"] += 1
+            return True
+        if score < self.min_score:
+            self.__triggers["low_score"] += 1
+            return True
+        if uncertainty > self.max_uncertainty:
+            self.__triggers["uncertainty"] += 1
+            return True
+        return False
+
+    def record(self, detected, latency):
+        """
+        记录一帧的结果
+        detected: 本帧是否运行了检测器
+        latency: 本帧检测+跟踪（或预测）的耗时（秒）
+        """
+        kind = "detect" if detected else "predict"
+        latency_ms = latency * 1000
+        self.__hist[kind][np.searchsorted(LATENCY_BINS_MS, latency_ms, side="right") - 1] += 1
+        self.__total_ms[kind] += latency_ms
+        self.__history.append((time.perf_counter(), detected))
+        self.__frames_since_detection = 0 if detected else self.__frames_since_detection + 1
+
+    def get_stats(self):
+        """
+        返回调度统计：
+        detect_ratio: 最近帧中运行检测器的比例
+        detector_hz / loop_hz: 最近帧的检测器频率 / 控制循环帧率
+        latency_hist: 检测帧与预测帧的耗时直方图（bins_ms 为各箱下边界）
+        """
+        frames = len(self.__history)
+        detected = sum(d for _, d in self.__history)
+        duration = self.__history[-1][0] - self.__history[0][0] if frames > 1 else 0.
+        detect_ratio = detected / frames if frames else 0.
+        loop_hz = (frames - 1) / duration if duration > 0 else 0.
+        counts = {kind: int(hist.sum()) for kind, hist in self.__hist.items()}
+        return {
+            "interval": self.interval,
+            "detect_ratio": detect_ratio,
+            "detector_hz": detect_ratio * loop_hz,
+            "loop_hz": loop_hz,
+            "mean_ms": {kind: self.__total_ms[kind] / counts[kind] if counts[kind] else 0. for kind in counts},
+            "triggers": dict(self.__triggers),
+            "latency_hist": {
+                "bins_ms": list(LATENCY_BINS_MS),
+                "detect": self.__hist["detect"].tolist(),
+                "predict": self.__hist["predict"].tolist(),
+            },
+        }
+
+
+# ROI 推理：逼近目标时只检测目标附近的区域，定期或目标丢失时回到全图检测
+class RoiScheduler(object):
+    def __init__(self, input_size=(320, 320), pad_scale=2.5, min_size=160, full_frame_interval=10, max_area_ratio=0.5,
+                 lost_ratio=1 / 3):
+        """
+        input_size: ROI 推理的网络输入大小 (h, w)
+        pad_scale: 检测区域边长为目标框长边的倍数
+        min_size: 检测区域的最小边长（像素）
+        full_frame_interval: 每隔多少次检测做一次全图检测，保持其它目标的轨迹（fit_to_tracker 会按跟踪器重新设置）
+        max_area_ratio: 检测区域超过图像面积的此比例时直接全图检测（目标很近时 ROI 没有收益）
+        lost_ratio: 两次全图检测之间的帧数不超过跟踪器最长丢失帧数的此比例
+        """
+        self.input_size = tuple(input_size)
+        self.pad_scale = pad_scale
+        self.min_size = min_size
+        self.full_frame_interval = max(1, int(full_frame_interval))
+        self.max_area_ratio = max_area_ratio
+        self.lost_ratio = lost_ratio
+        self.enabled = True
+        self.reset()
+
+    def reset(self):
+        self.__detections_since_full = self.full_frame_interval  # 保证第一次检测为全图
+        self.__counts = {"roi": 0, "full": 0}
+
+    def fit_to_tracker(self, tracker, detect_interval):
+        """
+        按跟踪器的最长丢失帧数与检测间隔设置全图检测周期
+        ROI 帧中区域外的轨迹没有检测框，会被标记为丢失；全图检测要在它们被删除之前到来，
+        才能以原来的 ID 重新匹配，因此两次全图检测之间最多 max_time_lost * lost_ratio 帧
+        tracker: utils.trackers 中的 TrackerBackend
+        detect_interval: 检测调度的间隔（帧），两次检测之间最多相隔这么多帧
+        """
+        if tracker.max_time_lost is None:
+            return
+        frames = int(tracker.max_time_lost * self.lost_ratio)
+        self.full_frame_interval = max(1, frames // max(1, int(detect_interval)))
+
+    def select(self, tracker, target_id, frame_shape):
+        """
+        返回本次检测的区域 (x1, y1, x2, y2)，返回 None 表示全图检测
+        tracker: utils.trackers 中的 TrackerBackend
+        target_id: 当前跟踪的目标 ID
+        """
+        if not self.enabled or target_id is None or self.__detections_since_full + 1 >= self.full_frame_interval:
+            return None
+        if not tracker.supports_prediction:     # 没有运动模型，无法预测目标位置
+            return None
+        box = tracker.predicted_tlbr(target_id)
+        if box is None:     # 目标丢失
+            return None
+
+        height, width = frame_shape[:2]
+        center = (box[:2] + box[2:]) / 2
+        # 检测区域与网络输入同宽高比，缩放时不浪费填充区域
+        aspect = self.input_size[1] / self.input_size[0]
+        side = max(np.max(box[2:] - box[:2]) * self.pad_scale, self.min_size)
+        half = np.array([side * max(aspect, 1.), side / min(aspect, 1.)]) / 2
+        half = np.minimum(half, [width / 2, height / 2])
+        if 4 * half[0] * half[1] > self.max_area_ratio * width * height:
+            return None
+
+        # 区域超出图像时整体平移回图像内
+        center = np.clip(center, half, [width, height] - half)
+        return np.concatenate([center - half, center + half])
+
+    def record(self, roi):
+        """记录一次检测，roi 为 select 的返回值"""
+        if roi is None:
+            self.__detections_since_full = 0
+            self.__counts["full"] += 1
+        else:
+            self.__detections_since_full += 1
+            self.__counts["roi"] += 1
+
+    def get_stats(self):
+        total = self.__counts["roi"] + self.__counts["full"]
+        return {
+            "enabled": self.enabled,
+            "input_size": list(self.input_size),
+            "full_frame_interval": self.full_frame_interval,
+            "roi": self.__counts["roi"],
+            "full": self.__counts["full"],
+            "roi_ratio": self.__counts["roi"] / total if total else 0.,
+        }
@@ -1,279 +1,322 @@
-import google.generativeai as genai
-import time
+import json
 import os
-from config import gemini_api
+import re
+import time
+
+import numpy as np
+
+from utils.flight_log import FLIGHT_LOG_SUFFIX, read_flight_log
+from utils.telemetry import TELEMETRY_FIELDS, TELEMETRY_WIDTH
+
+## 飞行质量评估：在本地用 NumPy 计算各评价维度（稳定性、路径平滑度、姿态控制、异常点），毫秒级完成
+## 大模型只是可选项，用于把计算好的指标润色成总结，不再把整个 XML 日志发送给大模型
+
+# 是否默认使用大模型润色总结（需要 config.gemini_api 与网络代理）
+USE_LLM_SUMMARY = False
+
+# 各维度的评分阈值：指标依次超过这些值时从 5 分逐级扣分，最低 1 分
+VELOCITY_VIBRATION_LEVELS = (0.5, 1.0, 2.0, 4.0)    # 加速度均方根 (m/s^2)
+ROTATE_VIBRATION_LEVELS = (0.1, 0.2, 0.4, 0.8)      # 角速度均方根 (rad/s)
+JERK_LEVELS = (1.0, 2.5, 5.0, 10.0)                 # 加加速度均方根 (m/s^3)
+ATTITUDE_ADJUSTMENT_RATE_LEVELS = (0.5, 1.0, 2.0, 4.0)  # 每秒姿态调整次数
+TILT_LEVELS = (0.15, 0.3, 0.5, 0.8)                 # 最大倾斜角 (rad)
+
+ATTITUDE_ADJUSTMENT_THRESHOLD = 0.1     # 相邻两次测量中 pitch/roll/yaw 变化不小于此值记一次姿态调整 (rad)
+MIN_CURVATURE_SPEED = 0.5               # 速度低于此值时不计算曲率 (m/s)
+OUTLIER_Z = 3.5                         # 稳健 z 分数（中位数 / MAD）超过此值为异常点
+# 异常点的绝对下限，悬停时波动很小，避免把传感器噪声当成异常
+OUTLIER_FLOORS = {"acceleration": 1.0, "angular_velocity": 0.3, "jerk": 5.0}
+OUTLIER_UNITS = {"acceleration": "m/s^2", "angular_velocity": "rad/s", "jerk": "m/s^3"}
+
+SCORE_WORDS = {5: "excellent", 4: "good", 3: "fair", 2: "poor", 1: "bad"}
+
+
+def load_flight_data(log):
+    """
+    飞行记录 -> (时间戳 [n], 遥测数值 [n, TELEMETRY_WIDTH])
+    log: 记录文件路径（stop_logging 的返回值）、XML 字符串（stop_monitoring 的返回值）、
+         记录格式的字典列表，或 (时间戳, 数值) 元组
+    """
+    if isinstance(log, str) and log.endswith(FLIGHT_LOG_SUFFIX):
+        _, timestamps, values = read_flight_log(log)
+        return timestamps, values
+    if isinstance(log, str):
+        # 叶子节点的文本按文档顺序依次为：时间戳、位置、速度、姿态角、角速度，与遥测数值的列顺序一致
+        texts = re.findall(r">([^<>\s][^<>]*)</", log)
+        records = np.array(texts, dtype=np.float64).reshape(-1, 1 + TELEMETRY_WIDTH)
+        return records[:, 0], records[:, 1:]
+    if isinstance(log, tuple):
+        timestamps, values = log
+        return np.asarray(timestamps, dtype=np.float64), np.asarray(values, dtype=np.float64).reshape(-1, TELEMETRY_WIDTH)
+    timestamps = np.array([entry["timestamp"] for entry in log], dtype=np.float64)
+    values = np.array([[v for name in TELEMETRY_FIELDS for v in entry[name]] for entry in log],
+                      dtype=np.float64).reshape(len(log), TELEMETRY_WIDTH)
+    return timestamps, values
+
+
+def _score(value, levels):
+    """指标越小越好，每超过一个阈值扣一分"""
+    return 5 - int(np.searchsorted(levels, value, side="right"))
+
+
+def _rms(x):
+    return float(np.sqrt(np.mean(np.sum(np.square(x), axis=-1)))) if len(x) else 0.
+
+
+def _outlier_events(times, magnitude, floor):
+    """稳健 z 分数找出异常点，相邻的异常点合并为一次事件 -> [(开始时间, 结束时间, 峰值)]"""
+    if len(magnitude) < 3:
+        return []
+    median = np.median(magnitude)
+    mad = np.median(np.abs(magnitude - median))
+    z = 0.6745 * (magnitude - median) / max(mad, 1e-9)
+    flags = (z > OUTLIER_Z) & (magnitude > floor)
+    if not flags.any():
+        return []
+    # 连续为 True 的区段
+    edges = np.flatnonzero(np.diff(np.concatenate([[0], flags.astype(np.int8), [0]])))
+    return [(float(times[s]), float(times[e - 1]), float(magnitude[s:e].max()))
+            for s, e in zip(edges[::2], edges[1::2])]
+
+
+def analyze_flight(log):
+    """
+    计算飞行质量指标
+    log: 见 load_flight_data
+    返回: 指标字典（只含数字、字符串与列表，可直接序列化为 JSON）
+    """
+    timestamps, values = load_flight_data(log)
+    n = len(timestamps)
+    metrics = {"samples": n}
+    if n < 2:
+        metrics["duration"] = 0.
+        return metrics
+
+    t = timestamps - timestamps[0]
+    # 时间戳重复时（同一节拍）用很小的间隔代替，避免除零
+    t = np.maximum.accumulate(t) + np.arange(n) * 1e-6
+    position = values[:, TELEMETRY_FIELDS["position"]]
+    velocity = values[:, TELEMETRY_FIELDS["velocity"]]
+    euler = values[:, TELEMETRY_FIELDS["euler_angles"]]
+    angular_velocity = values[:, TELEMETRY_FIELDS["angular_velocity"]]
+
+    # 加速度、加加速度由速度差分得到（比对位置做三次差分噪声小）
+    acceleration = np.gradient(velocity, t, axis=0)
+    jerk = np.gradient(acceleration, t, axis=0)
+    speed = np.linalg.norm(velocity, axis=1)
+
+    # 路径：长度、位移、直线度、曲率 |v x a| / |v|^3
+    steps = np.linalg.norm(np.diff(position, axis=0), axis=1)
+    path_length = float(steps.sum())
+    displacement = float(np.linalg.norm(position[-1] - position[0]))
+    moving = speed > MIN_CURVATURE_SPEED
+    curvature = (np.linalg.norm(np.cross(velocity[moving], acceleration[moving]), axis=1)
+                 / speed[moving] ** 3)
+
+    # 姿态：相邻测量的角度变化（yaw 跨越 ±pi 时取最短差值）
+    delta = np.diff(euler, axis=0)
+    delta = (delta + np.pi) % (2 * np.pi) - np.pi
+    unwrapped = euler[0] + np.concatenate([np.zeros((1, 3)), np.cumsum(delta, axis=0)])
+    adjustments = int(np.count_nonzero(np.any(np.abs(delta) >= ATTITUDE_ADJUSTMENT_THRESHOLD, axis=1)))
+    tilt = np.max(np.abs(euler[:, :2]), axis=1)
+    yaw_change = float(np.abs(delta[:, 2]).sum())
+
+    duration = float(t[-1])
+    metrics.update({
+        "duration": duration,
+        "path_length": path_length,
+        "displacement": displacement,
+        "straightness": displacement / path_length if path_length > 1e-6 else 1.,
+        "speed_mean": float(speed.mean()),
+        "speed_max": float(speed.max()),
+        "speed_std": float(speed.std()),
+        "velocity_latest": velocity[-1].tolist(),
+        "velocity_std": velocity.std(axis=0).tolist(),
+        "angular_velocity_std": angular_velocity.std(axis=0).tolist(),
+        # 与原实时评估提示词中的定义一致：加速度 / 角速度的均方根
+        "velocity_vibration": _rms(acceleration),
+        "rotate_vibration": _rms(angular_velocity),
+        "jerk_rms": _rms(jerk),
+        "curvature_mean": float(curvature.mean()) if len(curvature) else 0.,
+        "curvature_max": float(curvature.max()) if len(curvature) else 0.,
+        "attitude_latest": euler[-1].tolist(),
+        "attitude_range": (unwrapped.max(axis=0) - unwrapped.min(axis=0)).tolist(),
+        "attitude_adjustments": adjustments,
+        "attitude_adjustment_rate": adjustments / duration if duration > 0 else 0.,
+        "tilt_max": float(tilt.max()),
+        "yaw_change": yaw_change,
+    })
+
+    # 异常点：加速度、角速度、加加速度的突变；一次突变会同时影响几个量的相邻采样，间隔不超过两个采样周期的合并为一个异常
+    events = []
+    for name, magnitude in (("acceleration", np.linalg.norm(acceleration, axis=1)),
+                            ("angular_velocity", np.linalg.norm(angular_velocity, axis=1)),
+                            ("jerk", np.linalg.norm(jerk, axis=1))):
+        events.extend((start, end, name, peak) for start, end, peak in _outlier_events(t, magnitude, OUTLIER_FLOORS[name]))
+    events.sort()
+    gap = 2 * float(np.median(np.diff(t)))
+    anomalies = []
+    for start, end, name, peak in events:
+        if anomalies and start <= anomalies[-1]["end"] + gap:
+            anomaly = anomalies[-1]
+            anomaly["end"] = max(anomaly["end"], end)
+        else:
+            anomaly = {"start": start, "end": end, "peaks": {}}
+            anomalies.append(anomaly)
+        anomaly["peaks"][name] = max(anomaly["peaks"].get(name, 0.), peak)
+    metrics["anomalies"] = anomalies
+
+    metrics["scores"] = score_metrics(metrics)
+    return metrics
+
+
+def score_metrics(metrics):
+    """各维度 1-5 分，metrics 需包含振动等级、加加速度、姿态调整频率与最大倾斜角"""
+    return {
+        "stability": min(_score(metrics["velocity_vibration"], VELOCITY_VIBRATION_LEVELS),
+                         _score(metrics["rotate_vibration"], ROTATE_VIBRATION_LEVELS)),
+        "path_consistency": _score(metrics["jerk_rms"], JERK_LEVELS),
+        "attitude_control": min(_score(metrics["attitude_adjustment_rate"], ATTITUDE_ADJUSTMENT_RATE_LEVELS),
+                                _score(metrics["tilt_max"], TILT_LEVELS)),
+    }
+
+
+def _describe_anomalies(anomalies, limit=3):
+    if not anomalies:
+        return "none"
+    parts = []
+    for a in anomalies[:limit]:
+        when = f"{a['start']:.1f} s" if a["end"] - a["start"] < 0.05 else f"{a['start']:.1f}-{a['end']:.1f} s"
+        peaks = ", ".join(f"{name.replace('_', ' ')} {peak:.2f} {OUTLIER_UNITS[name]}" for name, peak in a["peaks"].items())
+        parts.append(f"sudden change at {when} ({peaks})")
+    if len(anomalies) > limit:
+        parts.append(f"{len(anomalies) - limit} more")
+    return "; ".join(parts)
+
+
+# 各维度得分高 / 低时的优点与建议
+_ADVANTAGES = {"stability": "stable flight", "path_consistency": "smooth path",
+               "attitude_control": "precise attitude control"}
+_SUGGESTIONS = {"stability": "reduce speed and angular velocity fluctuation",
+                "path_consistency": "smooth velocity commands to reduce jerk",
+                "attitude_control": "reduce frequent attitude corrections"}
+
+
+def _summary(metrics):
+    scores = metrics["scores"]
+    overall = min(scores.values())
+    advantages = [_ADVANTAGES[k] for k, v in scores.items() if v >= 4] or ["flight completed"]
+    suggestions = [_SUGGESTIONS[k] for k, v in scores.items() if v <= 3]
+    if metrics["anomalies"]:
+        suggestions.append("strengthen the response to sudden anomalies")
+    return overall, ", ".join(advantages), ", ".join(suggestions) or "keep monitoring"
+
+
+def format_flight_report(metrics):
+    """整段飞行的评估报告，格式与原大模型提示词中的 OutputFormat 相同"""
+    if metrics["samples"] < 2:
+        return "Flight log analysis:\n  Not enough data to evaluate the flight."
+    scores = metrics["scores"]
+    overall, advantages, suggestions = _summary(metrics)
+    return "\n".join([
+        "Flight log analysis:",
+        "Data change trends:",
+        f"  Duration: {metrics['duration']:.1f} s, {metrics['samples']} samples, path length "
+        f"{metrics['path_length']:.2f} m (displacement {metrics['displacement']:.2f} m).",
+        f"  Speed: mean {metrics['speed_mean']:.2f} m/s, max {metrics['speed_max']:.2f} m/s, "
+        f"fluctuation (std) {metrics['speed_std']:.2f} m/s.",
+        f"  Attitude: pitch/roll/yaw range ({', '.join(f'{v:.2f}' for v in metrics['attitude_range'])}) rad, "
+        f"max tilt {metrics['tilt_max']:.2f} rad.",
+        "Multi-dimensional evaluation:",
+        f"  Flight stability: Score: {scores['stability']} (velocity vibration {metrics['velocity_vibration']:.2f} m/s^2, "
+        f"rotate vibration {metrics['rotate_vibration']:.2f} rad/s)",
+        f"  Flight path consistency: Score: {scores['path_consistency']} (RMS jerk {metrics['jerk_rms']:.2f} m/s^3, "
+        f"mean curvature {metrics['curvature_mean']:.3f} 1/m, straightness {metrics['straightness']:.2f})",
+        f"  Attitude control ability: Score: {scores['attitude_control']} ({metrics['attitude_adjustments']} attitude "
+        f"adjustments, {metrics['attitude_adjustment_rate']:.2f} per second)",
+        f"  Anomaly identification: Anomalies {len(metrics['anomalies'])} are found. "
+        f"Specific description: {_describe_anomalies(metrics['anomalies'])}.",
+        "Summary report:",
+        f"  The flight takes {metrics['duration']:.0f} seconds, the overall performance is: {SCORE_WORDS[overall]}.",
+        f"  Main advantages: {advantages}.",
+        f"  Improvement direction: {suggestions}.",
+    ])
+
+
+def format_realtime_report(metrics):
+    """实时飞行状态报告，格式与原实时评估提示词中的 OutputFormat 相同"""
+    if metrics["samples"] < 2:
+        return "Flight status:\n  Not enough data to evaluate the flight."
+    scores = metrics["scores"]
+    overall, advantages, suggestions = _summary(metrics)
+    stable = "Stable" if scores["stability"] >= 4 else "Unstable"
+    smooth = "Smooth" if scores["attitude_control"] >= 4 else "Adjusting"
+    return "\n".join([
+        "Flight status:",
+        f"  Speed: ({', '.join(f'{v:.2f}' for v in metrics['velocity_latest'])})",
+        f"  Attitude: ({', '.join(f'{v:.2f}' for v in metrics['attitude_latest'])}) {smooth}",
+        f"  Stability: ({metrics['velocity_vibration']:.2f}, {metrics['rotate_vibration']:.2f}) {stable}",
+        f"  Exception: {_describe_anomalies(metrics['anomalies'], limit=2) if metrics['anomalies'] else 'None'}",
+        "In SUMMARY:",
+        f"  Status: {'Normal' if overall >= 3 and not metrics['anomalies'] else 'Attention'}",
+        f"  Advantages: {advantages}",
+        f"  Suggestion: {suggestions}",
+    ])
+
+
+def summarize_with_llm(metrics, report):
+    """
+    用大模型把预先计算的指标润色为总结，只发送指标（几百字节），不发送飞行日志
+    失败时返回本地生成的报告
+    """
+    try:
+        import google.generativeai as genai
+        from config import gemini_api
+
+        os.environ['http_proxy'] = 'http://127.0.0.1:10809'
+        os.environ['https_proxy'] = 'http://127.0.0.1:10809'
+        os.environ['all_proxy'] = 'socks5://127.0.0.1:10809'
+        genai.configure(api_key=gemini_api, transport='rest')
+        model = genai.GenerativeModel("gemini-2.0-flash-001")
+
+        p = (
+            "You are a UAV flight analysis expert. The flight metrics below were computed from the flight log, "
+            "and the draft report was generated from them. Rewrite the draft into a clearer report, keeping "
+            "exactly the same sections, scores and numbers. Do not invent data. Do not use markdown, and do "
+            "not output anything before or after the report.\n"
+            f"## Metrics\n{json.dumps(metrics, separators=(',', ':'))}\n"
+            f"## Draft report\n{report}\n"
+        )
+        start = time.time()
+        response = model.generate_content(p)
+        print(f"生成总结耗时：{time.time() - start}秒")
+        return response.text
+    except Exception as e:
+        print(f"LLM summary failed, using local report: {e}")
+        return report
+
 
 # 总结整个飞行日志的飞行情况
-def evaluate_all_flight(xml_content: str) -> str:
-    os.environ['http_proxy'] = 'http://127.0.0.1:10809'
-    os.environ['https_proxy'] = 'http://127.0.0.1:10809'
-    os.environ['all_proxy'] = 'socks5://127.0.0.1:10809'
-
-    genai.configure(api_key=gemini_api, transport='rest')
-    model = genai.GenerativeModel("gemini-2.0-flash-001")
-
-    # p = """
-    # # Role: 无人机飞行情况分析专家
-    #
-    # ## Profile
-    # - author: UAVGPT
-    # - version: 1.0
-    # - language: 中文
-    # - description: 你是一名专业的无人机飞行情况分析专家，擅长分析以XML格式记录的飞行日志，提供基于飞行数据的多维度评价，包括位置变化、速度变化、姿态变化等，全面评估无人机的飞行性能与异常情况。
-    #
-    # ## Skills
-    # 1. 分析飞行日志，提取关键飞行数据（如位置、速度、姿态等）。
-    # 2. 根据飞行数据，识别异常情况并提供详细说明。
-    # 3. 从多个维度对飞行性能进行定量和定性评价。
-    # 4. 输出简洁明了的分析报告，供用户参考。
-    #
-    # ## Rules
-    # 1. 将飞行日志解析为时间序列数据，逐项分析每一条记录。
-    # 2. 计算各时间点的关键变化，如速度增量、姿态变化率等。
-    # 3. 提供以下维度的评价：
-    # - **飞行稳定性**：分析速度与角速度的波动范围，波动较小者评分更高。
-    # - **飞行路径一致性**：基于位置变化，评价无人机的路径是否平滑，偏差是否明显。
-    # - **姿态控制能力**：根据角速度与姿态变化趋势，判断无人机的姿态控制是否精准。
-    # - **异常识别**：检测突发的异常数据点或极端值，并加以说明。
-    # 4. 在评价结束后，生成整体飞行情况总结，突出主要优点与改进方向。
-    #
-    # ## Workflows
-    # 1. 接收XML格式的飞行日志，并解析其内容。
-    # 2. 提取各时间点的关键信息（位置、速度、姿态等）。
-    # 3. 根据飞行数据，逐维度生成评分和评价。
-    # 4. 综合数据，输出以下内容：
-    # - 多维度评价与评分。
-    # - 总结报告，概述无人机飞行性能与改进建议。
-    #
-    # ## OutputFormat
-    # 1. 分析报告以以下格式输出：
-    # 飞行日志分析：
-    #   数据变化趋势（如速度、姿态、路径等）。
-    # 多维度评价：
-    #   飞行稳定性：评分：1-5分（{评分依据}）
-    #   飞行路径一致性：评分：1-5分（{评分依据}）
-    #   姿态控制能力：评分：1-5分（{评分依据}）
-    #   异常识别：发现异常 {异常点数量} 个，具体说明：{说明}。
-    # 总结报告：
-    #   本次飞行的整体表现为：{评价概述}。
-    #   主要优点：{优点概述}。
-    #   改进方向：{改进建议}。
-    # 2. 确保输出条理清晰，格式简洁，便于阅读与理解。
-    # 3. 请你不要在首末输出任何多余的内容
-    # 4. 请你严格按照要求生成，不要生成md格式的
-    #
-    # ## 示例
-    # 飞行日志分析：
-    # 数据变化趋势：
-    #   速度：整体平稳，仅在第3秒出现小幅波动。
-    #   姿态：保持良好控制，偏航角变化范围在0.1以内。
-    #
-    # 多维度评价：
-    #   飞行稳定性：评分：4分（速度与角速度波动小，表现稳定）
-    #   飞行路径一致性：评分：5分（路径平滑，无明显偏差）
-    #   姿态控制能力：评分：4分（姿态控制较好，无突发偏差）
-    #   异常识别：发现异常 1 个，具体说明：Z轴速度在第5秒出现突增。
-    #
-    # 总结报告：
-    #   本次飞行时间耗时30s，整体表现为优秀，适合稳定飞行场景。
-    #   主要优点：飞行稳定、路径一致性高。
-    #   改进方向：加强对突发异常的响应能力。
-    # """
-    p = """
-    # Role: Expert in drone flight analysis
-    ## Profile
-    - author: UAVGPT
-    - version: 1.0
-    - language: English
-    - description: You are a professional UAV flight analysis expert, good at analyzing flight logs recorded in XML format, providing multidimensional evaluation based on flight data, including position change, speed change, attitude change, etc., to comprehensively evaluate UAV flight performance and abnormal conditions.
-    ## Skills
-    1. Analyze flight logs and extract key flight data (such as position, speed, attitude, etc.).
-    2. Identify anomalies and provide detailed descriptions based on flight data.
-    3. Conduct quantitative and qualitative evaluation of flight performance from multiple dimensions.
-    4. Output concise and clear analysis report for users' reference.
-    ## Rules
-    1. Analyze flight logs into time series data and analyze each record item by item.
-    2. Calculate key changes at each time point, such as speed increment, attitude change rate, etc.
-    3. Provide evaluations in the following dimensions:
-    - ** Flight Stability ** : The fluctuation range of speed and angular speed is analyzed, and the smaller fluctuation is scored higher.
-    - ** Flight path consistency ** : Based on position changes, evaluate whether the path of the UAV is smooth and whether the deviation is obvious.
-    - ** Attitude control ability ** : According to the angular velocity and attitude change trend, determine whether the attitude control of the UAV is accurate.
-    - ** Anomaly recognition ** : Detect bursts of abnormal data points or extreme values and explain them.
-    4. After the evaluation, generate a summary of the overall flight situation and highlight the main advantages and improvement directions.
-    ## Workflows
-    1. Receive flight logs in XML format and parse their contents.
-    2. Extract key information (position, speed, attitude, etc.) at each time point.
-    3. Generate dimensional-by-dimension scores and evaluations based on flight data.
-    4. Synthesize the data and output the following:
-    - Multi-dimensional evaluation and scoring.
-    - Summary report outlining UAV flight performance and recommendations for improvement.
-    ## OutputFormat
-    1. The analysis report is output in the following format:
-    Flight log analysis:
-      Data change trends (such as speed, attitude, path, etc.).Do not use a timestamp description, use a description in seconds
-    Multi-dimensional evaluation:
-      Flight Stability: Score: 1-5 ({based on score})
-      Flight path consistency: Score: 1-5 ({based on score})
-      Attitude control ability: Score: 1-5 ({based on score})
-      Anomaly identification: Anomalies {number of outliers} are found. Specific description: {description}.
-    Summary report:
-      The overall performance of this flight is: {Evaluation overview}.
-      Main advantages: {Overview of benefits}.
-      Improvement direction: {Improvement suggestions}.
-    2. Ensure that the output is clearly organized, concise and easy to read and understand.
-    3. Please do not output any superfluous content at the beginning and end
-    4. Please strictly follow the requirements to generate, do not generate md format
-    ## Example
-    Flight log analysis:
-    Data change trends:
-      Speed: Overall smooth, with only a small fluctuation in the 5rd second.
-      Attitude: Maintain good control, yaw Angle change range within 0.1.
-    Multi-dimensional evaluation:
-      Flight stability: Score: 4 (low fluctuation in speed and angular velocity, stable performance)
-      Flight path consistency: Score: 5 (smooth path, no significant deviation)
-      Attitude conttakes 30 seconds, the overall performance is excellent, suitable for stable flight scenarios.
-      Main advantages: stable flight, high path consistency.
-      Improvement directrol ability: Score: 4 (good attitude control, no sudden deviation)
-      Anomaly recognition: 1 anomaly was found, specifically indicating that the Z-axis speed increased sharply in the 5th second.
-    Summary report:
-      The flight time ion: strengthen the ability to respond to sudden anomalies.
-       """
-
-    p += f"\n## Input\n```xml\n{xml_content}\n```"
-
-    # 统计生成耗时
-    start = time.time()
-    #print(p)
-
-    response = model.generate_content(p)
-
-    end = time.time()
-    print(f"生成总结耗时：{end - start}秒")
-
-    #print(response.text)
-
-    return response.text
+def evaluate_all_flight(xml_content, use_llm=None) -> str:
+    """
+    xml_content: stop_logging 返回的记录文件路径，也可以是 XML 字符串、记录格式的字典列表或 (时间戳, 数值) 元组
+    use_llm: 是否用大模型润色总结，默认为 USE_LLM_SUMMARY
+    """
+    metrics = analyze_flight(xml_content)
+    report = format_flight_report(metrics)
+    if USE_LLM_SUMMARY if use_llm is None else use_llm:
+        report = summarize_with_llm(metrics, report)
+    return report
 
 
 # 总结实时飞行日志的飞行情况
-def evaluate_realtime_flight(xml_content: str) -> str:
-    os.environ['http_proxy'] = 'http://127.0.0.1:10809'
-    os.environ['https_proxy'] = 'http://127.0.0.1:10809'
-    os.environ['all_proxy'] = 'socks5://127.0.0.1:10809'
-
-    genai.configure(api_key=gemini_api, transport='rest')
-    model = genai.GenerativeModel("gemini-2.0-flash-001")
-
-    # p = """
-    #   # Role: 无人机飞行实时状态分析专家
-    #
-    #   ## Profile
-    #   - author: UAVGPT
-    #   - version: 1.0
-    #   - language: 中文
-    #   - description: 你是一名专业的无人机飞行实时状态分析专家，擅长分析实时飞行数据，提供简单明了的飞行状态评价，包括飞行稳定性、速度变化、姿态控制等，帮助用户即时了解无人机的飞行情况。
-    #
-    #   ## Skills
-    #   1. 分析实时飞行数据，识别飞行状态。
-    #   2. 根据飞行数据，提供飞行稳定性、姿态控制等方面的即时反馈。
-    #   3. 输出简洁明了的飞行状态评价，便于快速判断飞行表现。
-    #
-    #   ## Rules
-    #   1. 分析实时飞行数据，包括位置、速度、姿态等关键信息。
-    #   2. 评估飞行稳定性、姿态控制、速度变化等，识别任何明显的异常。
-    #   3. 输出简单、易懂的飞行状态评价，帮助用户判断飞行表现。
-    #
-    #   ## Workflows
-    #   1. 接收XML格式的飞行日志，并解析其内容。
-    #   2. 利用相关的公式计算飞行数据变化，如速度变化、姿态变化等。
-    #   3. 提供即时反馈，包括飞行稳定性、姿态控制等方面的评价。
-    #   4. 输出简洁的飞行状态报告，描述飞行情况。
-    #
-    #   ## OutputFormat
-    #   1. 输出格式：
-    #     飞行状态：
-    #       速度：(vx,vy,vz) (保留两位小数)
-    #       姿态：(pitch,row,yaw)(保留两位小数)
-    #       稳定性：(Vecility_Vibration, Rotate_Vibration_Level)(保留两位小数){稳定}
-    #       异常：{无人机的异常(无需指出时间)}
-    #
-    #     总结：
-    #       状态：{状态}
-    #       优点：{优点}
-    #       建议：{建议}
-    #
-    #  2. 要求所有输出应保持简洁，确保用户快速理解。
-    #  3. $Vecility Vibration Level=\sqrt{\frac{1}{n}{ \sum_{i=1}^n a_i^{2}}} a_i=第i时刻的加速度$
-    #  4. $Rotate Vibration Level=\sqrt{\frac{1}{n}{ \sum_{i=1}^n (yaw_i^{2} + roll_i^{2} + pitch_i^{2} )}} a_i=第i时刻的加速度$
-    #  5. 请你不要在首末输出任何多余的内容，```之类的符号也不要输出
-    #   ## 示例
-    #   飞行状态：
-    #     速度：(1.00,2.00,-4.00)
-    #     姿态：(0.00,0.00,0.55) 平稳
-    #     稳定性：(0.23, 0.45) 良好
-    #     异常：无 / 有剧烈晃动
-    #
-    #     总结：
-    #     状态：正常
-    #     优点：平稳飞行
-    #     建议：持续监控
-    # """
-
-    p = """
-        # Role: Drone flight real-time status analysis expert
-        ## Profile
-        - author: UAVGPT
-        - version: 1.0
-        - language: English
-        - description: You are a professional UAV flight real-time status analysis expert, good at analyzing real-time flight data, providing simple and clear flight status evaluation, including flight stability, speed change, attitude control, etc., to help users instantly understand the flight situation of the UAV.
-        ## Skills
-        1. Analyze real-time flight data to identify flight status.
-        2. Provide immediate feedback on flight stability, attitude control, etc., based on flight data.
-        3. Output simple and clear flight status evaluation, easy to quickly judge flight performance.
-        ## Rules
-        1. Analyze real-time flight data, including position, speed, attitude and other key information.
-        2. Evaluate flight stability, attitude control, speed changes, etc., and identify any obvious anomalies.
-        3. Output simple and easy to understand flight status evaluation to help users judge flight performance.
-        ## Workflows
-        1. Receive flight logs in XML format and parse their contents.
-        2. Use relevant formulas to calculate flight data changes, such as speed changes, attitude changes, etc.
-        3. Provide immediate feedback, including evaluation of flight stability, attitude control, etc.
-        4. Output a concise flight status report to describe the flight situation.
-        ## OutputFormat
-        1. Output format:
-        Flight status:
-          Speed: (vx,vy,vz) (two decimal places reserved)
-          Attitude: (pitch,row,yaw)(two decimal places reserved)
-          Stability: (Vecility_Vibration, Rotate_Vibration_Level)(two decimal places reserved){Stable}
-          Exception: {Abnormal drone (no need to indicate time)}
-        In SUMMARY:
-          Status: {Status}
-          Advantages: {Advantages}
-          Suggestion: {Suggestion}
-        2. All outputs should be kept concise to ensure quick user understanding.
-        3. $Vecility Vibration Level = \ SQRT {\ frac {1} {n} {\ sum_ {I = 1} ^ n a_i ^ {2}}} a_i = the moment I acceleration $
-        4. $Rotate Vibration Level = \ SQRT {\ frac {1} {n} {\ sum_ {I = 1} ^ n (yaw_i ^ {2} + roll_i ^ {2} + pitch_i ^ {2})}} a_i = the moment I acceleration $
-        5. Please do not output any superfluous content at the beginning and end, and do not output symbols such as"
-        ## Example
-        Flight status:
-          Speed: (1.00,2.00,-4.00)
-          Attitude: (0.00,0.00,0.55) Smooth
-          Stability: (0.23, 0.45) Good
-          Exception: None or the system wobbles violently
-        In SUMMARY:
-          Status: Normal
-          Advantages: Smooth flight
-          Suggestion: Keep monitoring
-        """
-
-    p += f"\n## Input\n```xml\n{xml_content}\n```"
-
-    # 统计生成耗时
-    start = time.time()
-
-    response = model.generate_content(p)
-
-    end = time.time()
-    #print(f"生成实时总结耗时：{end - start}秒")
-
-    return response.text
+def evaluate_realtime_flight(xml_content, use_llm=None) -> str:
+    """
+    xml_content: stop_monitoring 返回的 XML 字符串，也可以是记录格式的字典列表或 (时间戳, 数值) 元组
+    use_llm: 是否用大模型润色总结，默认为 USE_LLM_SUMMARY
+    """
+    metrics = analyze_flight(xml_content)
+    report = format_realtime_report(metrics)
+    if USE_LLM_SUMMARY if use_llm is None else use_llm:
+        report = summarize_with_llm(metrics, report)
+    return report
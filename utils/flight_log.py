@@ -0,0 +1,171 @@
+import json
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+
+from utils.telemetry import TELEMETRY_FIELDS, TELEMETRY_WIDTH, sample_entry
+
+## 飞行记录：飞行中逐条追加写入的二进制记录文件，停止记录时无需再整体序列化；需要时再导出为 XML
+## 文件格式：
+##   8 字节魔数 | 4 字节头部长度 (uint32, 小端) | JSON 头部（字段名、根节点名、开始时间等）
+##   之后为定长记录，每条 1 + TELEMETRY_WIDTH 个 float64（小端）：时间戳 + 遥测数值
+## 程序崩溃时最多丢失最后一条不完整的记录，读取时会被忽略
+
+FLIGHT_LOG_MAGIC = b"UAVLOG\x00\x01"
+FLIGHT_LOG_SUFFIX = ".uavlog"
+RECORD_WIDTH = 1 + TELEMETRY_WIDTH
+RECORD_DTYPE = np.dtype("<f8")
+
+# XML 中每个字段的节点名与子节点名，与原来 _save_to_xml 的输出一致
+XML_LAYOUT = (
+    ("position", "Position", ("X", "Y", "Z")),
+    ("velocity", "Velocity", ("VX", "VY", "VZ")),
+    ("euler_angles", "EulerAngles", ("Pitch", "Roll", "Yaw")),
+    ("angular_velocity", "AngularVelocity", ("RollRate", "PitchRate", "YawRate")),
+)
+
+
+class FlightLogWriter(object):
+    def __init__(self, path, root="UAVLogs", interval=None, flush_interval=1.0, flush_rows=64):
+        """
+        path: 记录文件路径
+        root: 导出 XML 时的根节点名
+        interval: 记录间隔（秒），只写入头部供参考
+        flush_interval / flush_rows: 缓存的记录超过此时间（秒）或条数时写入文件
+        """
+        folder_path = os.path.dirname(path)
+        if folder_path and not os.path.exists(folder_path):
+            os.makedirs(folder_path)
+        self.path = path
+        self.flush_interval = flush_interval
+        self.flush_rows = flush_rows
+        self.count = 0
+        self.__record = struct.Struct("<%dd" % RECORD_WIDTH)
+        self.__pending = bytearray()
+        self.__pending_rows = 0
+        self.__last_flush = time.perf_counter()
+        self.__lock = threading.Lock()     # 采样线程写入，停止记录时由其它线程关闭
+
+        header = json.dumps({
+            "version": 1,
+            "root": root,
+            "fields": ["timestamp"] + [f"{name}[{i}]" for name, columns in TELEMETRY_FIELDS.items()
+                                       for i in range(columns.stop - columns.start)],
+            "start_time": time.time(),
+            "interval": interval,
+        }).encode("utf-8")
+        self.__file = open(path, "wb")
+        self.__file.write(FLIGHT_LOG_MAGIC + struct.pack("<I", len(header)) + header)
+        self.__file.flush()
+
+    @property
+    def closed(self):
+        return self.__file.closed
+
+    def write(self, timestamp, row):
+        """追加一条记录，row 为长度 TELEMETRY_WIDTH 的遥测数值"""
+        with self.__lock:
+            if self.__file.closed:
+                return
+            self.__pending += self.__record.pack(timestamp, *row)
+            self.__pending_rows += 1
+            self.count += 1
+            if self.__pending_rows >= self.flush_rows or time.perf_counter() - self.__last_flush >= self.flush_interval:
+                self.__flush()
+
+    def write_entry(self, entry):
+        """追加一条记录格式的字典（见 telemetry.sample_entry）"""
+        self.write(entry["timestamp"], [v for name in TELEMETRY_FIELDS for v in entry[name]])
+
+    def flush(self):
+        with self.__lock:
+            self.__flush()
+
+    def __flush(self):
+        if self.__pending and not self.__file.closed:
+            self.__file.write(self.__pending)
+            self.__file.flush()
+        self.__pending.clear()
+        self.__pending_rows = 0
+        self.__last_flush = time.perf_counter()
+
+    def close(self):
+        with self.__lock:
+            if not self.__file.closed:
+                self.__flush()
+                self.__file.close()
+
+
+def read_flight_log(path):
+    """
+    读取记录文件
+    返回: (头部字典, 时间戳 [n], 遥测数值 [n, TELEMETRY_WIDTH])
+    """
+    with open(path, "rb") as f:
+        if f.read(len(FLIGHT_LOG_MAGIC)) != FLIGHT_LOG_MAGIC:
+            raise ValueError(f"{path} is not a flight log")
+        header_size, = struct.unpack("<I", f.read(4))
+        header = json.loads(f.read(header_size).decode("utf-8"))
+        data = f.read()
+    # 忽略末尾不完整的记录
+    rows = len(data) // (RECORD_WIDTH * RECORD_DTYPE.itemsize)
+    records = np.frombuffer(data, dtype=RECORD_DTYPE, count=rows * RECORD_WIDTH).reshape(rows, RECORD_WIDTH)
+    return header, records[:, 0].copy(), records[:, 1:].copy()
+
+
+def flight_log_entries(path):
+    """读取记录文件 -> 与原来记录格式相同的字典列表"""
+    _, timestamps, values = read_flight_log(path)
+    return [sample_entry(float(t), row) for t, row in zip(timestamps, values)]
+
+
+def telemetry_to_xml(timestamps, values, root="UAVLogs"):
+    """
+    时间戳与遥测数值 -> 格式化的 XML 字符串
+    直接拼接字符串，输出与 ElementTree + minidom.toprettyxml(indent="  ") 的结果逐字节相同
+    """
+    if len(timestamps) == 0:
+        return f'<?xml version="1.0" ?>\n<{root}/>\n'
+
+    # 每条记录的模板，数值按 str(float) 格式化
+    lines = ["  <LogEntry>", "    <Timestamp>{}</Timestamp>"]
+    for name, tag, children in XML_LAYOUT:
+        lines.append(f"    <{tag}>")
+        lines.extend(f"      <{child}>{{}}</{child}>" for child in children)
+        lines.append(f"    </{tag}>")
+    lines.append("  </LogEntry>")
+    template = "\n".join(lines) + "\n"
+
+    columns = [TELEMETRY_FIELDS[name] for name, _, _ in XML_LAYOUT]
+    order = np.concatenate([np.arange(c.start, c.stop) for c in columns])
+    rows = np.column_stack([np.asarray(timestamps, dtype=np.float64),
+                            np.asarray(values, dtype=np.float64)[:, order]]).tolist()
+    body = "".join(template.format(*map(str, row)) for row in rows)
+    return f'<?xml version="1.0" ?>\n<{root}>\n{body}</{root}>\n'
+
+
+def entries_to_xml(entries, root="UAVLogs"):
+    """记录格式的字典列表 -> 格式化的 XML 字符串"""
+    timestamps = [entry["timestamp"] for entry in entries]
+    values = np.array([[v for name in TELEMETRY_FIELDS for v in entry[name]] for entry in entries],
+                      dtype=np.float64).reshape(len(entries), TELEMETRY_WIDTH)
+    return telemetry_to_xml(timestamps, values, root)
+
+
+def export_flight_log_xml(path, xml_path=None):
+    """
+    将记录文件导出为 XML
+    xml_path: XML 文件路径，默认与记录文件同名；传入空字符串时只返回 XML 字符串，不写文件
+    返回: XML 字符串
+    """
+    header, timestamps, values = read_flight_log(path)
+    formatted_xml = telemetry_to_xml(timestamps, values, header.get("root", "UAVLogs"))
+    if xml_path is None:
+        xml_path = os.path.splitext(path)[0] + ".xml"
+    if xml_path:
+        with open(xml_path, "w", encoding="utf-8") as xml_file:
+            xml_file.write(formatted_xml)
+    return formatted_xml
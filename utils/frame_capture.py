@@ -0,0 +1,112 @@
+import threading
+import time
+from collections import deque
+
+
+# 异步采集线程：不断从图像客户端取帧放入有界环形缓冲区，工作循环只取最新的一帧
+class FrameCapture:
+    def __init__(self, capture_fn, buffer_size=4):
+        """
+        capture_fn: 取一帧图像的函数，如 UAVController.get_origin_frame
+        buffer_size: 环形缓冲区大小，只保留最近的几帧
+        """
+        self.__capture_fn = capture_fn
+        self.__buffer = deque(maxlen=buffer_size)   # (帧序号, 采集时间, 图像)
+        self.__condition = threading.Condition()
+        self.__thread = None
+        self.__stop_event = None    # 每个采集线程各自的停止事件，重新 start 时旧线程仍会退出
+
+        self.__captured = 0         # 采集到的帧数
+        self.__consumed = 0         # 被工作循环取走的帧数
+        self.__dropped = 0          # 没被取走就被更新的帧覆盖的帧数
+        self.__last_seq = 0         # 上一次取走的帧序号
+        self.__last_age = 0.        # 上一次取走的帧的帧龄（秒）
+        self.__capture_time = 0.    # 最近一次采集的耗时（秒）
+        self.__errors = 0           # 采集失败次数
+
+    def start(self):
+        if self.is_running():
+            return
+        self.__stop_event = threading.Event()
+        self.__thread = threading.Thread(target=self.__run, args=(self.__stop_event,), daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        if self.__stop_event is not None:
+            self.__stop_event.set()
+        with self.__condition:
+            self.__condition.notify_all()
+        if self.__thread is not None and self.__thread is not threading.current_thread():
+            self.__thread.join(timeout=1.0)
+        self.__thread = None
+
+    def is_running(self):
+        return self.__stop_event is not None and not self.__stop_event.is_set()
+
+    # 采集线程
+    def __run(self, stop_event):
+        while not stop_event.is_set():
+            t0 = time.time()
+            try:
+                frame = self.__capture_fn()
+            except Exception as e:
+                # 仿真器未就绪或RPC超时，稍后重试
+                self.__errors += 1
+                print(f"Frame capture failed: {e}")
+                stop_event.wait(0.1)
+                continue
+            t1 = time.time()
+
+            with self.__condition:
+                # 已停止的线程（如 capture_fn 超时后才返回）不再写入缓冲区
+                if stop_event.is_set():
+                    break
+                self.__captured += 1
+                self.__capture_time = t1 - t0
+                self.__buffer.append((self.__captured, t1, frame))
+                self.__condition.notify_all()
+
+    def get_latest_frame(self, timeout=1.0):
+        """
+        取最新的一帧，如果没有比上次更新的帧则最多等待 timeout 秒
+        返回: 图像，超时或已停止时返回 None
+        """
+        with self.__condition:
+            if not self.__condition.wait_for(
+                    lambda: not self.is_running() or (self.__buffer and self.__buffer[-1][0] > self.__last_seq),
+                    timeout=timeout):
+                return None
+            if not self.__buffer or self.__buffer[-1][0] <= self.__last_seq:
+                return None
+
+            seq, timestamp, frame = self.__buffer[-1]
+            # 两次取帧之间被跳过的帧都算作丢弃
+            self.__dropped += seq - self.__last_seq - 1
+            self.__consumed += 1
+            self.__last_seq = seq
+            self.__last_age = time.time() - timestamp
+            return frame
+
+    def get_recent_frames(self):
+        """
+        返回缓冲区中最近的几帧 [(采集时间, 图像), ...]，按时间从旧到新
+        """
+        with self.__condition:
+            return [(timestamp, frame) for _, timestamp, frame in self.__buffer]
+
+    def get_frame_age(self):
+        """
+        上一次取走的帧从采集完成到被取走经过的时间（秒）
+        """
+        return self.__last_age
+
+    def get_stats(self):
+        with self.__condition:
+            return {
+                "captured": self.__captured,
+                "consumed": self.__consumed,
+                "dropped": self.__dropped,
+                "errors": self.__errors,
+                "frame_age": self.__last_age,
+                "capture_time": self.__capture_time,
+            }
@@ -975,10 +975,10 @@ class MainWindow(QWidget):
         if self.record_state_flag:
             self.record_state_flag = False
             self.btn_record_state.setText("Record\nstatus")
-            log_data = self.fpv_uav.stop_logging()
+            log_path = self.fpv_uav.stop_logging()
 
-            # 主线程中更新初始状态
-            self.thread = EvaluationThread(log_data)
+            # 读取记录、导出 XML 与评估都在后台线程中进行
+            self.thread = EvaluationThread(log_path)
             self.thread.evaluation_signal.connect(self.update_status_text)
             self.thread.start()
 
@@ -1069,16 +1069,8 @@ class MainWindow(QWidget):
         if frame.shape == (self.fpv_uav_resolution_ratio[1], self.fpv_uav_resolution_ratio[0], 3):
             # 保存图片
             if self.capture_flag:
-                capture_dict = self.fpv_uav.get_all_frame()
-                # 保存所有已存在的多模态图片
-                for key,val in capture_dict.items():
-                    path = "data/capture_imgs/" + key
-                    filename = "capture_" + key + "_" + str(datetime.now().strftime('date_%m_%d_%H_%M_%S')) + "_" + ".png"
-                    save_name = path + "/" + filename
-                    create_directory_if_not_exists(path)  # 创建目录
-
-                    cv2.imwrite(save_name, val)
-                print("Successful captured!")
+                # 一次请求获取所有多模态图片，在后台解码并保存，不阻塞界面
+                self.fpv_uav.capture_all_async()
                 # save_name = "data/capture_imgs/capture_" + str(
                 #     datetime.now().strftime('date_%m_%d_%H_%M_%S')) + ".png"
                 # if cv2.imwrite(save_name, frame):
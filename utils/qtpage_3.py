@@ -1095,10 +1095,10 @@ class ModernDroneUI(QMainWindow):
             self.record_state_flag = False
             self.append_system_message("Stop recording.")
             self.btn_record_state.setText("Start Recording")
-            log_data = self.fpv_uav.stop_logging()
+            log_path = self.fpv_uav.stop_logging()
 
-            # Update initial state in the main thread
-            self.thread = EvaluationThread(log_data)
+            # Read the log, export the XML and evaluate in a background thread
+            self.thread = EvaluationThread(log_path)
             self.thread.evaluation_signal.connect(self.append_system_message)
             self.thread.start()
 
@@ -1782,16 +1782,8 @@ class ModernDroneUI(QMainWindow):
         if frame.shape == (self.fpv_uav_resolution_ratio[1], self.fpv_uav_resolution_ratio[0], 3):
             # Save image
             if self.capture_flag:
-                capture_dict = self.fpv_uav.get_all_frame()
-                # Save all existing multimodal images
-                for key,val in capture_dict.items():
-                    path = "data/capture_imgs/" + key
-                    filename = "capture_" + key + "_" + str(datetime.now().strftime('date_%m_%d_%H_%M_%S')) + "_" + ".png"
-                    save_name = path + "/" + filename
-                    create_directory_if_not_exists(path)  # Create directory
-
-                    cv2.imwrite(save_name, val)
-                print(f"Successful captured! {path}")
+                # Capture all multimodal images in one request, decode and save in the background
+                self.fpv_uav.capture_all_async()
                 # save_name = "data/capture_imgs/capture_" + str(
                 #     datetime.now().strftime('date_%m_%d_%H_%M_%S')) + ".png"
                 # if cv2.imwrite(save_name, frame):
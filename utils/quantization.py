@@ -0,0 +1,172 @@
+import copy
+import os
+import time
+
+import cv2
+import numpy as np
+import torch
+import torch.nn as nn
+
+## YoloBody 的 INT8 量化：静态量化（用采集的图像校准）/ 动态量化（回退方案）
+
+QUANT_MODES = ("static", "dynamic")
+IMAGE_EXTS = (".png", ".jpg", ".jpeg", ".bmp")
+
+# 收集校准用的图像路径（默认使用 data/capture_imgs 下采集的场景图像）
+def list_calibration_images(dirs=("data/capture_imgs",), max_images=64):
+    paths = []
+    for root_dir in dirs:
+        for root, _, files in os.walk(root_dir):
+            # 深度图、分割图等模态与检测输入分布不同，不参与校准
+            if any(name in root for name in ("DepthImage", "SegmentationImage", "SurfaceNormals", "InfraredImage")):
+                continue
+            for file in sorted(files):
+                if file.lower().endswith(IMAGE_EXTS):
+                    paths.append(os.path.join(root, file))
+    # 均匀抽样，避免只用到某一段连续帧
+    if len(paths) > max_images:
+        paths = [paths[i] for i in np.linspace(0, len(paths) - 1, max_images).astype(int)]
+    return paths
+
+# 读取校准图像并预处理成网络输入
+def load_calibration_blobs(preprocessor, paths):
+    blobs = []
+    for path in paths:
+        img = cv2.imread(path)
+        if img is None:
+            continue
+        blob, _ = preprocessor(img)
+        blobs.append(torch.from_numpy(np.array(blob)).unsqueeze(0))
+    return blobs
+
+# 训练后静态量化：插入观察器 -> 校准 -> 转换为 INT8
+def quantize_static(model, calib_blobs, imgsz, qengine=None):
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+    if len(calib_blobs) == 0:
+        raise ValueError("No calibration images for static quantization")
+
+    if qengine is None:
+        qengine = "x86" if "x86" in torch.backends.quantized.supported_engines else "qnnpack"
+    torch.backends.quantized.engine = qengine
+
+    model = copy.deepcopy(model).cpu().eval()
+    example = torch.zeros((1, 3) + tuple(imgsz))
+    prepared = prepare_fx(model, get_default_qconfig_mapping(qengine), (example,))
+    with torch.no_grad():
+        for blob in calib_blobs:
+            prepared(blob)
+    return convert_fx(prepared)
+
+# 动态量化：只量化 Linear 层的权重，卷积仍为浮点，作为静态量化失败时的回退
+# 没有 Linear 层的模型（如全卷积的 YoloBody）动态量化后与浮点模型完全相同，直接报错，不生成名不副实的 INT8 模型
+def quantize_dynamic(model):
+    if not any(isinstance(module, nn.Linear) for module in model.modules()):
+        raise ValueError("Dynamic quantization only quantizes nn.Linear layers and {} has none, "
+                         "use static quantization instead".format(type(model).__name__))
+    model = copy.deepcopy(model).cpu().eval()
+    return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+def quantize_model(model, mode, imgsz, calib_blobs=None):
+    """
+    返回 (量化后的模型, 实际使用的量化方式)
+    静态量化失败（无校准图像、算子不支持等）时回退为动态量化，模型没有可动态量化的层时抛出异常
+    """
+    if mode not in QUANT_MODES:
+        raise ValueError("Unsupported quantization mode: {}, choose from {}".format(mode, QUANT_MODES))
+    if mode == "static":
+        try:
+            return quantize_static(model, calib_blobs or [], imgsz), "static"
+        except Exception as e:
+            print(f"Static quantization failed, falling back to dynamic: {e}")
+    return quantize_dynamic(model), "dynamic"
+
+# 以浮点模型的检测结果为参考，统计量化模型的精确率与召回率
+def match_detections(reference, dets, iou_thr=0.5):
+    from utils.utils import box_iou_matrix
+
+    if len(reference) == 0 or len(dets) == 0:
+        return 0, len(reference), len(dets)
+
+    iou = box_iou_matrix(np.asarray(reference, dtype=np.float64)[:, :4], np.asarray(dets, dtype=np.float64)[:, :4])
+    iou[np.asarray(reference)[:, 5][:, None] != np.asarray(dets)[:, 5][None, :]] = 0
+    matched = 0
+    # 按IoU从大到小贪心匹配
+    for flat in np.argsort(-iou, axis=None):
+        i, j = np.unravel_index(flat, iou.shape)
+        if iou[i, j] < iou_thr:
+            break
+        matched += 1
+        iou[i, :] = 0
+        iou[:, j] = 0
+    return matched, len(reference), len(dets)
+
+def quantization_report(model_path, image_paths, modes=QUANT_MODES, conf=0.5, warmup=2, output_path=None):
+    """
+    精度-延迟报告：以部署模式的浮点模型为参考，比较各量化方式的延迟、模型大小和检测一致性
+    image_paths: 用于评估的图像（建议与校准图像不同）
+    output_path: 不为空时把报告写成 markdown 表格
+    返回: 每种模型一行的字典列表
+    """
+    from utils.utils import BaseEngine
+
+    images = [img for img in (cv2.imread(path) for path in image_paths) if img is not None]
+    if len(images) == 0:
+        raise ValueError("No images for quantization report")
+
+    engines = [("fp32", BaseEngine(model_path, use_gpu=False, deploy=True))]
+    for mode in modes:
+        engines.append(("int8-" + mode, BaseEngine(model_path, use_gpu=False, deploy=True, backend="int8", quantize=mode)))
+
+    reference = None
+    rows = []
+    for name, engine in engines:
+        for img in images[:warmup]:
+            engine.inference_dets(img, conf=conf)
+
+        results, t0 = [], time.perf_counter()
+        for img in images:
+            results.append(engine.inference_dets(img, conf=conf))
+        latency = (time.perf_counter() - t0) / len(images) * 1000
+
+        if reference is None:
+            reference = results
+        matched = total_ref = total_det = 0
+        for ref, dets in zip(reference, results):
+            m, r, d = match_detections(ref, dets)
+            matched, total_ref, total_det = matched + m, total_ref + r, total_det + d
+
+        artifact_path = getattr(engine.backend, "artifact_path", engine.get_fused_cache_path(model_path))
+        if name != "fp32":
+            # 量化失败时 create_backend 会退回浮点后端，在报告中注明，避免把浮点结果当作 INT8
+            if engine.backend.name == "int8":
+                name = "int8-" + engine.backend.mode
+            else:
+                name = "{} (fallback: {})".format(name, engine.backend.name)
+        rows.append({
+            "model": name,
+            "size_mb": os.path.getsize(artifact_path) / 1024 / 1024,
+            "latency_ms": latency,
+            "fps": 1000 / latency,
+            "precision": matched / total_det if total_det else 1.0,
+            "recall": matched / total_ref if total_ref else 1.0,
+        })
+
+    if output_path is not None:
+        lines = [
+            "| Model | Size (MB) | Latency (ms) | FPS | Precision vs FP32 | Recall vs FP32 |",
+            "|-------|-----------|--------------|-----|-------------------|----------------|",
+        ]
+        for row in rows:
+            lines.append("| {model} | {size_mb:.1f} | {latency_ms:.1f} | {fps:.2f} | {precision:.3f} | {recall:.3f} |".format(**row))
+        with open(output_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+    return rows
+
+
+if __name__ == "__main__":
+    # 首次运行时会用 data/capture_imgs 校准并缓存量化模型，删除 data/models 下的 *.int8-* 文件可重新校准
+    for row in quantization_report(r"data/models/best_epoch_weights_Brushify_100.pth", list_calibration_images(max_images=128),
+                                   output_path="expriments/quantization.md"):
+        print(row)
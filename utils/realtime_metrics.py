@@ -0,0 +1,254 @@
+import math
+import threading
+from collections import deque
+
+from utils.evaluate import ATTITUDE_ADJUSTMENT_THRESHOLD, OUTLIER_FLOORS, score_metrics
+
+## 实时飞行指标：由遥测采样逐条增量更新（每个采样 O(1)），随时可以取出当前窗口的指标，不再解析日志
+## 窗口内的均值 / 方差用 Welford 算法增删样本，最大 / 最小值用单调队列，趋势与异常检测用指数滑动平均
+
+
+class WindowStats(object):
+    """最近 window 秒内样本的数量、均值、方差、均方根、最小值、最大值，每个样本均摊 O(1) 更新"""
+
+    # 增删样本次数超过此值时按窗口内的样本重新计算均值和方差，消除浮点误差的累积
+    RECOMPUTE_INTERVAL = 4096
+
+    def __init__(self, window):
+        self.window = window
+        self.__samples = deque()    # (时间, 值)
+        self.__max = deque()        # 单调递减队列 (时间, 值)，队首为窗口最大值
+        self.__min = deque()        # 单调递增队列
+        self.__updates = 0
+        self.count = 0
+        self.mean = 0.
+        self.__m2 = 0.
+
+    def add(self, t, x):
+        self.__samples.append((t, x))
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.__m2 += delta * (x - self.mean)
+
+        while self.__max and self.__max[-1][1] <= x:
+            self.__max.pop()
+        self.__max.append((t, x))
+        while self.__min and self.__min[-1][1] >= x:
+            self.__min.pop()
+        self.__min.append((t, x))
+        self.evict(t)
+
+        self.__updates += 1
+        if self.__updates >= self.RECOMPUTE_INTERVAL:
+            self.__recompute()
+
+    def evict(self, now):
+        """移除早于 now - window 的样本"""
+        start = now - self.window
+        while self.__samples and self.__samples[0][0] <= start:
+            _, x = self.__samples.popleft()
+            if self.count == 1:
+                self.count, self.mean, self.__m2 = 0, 0., 0.
+                continue
+            # Welford 删除样本
+            self.count -= 1
+            delta = x - self.mean
+            self.mean -= delta / self.count
+            self.__m2 -= delta * (x - self.mean)
+        while self.__max and self.__max[0][0] <= start:
+            self.__max.popleft()
+        while self.__min and self.__min[0][0] <= start:
+            self.__min.popleft()
+
+    def __recompute(self):
+        self.__updates = 0
+        self.count = len(self.__samples)
+        self.mean = sum(x for _, x in self.__samples) / self.count if self.count else 0.
+        self.__m2 = sum((x - self.mean) ** 2 for _, x in self.__samples)
+
+    @property
+    def var(self):
+        return max(self.__m2 / self.count, 0.) if self.count else 0.
+
+    @property
+    def std(self):
+        return math.sqrt(self.var)
+
+    @property
+    def rms(self):
+        return math.sqrt(self.mean ** 2 + self.var)
+
+    @property
+    def sum(self):
+        return self.mean * self.count
+
+    @property
+    def max(self):
+        return self.__max[0][1] if self.__max else 0.
+
+    @property
+    def min(self):
+        return self.__min[0][1] if self.__min else 0.
+
+    @property
+    def span(self):
+        """窗口内第一个与最后一个样本的时间差"""
+        return self.__samples[-1][0] - self.__samples[0][0] if self.__samples else 0.
+
+
+class Ewma(object):
+    """按时间常数 tau（秒）衰减的指数滑动平均与方差，采样间隔不固定时同样适用"""
+
+    def __init__(self, tau):
+        self.tau = tau
+        self.count = 0
+        self.mean = 0.
+        self.var = 0.
+
+    def update(self, x, dt):
+        self.count += 1
+        if self.count == 1:
+            self.mean = x
+            return
+        alpha = 1. - math.exp(-max(dt, 0.) / self.tau)
+        delta = x - self.mean
+        self.mean += alpha * delta
+        self.var = (1. - alpha) * (self.var + alpha * delta * delta)
+
+    def zscore(self, x):
+        return (x - self.mean) / math.sqrt(self.var + 1e-12)
+
+
+def _norm(v):
+    return math.sqrt(v[0] * v[0] + v[1] * v[1] + v[2] * v[2])
+
+
+def _wrap(angle):
+    return (angle + math.pi) % (2 * math.pi) - math.pi
+
+
+class RealtimeFlightMonitor(object):
+    def __init__(self, window=4.0, tau=1.0, anomaly_z=4.0, warmup=5):
+        """
+        window: 统计窗口（秒）
+        tau: 指数滑动平均的时间常数（秒），用于趋势与异常检测
+        anomaly_z: 相对指数滑动平均的 z 分数超过此值，且超过 evaluate.OUTLIER_FLOORS 时记为异常
+        warmup: 开始检测异常前需要的样本数
+        用法: uav.subscribe_telemetry("monitoring", 0.2, callback=monitor.update)，之后随时调用 snapshot()
+        """
+        self.window = window
+        self.tau = tau
+        self.anomaly_z = anomaly_z
+        self.warmup = warmup
+        self.__lock = threading.Lock()   # update 在采样线程中调用，snapshot 在界面线程中调用
+        self.reset()
+
+    def reset(self):
+        with self.__lock:
+            self.__stats = {name: WindowStats(self.window) for name in
+                            ("speed", "acceleration", "angular_velocity", "jerk", "tilt", "adjustment")}
+            self.__ewma = {name: Ewma(self.tau) for name in ("acceleration", "angular_velocity", "jerk")}
+            self.__anomalies = deque()
+            self.__start = None
+            self.__history = deque(maxlen=3)        # 最近三个采样 (时间, 速度, 姿态角)
+            self.__accelerations = deque(maxlen=3)  # 最近三个加速度 (时间, 加速度)
+            self.__latest = None
+            self.samples = 0
+
+    def update(self, entry):
+        """加入一个采样，entry 为记录格式的字典（见 telemetry.sample_entry）"""
+        t = entry["timestamp"]
+        velocity, euler = entry["velocity"], entry["euler_angles"]
+        with self.__lock:
+            if self.__start is None:
+                self.__start = t
+            self.samples += 1
+            self.__latest = entry
+            stats = self.__stats
+            values = {"angular_velocity": _norm(entry["angular_velocity"])}
+            stats["speed"].add(t, _norm(velocity))
+            stats["angular_velocity"].add(t, values["angular_velocity"])
+            stats["tilt"].add(t, max(abs(euler[0]), abs(euler[1])))
+
+            # 姿态调整：与上一次测量相比 pitch/roll/yaw 任一变化不小于阈值
+            if self.__history:
+                last_euler = self.__history[-1][2]
+                change = max(abs(_wrap(a - b)) for a, b in zip(euler, last_euler))
+                stats["adjustment"].add(t, 1. if change >= ATTITUDE_ADJUSTMENT_THRESHOLD else 0.)
+            self.__history.append((t, velocity, euler))
+
+            # 加速度、加加速度用中心差分（与 evaluate.analyze_flight 的 np.gradient 一致），比当前采样滞后一个采样
+            dt = t - self.__history[-2][0] if len(self.__history) > 1 else 0.
+            if len(self.__history) == 3:
+                (t0, v0, _), (t1, _, _), _ = self.__history
+                acceleration = [(v - u) / max(t - t0, 1e-6) for v, u in zip(velocity, v0)]
+                values["acceleration"] = _norm(acceleration)
+                stats["acceleration"].add(t1, values["acceleration"])
+                self.__accelerations.append((t1, acceleration))
+                if len(self.__accelerations) == 3:
+                    (ta, a0), (tb, _), _ = self.__accelerations
+                    values["jerk"] = _norm([(a - b) / max(t1 - ta, 1e-6) for a, b in zip(acceleration, a0)])
+                    stats["jerk"].add(tb, values["jerk"])
+            if dt > 0:
+                self.__check_anomaly(t, dt, values)
+
+            for s in stats.values():
+                s.evict(t)
+            while self.__anomalies and self.__anomalies[0]["end"] <= t - self.__start - self.window:
+                self.__anomalies.popleft()
+
+    def __check_anomaly(self, t, dt, values):
+        peaks = {}
+        for name, x in values.items():
+            ewma = self.__ewma[name]
+            if ewma.count >= self.warmup and x > OUTLIER_FLOORS[name] and ewma.zscore(x) > self.anomaly_z:
+                peaks[name] = x
+            ewma.update(x, dt)
+        if not peaks:
+            return
+        # 与上一个异常相隔不超过两个采样周期时合并为同一个异常
+        elapsed = t - self.__start
+        if self.__anomalies and elapsed - self.__anomalies[-1]["end"] <= 2 * dt:
+            anomaly = self.__anomalies[-1]
+            anomaly["end"] = elapsed
+        else:
+            anomaly = {"start": elapsed, "end": elapsed, "peaks": {}}
+            self.__anomalies.append(anomaly)
+        for name, x in peaks.items():
+            anomaly["peaks"][name] = max(anomaly["peaks"].get(name, 0.), x)
+
+    def snapshot(self):
+        """
+        当前窗口的指标，字段与 evaluate.analyze_flight 相同，可直接交给 evaluate.format_realtime_report
+        异常的时间为从开始监控起的秒数
+        """
+        with self.__lock:
+            stats = self.__stats
+            samples = stats["speed"].count
+            metrics = {"samples": samples, "total_samples": self.samples}
+            if samples < 2:
+                metrics["duration"] = 0.
+                return metrics
+            duration = stats["speed"].span
+            adjustments = int(round(stats["adjustment"].sum))
+            metrics.update({
+                "duration": duration,
+                "speed_mean": stats["speed"].mean,
+                "speed_max": stats["speed"].max,
+                "speed_std": stats["speed"].std,
+                "velocity_latest": list(self.__latest["velocity"]),
+                "attitude_latest": list(self.__latest["euler_angles"]),
+                "velocity_vibration": stats["acceleration"].rms,
+                "rotate_vibration": stats["angular_velocity"].rms,
+                "jerk_rms": stats["jerk"].rms,
+                "acceleration_max": stats["acceleration"].max,
+                "angular_velocity_max": stats["angular_velocity"].max,
+                "attitude_adjustments": adjustments,
+                "attitude_adjustment_rate": adjustments / duration if duration > 0 else 0.,
+                "tilt_max": stats["tilt"].max,
+                "ewma": {name: {"mean": e.mean, "std": math.sqrt(e.var)} for name, e in self.__ewma.items()},
+                "anomalies": [dict(a, peaks=dict(a["peaks"])) for a in self.__anomalies],
+            })
+        metrics["scores"] = score_metrics(metrics)
+        return metrics
@@ -0,0 +1,250 @@
+import threading
+import time
+
+import numpy as np
+
+## 遥测采样：每架无人机一个采样线程，按固定节拍（不漂移）查询一次状态，
+## 结果写入预分配的环形缓冲区，再按各订阅者（记录 / 监控 / 轨迹显示）自己的间隔分发
+
+# 每个采样的字段 -> 在一行中的列范围
+TELEMETRY_FIELDS = {
+    "position": slice(0, 3),            # 位置 x, y, z (NED)
+    "velocity": slice(3, 6),            # 速度 vx, vy, vz
+    "euler_angles": slice(6, 9),        # 姿态角 pitch, roll, yaw
+    "angular_velocity": slice(9, 12),   # 角速度 x, y, z
+}
+TELEMETRY_WIDTH = 12
+
+
+class TelemetryBuffer(object):
+    """
+    预分配的环形缓冲区，每行一个采样，写入时不分配内存
+    timestamps: 采样时间; lateness: 实际采样时间相对计划节拍的延迟（秒）
+    """
+
+    def __init__(self, capacity=4096):
+        self.capacity = capacity
+        self.timestamps = np.zeros(capacity, dtype=np.float64)
+        self.lateness = np.zeros(capacity, dtype=np.float64)
+        self.values = np.zeros((capacity, TELEMETRY_WIDTH), dtype=np.float64)
+        self.count = 0      # 写入过的总行数
+
+    def append(self, timestamp, lateness, row):
+        i = self.count % self.capacity
+        self.timestamps[i] = timestamp
+        self.lateness[i] = lateness
+        self.values[i] = row
+        self.count += 1
+        return i
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def indices(self, n=None):
+        """最近 n 个采样的行号（由旧到新）"""
+        size = len(self)
+        n = size if n is None else min(n, size)
+        return np.arange(self.count - n, self.count) % self.capacity
+
+    def latest(self, n=None):
+        """最近 n 个采样 -> (时间戳 [n], 数值 [n, TELEMETRY_WIDTH])，返回副本"""
+        rows = self.indices(n)
+        return self.timestamps[rows], self.values[rows]
+
+    def clear(self):
+        self.count = 0
+
+
+def sample_entry(timestamp, row):
+    """缓冲区中的一行 -> 与原来记录格式相同的字典"""
+    entry = {"timestamp": timestamp}
+    for name, columns in TELEMETRY_FIELDS.items():
+        entry[name] = tuple(float(v) for v in row[columns])
+    return entry
+
+
+class TelemetrySubscription(object):
+    def __init__(self, name, interval, callback=None, collect=True):
+        """
+        interval: 订阅者的采样间隔（秒）
+        callback: 每个采样调用一次 callback(entry)，在采样线程中执行，应尽快返回
+        collect: 是否把采样保存在 entries 中（记录 / 监控结束后导出）
+        """
+        self.name = name
+        self.interval = interval
+        self.callback = callback
+        self.collect = collect
+        self.entries = []
+        self.next_due = None    # 下一次应分发的计划时间
+
+
+class TelemetrySampler(object):
+    def __init__(self, fetch, capacity=4096, name="telemetry"):
+        """
+        fetch: 每个节拍调用一次，返回长度为 TELEMETRY_WIDTH 的状态数值（一次状态 RPC）
+        capacity: 环形缓冲区的行数
+        """
+        self.__fetch = fetch
+        self.__name = name
+        self.buffer = TelemetryBuffer(capacity)
+        self.__subscriptions = {}
+        self.__lock = threading.Lock()
+        self.__stop_event = None                # 每个采样线程各自的停止事件
+        self.__wake_event = threading.Event()  # 订阅变化时唤醒线程，重新计算节拍
+        self.__thread = None
+        self.__interval = None
+        self.__stats = {"ticks": 0, "skipped": 0, "errors": 0, "fetch_time": 0.}
+
+    @property
+    def interval(self):
+        """当前采样节拍（秒），为所有订阅者中最小的间隔"""
+        return self.__interval
+
+    def subscribe(self, name, interval, callback=None, collect=True):
+        """
+        添加订阅者（同名订阅者会被替换），第一个订阅者加入时启动采样线程
+        返回: TelemetrySubscription
+        """
+        subscription = TelemetrySubscription(name, interval, callback, collect)
+        with self.__lock:
+            self.__subscriptions[name] = subscription
+            self.__interval = min(s.interval for s in self.__subscriptions.values())
+            if self.__thread is None or not self.__thread.is_alive():
+                self.__stop_event = threading.Event()
+                self.__thread = threading.Thread(target=self.__run, args=(self.__stop_event,),
+                                                 name=self.__name, daemon=True)
+                self.__thread.start()
+        self.__wake_event.set()
+        return subscription
+
+    def unsubscribe(self, name):
+        """
+        移除订阅者并返回它（不存在时返回 None），最后一个订阅者移除时停止采样线程
+        """
+        with self.__lock:
+            subscription = self.__subscriptions.pop(name, None)
+            if self.__subscriptions:
+                self.__interval = min(s.interval for s in self.__subscriptions.values())
+                thread = None
+            else:
+                self.__interval = None
+                if self.__stop_event is not None:
+                    self.__stop_event.set()
+                thread, self.__thread = self.__thread, None
+        self.__wake_event.set()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=1.0)
+        return subscription
+
+    def get_subscription(self, name):
+        with self.__lock:
+            return self.__subscriptions.get(name)
+
+    def is_running(self):
+        return self.__thread is not None and self.__thread.is_alive()
+
+    def stop(self):
+        with self.__lock:
+            names = list(self.__subscriptions)
+        for name in names:
+            self.unsubscribe(name)
+
+    def __run(self, stop_event):
+        interval = None
+        while not stop_event.is_set():
+            with self.__lock:
+                current_interval = self.__interval
+            if current_interval is None:
+                break
+            if current_interval != interval:
+                # 节拍变化：从现在重新开始计划时间
+                start, interval, tick = time.perf_counter(), current_interval, 0
+
+            # 计划时间由起点和节拍序号计算，误差不会累积
+            scheduled = start + tick * interval
+            delay = scheduled - time.perf_counter()
+            if delay > 0 and self.__wake_event.wait(delay):
+                self.__wake_event.clear()
+                continue
+            now = time.perf_counter()
+
+            # 落后超过一个节拍时跳过错过的节拍，而不是连续补采
+            missed = int((now - scheduled) // interval)
+            if missed > 0:
+                with self.__lock:
+                    self.__stats["skipped"] += missed
+                tick += missed
+                scheduled = start + tick * interval
+            tick += 1
+
+            self.__sample(scheduled, now, interval)
+
+    def __sample(self, scheduled, now, interval):
+        t0 = time.perf_counter()
+        try:
+            row = self.__fetch()
+        except Exception as e:
+            with self.__lock:
+                self.__stats["errors"] += 1
+                first_error = self.__stats["errors"] == 1
+            if first_error:
+                print(f"Telemetry sampling failed: {e}")
+            return
+        fetch_time = time.perf_counter() - t0
+
+        # 统计与缓冲区在其它线程中读取（get_stats / latest），与写入一起加锁
+        timestamp = time.time()
+        with self.__lock:
+            self.__stats["fetch_time"] += fetch_time
+            self.__stats["ticks"] += 1
+            index = self.buffer.append(timestamp, now - scheduled, row)
+            subscriptions = list(self.__subscriptions.values())
+        entry = None
+        for subscription in subscriptions:
+            if subscription.next_due is None:
+                subscription.next_due = scheduled
+            # 留半个节拍的余量，避免浮点误差让采样顺延一拍
+            if scheduled < subscription.next_due - 0.5 * interval:
+                continue
+            # 订阅者的计划时间按自己的间隔递增，平均频率与设定一致；落后太多时从当前节拍重新计
+            subscription.next_due += subscription.interval
+            if subscription.next_due <= scheduled:
+                subscription.next_due = scheduled + subscription.interval
+
+            if entry is None:
+                entry = sample_entry(timestamp, self.buffer.values[index])
+            if subscription.collect:
+                subscription.entries.append(entry)
+            if subscription.callback is not None:
+                try:
+                    subscription.callback(entry)
+                except Exception as e:
+                    print(f"Telemetry subscriber {subscription.name} failed: {e}")
+
+    def latest(self, n=None):
+        """最近 n 个采样 -> (时间戳 [n], 数值 [n, TELEMETRY_WIDTH])，可在其它线程中调用"""
+        with self.__lock:
+            return self.buffer.latest(n)
+
+    def get_stats(self):
+        """
+        采样统计：节拍数、跳过的节拍、失败次数、平均查询耗时，以及最近采样的延迟（毫秒）
+        """
+        with self.__lock:
+            stats = dict(self.__stats)
+            lateness = self.buffer.lateness[self.buffer.indices()] * 1000
+            subscribers = {name: s.interval for name, s in self.__subscriptions.items()}
+            interval = self.__interval
+        ticks = stats["ticks"]
+        return {
+            "running": self.is_running(),
+            "interval": interval,
+            "subscribers": subscribers,
+            "ticks": ticks,
+            "skipped": stats["skipped"],
+            "errors": stats["errors"],
+            "fetch_ms": stats["fetch_time"] / ticks * 1000 if ticks else 0.,
+            "jitter_mean_ms": float(lateness.mean()) if len(lateness) else 0.,
+            "jitter_p99_ms": float(np.percentile(lateness, 99)) if len(lateness) else 0.,
+            "jitter_max_ms": float(lateness.max()) if len(lateness) else 0.,
+        }
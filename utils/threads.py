@@ -1,22 +1,25 @@
 import datetime
 from utils.widgets import *
-from utils.evaluate import evaluate_all_flight,evaluate_realtime_flight
+from utils.evaluate import evaluate_all_flight,format_realtime_report
+from utils.flight_log import export_flight_log_xml
+from utils.realtime_metrics import RealtimeFlightMonitor
 from PyQt5.QtCore import QThread, pyqtSignal
 
 class EvaluationThread(QThread):
     # 定义信号，传递评估结果
     evaluation_signal = pyqtSignal(str)
 
-    def __init__(self, log_data: str):
+    def __init__(self, log_path: str):
         super().__init__()
-        self.log_data = log_data  # 保存日志数据
+        self.log_path = log_path  # stop_logging 返回的记录文件路径
 
     def run(self):
         """
-        线程运行逻辑：执行耗时的评估操作。
+        线程运行逻辑：导出 XML 并执行耗时的评估操作。
         """
         try:
-            result = evaluate_all_flight(self.log_data)
+            export_flight_log_xml(self.log_path)   # 在记录文件旁写出同名 .xml
+            result = evaluate_all_flight(self.log_path)
             # 2021-07-01 10:00:00
             now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             result = f"{now}\n{result}\n"
@@ -29,30 +32,42 @@ class MonitoringThread(QThread):
     # 定义信号，传递飞行状况
     monitoring_signal = pyqtSignal(str)
 
-    def __init__(self, fpv_uav):
+    def __init__(self, fpv_uav, interval=4.0, window=4.0, sample_interval=0.2):
+        """
+        interval: 输出飞行状况的间隔（秒）
+        window: 统计最近多少秒的飞行状况
+        sample_interval: 遥测采样间隔（秒）
+        """
         super().__init__()
         self.fpv_uav = fpv_uav  # UAV 控制器实例
         self.running = True    # 控制线程运行状态
+        self.interval = interval
+        self.sample_interval = sample_interval
+        self.monitor = RealtimeFlightMonitor(window=window)
 
     def run(self):
         """
-        线程运行逻辑：每隔 4 秒监控一次飞行状况。
+        线程运行逻辑：每隔 interval 秒输出一次飞行状况。
+        指标由遥测采样增量更新，输出时只取当前窗口的指标，窗口之间不会漏掉采样。
         """
-        while self.running:
-            self.fpv_uav.start_monitoring()
-            for i in range(40):
+        self.fpv_uav.subscribe_telemetry("realtime_monitor", self.sample_interval, callback=self.monitor.update)
+        try:
+            while self.running:
+                for i in range(max(1, int(round(self.interval * 10)))):
+                    if not self.running:
+                        break
+                    time.sleep(0.1)
                 if not self.running:
                     break
-                time.sleep(0.1)
-            log_data = self.fpv_uav.stop_monitoring()
-            try:
-                # 模拟获取飞行状况
-                result = evaluate_realtime_flight(log_data)
-                # 2021-07-01 10:00:00
-                now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                self.monitoring_signal.emit(f"{now}\n{result}\n")
-            except Exception as e:
-                self.monitoring_signal.emit(f"Error during monitoring:\n {e}")
+                try:
+                    result = format_realtime_report(self.monitor.snapshot())
+                    # 2021-07-01 10:00:00
+                    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                    self.monitoring_signal.emit(f"{now}\n{result}\n")
+                except Exception as e:
+                    self.monitoring_signal.emit(f"Error during monitoring:\n {e}")
+        finally:
+            self.fpv_uav.unsubscribe_telemetry("realtime_monitor")
 
 
     def stop(self):
@@ -0,0 +1,262 @@
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+
+import numpy as np
+
+## 多目标跟踪器注册表：统一的 update(dets, frame) -> tracks 接口，跟踪器模块在创建时才导入
+
+# 跟踪器基类：记录每次 update 的耗时，作为基准测试的钩子
+class TrackerBackend(ABC):
+    name = None
+    cmc_method = None   # 相机运动补偿方式，决定 Navigator 需要提供哪种运动提示
+    supports_prediction = False     # 能否在跳过检测的帧上只做预测（有运动模型）
+    max_time_lost = None            # 轨迹丢失多少帧后被删除，没有轨迹缓冲时为 None
+
+    def __init__(self, latency_window=300):
+        self.__latencies = deque(maxlen=latency_window)   # 最近若干次 update 的耗时（秒）
+        self.__updates = 0
+
+    def update(self, dets, frame, **hints):
+        """
+        dets: [N,6] 检测结果 x1, y1, x2, y2, score, class
+        frame: 原始图像
+        hints: 运动提示（ego_motion / camera_pose），不需要的跟踪器忽略
+        返回: 跟踪结果列表，每个元素有 tlbr, track_id, score, cls 属性
+        """
+        t0 = time.perf_counter()
+        tracks = self._update(np.asarray(dets, dtype=np.float64).reshape(-1, 6), frame, **hints)
+        self.__latencies.append(time.perf_counter() - t0)
+        self.__updates += 1
+        return tracks
+
+    @abstractmethod
+    def _update(self, dets, frame, **hints):
+        pass
+
+    @abstractmethod
+    def predict(self, frame, **hints):
+        """
+        跳过检测的帧：轨迹只做卡尔曼预测（和相机运动补偿），不做关联
+        返回: 与 update 相同格式的跟踪结果列表
+        """
+
+    @abstractmethod
+    def confidence(self):
+        """轨迹的 (最低置信度, 最大位置不确定度)，没有运动模型或没有轨迹时返回 (None, None)"""
+
+    @abstractmethod
+    def predicted_tlbr(self, track_id):
+        """目标下一帧的预测框 [x1, y1, x2, y2]，没有运动模型或目标不在跟踪状态时返回 None"""
+
+    @property
+    @abstractmethod
+    def tracked_stracks(self):
+        """当前处于跟踪状态的目标"""
+
+    def get_stats(self):
+        latencies = np.asarray(self.__latencies) * 1000
+        if len(latencies) == 0:
+            return {"name": self.name, "updates": 0, "mean_ms": 0., "p95_ms": 0., "fps": 0.}
+        mean_ms = float(latencies.mean())
+        return {
+            "name": self.name,
+            "updates": self.__updates,
+            "mean_ms": mean_ms,
+            "p95_ms": float(np.percentile(latencies, 95)),
+            "fps": 1000. / mean_ms if mean_ms > 0 else 0.,
+        }
+
+    def reset_stats(self):
+        self.__latencies.clear()
+        self.__updates = 0
+
+
+# 卡尔曼滤波跟踪器（BoT-SORT / ByteTrack）共用的轨迹置信度与预测框，轨迹为 STrack
+class KalmanTrackerMixin(ABC):
+    supports_prediction = True
+
+    @property
+    def max_time_lost(self):
+        return self.tracker.max_time_lost
+
+    def confidence(self):
+        """
+        已确认轨迹中的 (最低置信度, 最大位置不确定度)，没有轨迹时返回 (None, None)
+        位置不确定度为卡尔曼位置标准差与框宽/高之比
+        """
+        tracks = [t for t in self.tracked_stracks if t.is_activated]
+        if not tracks:
+            return None, None
+        _, _, mean, covariance = tracks[0].gather_state(tracks)
+        width, height = self._state_to_xywh(mean)[:, 2:].T
+        std_x = np.sqrt(covariance[:, 0, 0]) / np.maximum(width, 1)
+        std_y = np.sqrt(covariance[:, 1, 1]) / np.maximum(height, 1)
+        scores = np.fromiter((t.score for t in tracks), dtype=np.float64, count=len(tracks))
+        return float(scores.min()), float(np.maximum(std_x, std_y).max())
+
+    def predicted_tlbr(self, track_id):
+        """
+        按卡尔曼速度外推一帧后的目标框 [x1, y1, x2, y2]，目标不在跟踪状态时返回 None
+        """
+        track = next((t for t in self.tracked_stracks if t.track_id == track_id and t.is_activated), None)
+        if track is None:
+            return None
+        mean = np.asarray(track.mean, dtype=np.float64)
+        xywh = self._state_to_xywh((mean[:4] + mean[4:])[None])[0]
+        return np.concatenate([xywh[:2] - xywh[2:] / 2, xywh[:2] + xywh[2:] / 2])
+
+    @staticmethod
+    @abstractmethod
+    def _state_to_xywh(mean):
+        """[N, >=4] 卡尔曼状态 -> [N, 4] 中心点 x, y 与宽高"""
+
+
+# BoT-SORT：卡尔曼滤波 + 相机运动补偿，精度最高
+class BoTSORTBackend(KalmanTrackerMixin, TrackerBackend):
+    name = "botsort"
+
+    def __init__(self, cmc_method="telemetry", with_reid=False, **kwargs):
+        super(BoTSORTBackend, self).__init__(**kwargs)
+        from BotSort_tracker.tracker.bot_sort import BoTSORT
+
+        self.tracker = BoTSORT(cmc_method=cmc_method, with_reid=with_reid)
+        self.cmc_method = cmc_method
+
+    def _update(self, dets, frame, ego_motion=None, camera_pose=None):
+        return self.tracker.update(dets, frame, ego_motion=ego_motion, camera_pose=camera_pose)
+
+    def predict(self, frame, ego_motion=None, camera_pose=None):
+        return self.tracker.predict(frame, ego_motion=ego_motion, camera_pose=camera_pose)
+
+    @staticmethod
+    def _state_to_xywh(mean):
+        # 状态为 x, y, w, h
+        return mean[:, :4]
+
+    @property
+    def tracked_stracks(self):
+        return self.tracker.tracked_stracks
+
+
+# ByteTrack：没有相机运动补偿，帧率更高
+class ByteTrackBackend(KalmanTrackerMixin, TrackerBackend):
+    name = "bytetrack"
+
+    def __init__(self, track_thresh=0.5, track_buffer=30, match_thresh=0.8, frame_rate=30, **kwargs):
+        super(ByteTrackBackend, self).__init__(**kwargs)
+        from ByteTrack_tracker.byte_tracker import BYTETracker
+
+        self.tracker = BYTETracker(track_thresh, track_buffer, match_thresh, False, frame_rate)
+
+    def _update(self, dets, frame, **hints):
+        # 检测框已经是原图坐标，img_info 与 img_size 相同即不缩放
+        size = frame.shape[:2]
+        return self.tracker.update(dets, size, size)
+
+    def predict(self, frame, **hints):
+        return self.tracker.predict()
+
+    @staticmethod
+    def _state_to_xywh(mean):
+        # 状态为 x, y, 宽高比, h
+        return np.stack([mean[:, 0], mean[:, 1], mean[:, 2] * mean[:, 3], mean[:, 3]], axis=1)
+
+    @property
+    def tracked_stracks(self):
+        return self.tracker.tracked_stracks
+
+
+# 不做跟踪的检测结果，track_id 只是当前帧内的序号，帧间不保持一致
+class Detection(object):
+    __slots__ = ("tlbr", "score", "cls", "track_id")
+
+    def __init__(self, tlbr, score, cls, track_id):
+        self.tlbr = tlbr
+        self.score = score
+        self.cls = cls
+        self.track_id = track_id
+
+
+# 不跟踪：直接输出检测结果，开销最小
+class NoTracker(TrackerBackend):
+    name = "none"
+
+    def __init__(self, **kwargs):
+        super(NoTracker, self).__init__(**kwargs)
+        self.__tracks = []
+
+    def _update(self, dets, frame, **hints):
+        self.__tracks = [Detection(det[:4].copy(), float(det[4]), float(det[5]), i + 1) for i, det in enumerate(dets)]
+        return self.__tracks
+
+    # 没有运动模型：不能只做预测，也没有轨迹置信度与预测框，调度器据此每帧检测、全图检测
+    def predict(self, frame, **hints):
+        return []
+
+    def confidence(self):
+        return None, None
+
+    def predicted_tlbr(self, track_id):
+        return None
+
+    @property
+    def tracked_stracks(self):
+        return self.__tracks
+
+
+TRACKER_BACKENDS = {
+    BoTSORTBackend.name: BoTSORTBackend,
+    ByteTrackBackend.name: ByteTrackBackend,
+    NoTracker.name: NoTracker,
+}
+
+def create_tracker(name, **kwargs):
+    """
+    按名称创建跟踪器，导入或创建失败时退回 BoT-SORT
+    """
+    if name not in TRACKER_BACKENDS:
+        raise ValueError("Unsupported tracker: {}, choose from {}".format(name, list(TRACKER_BACKENDS)))
+    try:
+        tracker = TRACKER_BACKENDS[name](**kwargs)
+    except Exception as e:
+        if name == BoTSORTBackend.name:
+            raise
+        print(f"Failed to create {name} tracker, falling back to botsort: {e}")
+        tracker = BoTSORTBackend()
+    print(f"Using tracker: {tracker.name}")
+    return tracker
+
+def benchmark_trackers(sequence, names=tuple(TRACKER_BACKENDS), **hints):
+    """
+    用同一段检测序列回放各个跟踪器，比较每帧耗时
+    sequence: [(frame, dets), ...]
+    返回: 每个跟踪器一行的统计字典列表（含平均输出轨迹数）
+    """
+    rows = []
+    for name in names:
+        tracker = TRACKER_BACKENDS[name]() if name != BoTSORTBackend.name else BoTSORTBackend(cmc_method="adaptive")
+        num_tracks = 0
+        for frame, dets in sequence:
+            num_tracks += len(tracker.update(dets, frame, **hints))
+        stats = tracker.get_stats()
+        stats["tracks_per_frame"] = num_tracks / max(len(sequence), 1)
+        rows.append(stats)
+    return rows
+
+
+if __name__ == "__main__":
+    # 合成序列：随机纹理背景上匀速运动的目标
+    rng = np.random.default_rng(0)
+    background = (rng.random((480, 752, 3)) * 255).astype(np.uint8)
+    centers = rng.uniform([50, 50], [700, 430], (20, 2))
+    velocities = rng.normal(0, 2, (20, 2))
+    sizes = rng.uniform(20, 60, (20, 2))
+    sequence = []
+    for _ in range(100):
+        centers += velocities
+        boxes = np.concatenate([centers - sizes / 2, centers + sizes / 2], axis=1)
+        dets = np.concatenate([boxes, rng.uniform(0.3, 1, (20, 1)), rng.integers(0, 6, (20, 1))], axis=1)
+        sequence.append((background, dets))
+    for row in benchmark_trackers(sequence):
+        print(row)
@@ -7,11 +7,16 @@ import subprocess
 import time
 import psutil
 import os
+import copy
+import hashlib
+import inspect
+import threading
+from collections import OrderedDict
 from nets.yolo import YoloBody
 
 ## 用于yolov7来对锚框解码的类
 class YOLOV7DecodeBox():
-    def __init__(self, anchors, num_classes, input_shape, anchors_mask = [[6,7,8], [3,4,5], [0,1,2]]):
+    def __init__(self, anchors, num_classes, input_shape, anchors_mask = [[6,7,8], [3,4,5], [0,1,2]], max_cache_size = 8):
         super(YOLOV7DecodeBox, self).__init__()
         self.anchors        = anchors
         self.num_classes    = num_classes
@@ -24,63 +29,227 @@ class YOLOV7DecodeBox():
         #-----------------------------------------------------------#
         self.anchors_mask   = anchors_mask
 
-    def decode_box(self, inputs):
+        # 解码网格缓存，有上限，按最近使用淘汰
+        self.grid_cache     = OrderedDict()
+        self.max_cache_size = max_cache_size
+
+    def get_grid(self, i, input_height, input_width, device, dtype=torch.float32, input_shape=None):
+        """
+        返回第i个特征层的网格坐标和先验框宽高，按 (特征层, 特征层大小, 网络输入大小, 设备, 类型) 缓存
+        grid_xy: [1, 1, H, W, 2]，已乘以步长；anchor_wh: [1, A, 1, 1, 2]
+        两者都在batch维上广播，因此不同batch大小共用同一份缓存
+        input_shape: 网络输入大小 (h, w)，默认为 self.input_shape
+        """
+        input_shape = tuple(input_shape) if input_shape is not None else tuple(self.input_shape)
+        key = (i, input_height, input_width, input_shape, str(device), dtype)
+        cached = self.grid_cache.get(key)
+        if cached is not None:
+            self.grid_cache.move_to_end(key)
+            return cached
+
+        stride_h = input_shape[0] / input_height
+        stride_w = input_shape[1] / input_width
+
+        grid_x = torch.arange(input_width, device=device).repeat(input_height, 1) * stride_w
+        grid_y = torch.arange(input_height, device=device).repeat(input_width, 1).t() * stride_h
+        grid_xy = torch.stack((grid_x, grid_y), -1).to(dtype).view(1, 1, input_height, input_width, 2)
+
+        scaled_anchors = [(anchor_width, anchor_height)
+                        for anchor_width, anchor_height in self.anchors[self.anchors_mask[i]]]
+        anchor_wh = torch.tensor(scaled_anchors, dtype=torch.float32, device=device).to(dtype)
+        anchor_wh = anchor_wh.view(1, len(self.anchors_mask[i]), 1, 1, 2)
+
+        stride = torch.tensor([stride_w, stride_h], dtype=dtype, device=device)
+
+        # 超出上限时淘汰最久未使用的网格
+        if len(self.grid_cache) >= self.max_cache_size:
+            self.grid_cache.popitem(last=False)
+        self.grid_cache[key] = (grid_xy, anchor_wh, stride)
+        return self.grid_cache[key]
+
+    def decode_box(self, inputs, input_shape=None):
+        """
+        input_shape: 网络输入大小 (h, w)，输入不是 self.input_shape 时（如 ROI 推理）用于计算步长
+        """
         outputs = []
         for i, input in enumerate(inputs):
             batch_size = input.size(0)
             input_height = input.size(2)
             input_width = input.size(3)
 
-            stride_h = self.input_shape[0] / input_height
-            stride_w = self.input_shape[1] / input_width
-
-            scaled_anchors = [(anchor_width, anchor_height)
-                            for anchor_width, anchor_height in self.anchors[self.anchors_mask[i]]]
-
             # 调整输入张量形状
             prediction = input.view(batch_size, len(self.anchors_mask[i]),
                                     self.bbox_attrs, input_height, input_width).permute(0, 1, 3, 4, 2).contiguous()
+            grid_xy, anchor_wh, stride = self.get_grid(i, input_height, input_width, input.device, prediction.dtype,
+                                                       input_shape)
 
-            x = torch.sigmoid(prediction[..., 0])  # 中心 x
-            y = torch.sigmoid(prediction[..., 1])  # 中心 y
-            w = (torch.sigmoid(prediction[..., 2]) * 2) ** 2  # 宽度放大
-            h = (torch.sigmoid(prediction[..., 3]) * 2) ** 2  # 高度放大
-            conf = torch.sigmoid(prediction[..., 4])
+            # 框参数+置信度、类别概率各做一次sigmoid，再整体完成中心/宽高的解码
+            # 注意按切片计算sigmoid，与逐通道计算的结果逐位一致
+            box_conf = torch.sigmoid(prediction[..., :5])
             pred_cls = torch.sigmoid(prediction[..., 5:])
-
-            device = input.device
-            grid_x = torch.arange(input_width, device=device).repeat(input_height, 1).repeat(
-                batch_size * len(self.anchors_mask[i]), 1, 1).view(x.shape) * stride_w
-            grid_y = torch.arange(input_height, device=device).repeat(input_width, 1).t().repeat(
-                batch_size * len(self.anchors_mask[i]), 1, 1).view(y.shape) * stride_h
-
-            # 生成先验框宽高
-            scaled_anchors_tensor = torch.tensor(scaled_anchors, dtype=torch.float32, device=device)
-            anchor_w = scaled_anchors_tensor[:, 0:1].repeat(batch_size, 1, input_height * input_width).view(w.shape)
-            anchor_h = scaled_anchors_tensor[:, 1:2].repeat(batch_size, 1, input_height * input_width).view(h.shape)
-
-            # 真实尺度下的预测框
-            pred_boxes = torch.zeros_like(prediction[..., :4], device=device)
-            pred_boxes[..., 0] = x * stride_w + grid_x  # 中心点 x
-            pred_boxes[..., 1] = y * stride_h + grid_y  # 中心点 y
-            pred_boxes[..., 2] = w * anchor_w           # 宽度
-            pred_boxes[..., 3] = h * anchor_h           # 高度
+            box_xy = box_conf[..., 0:2] * stride + grid_xy          # 中心点
+            box_wh = (box_conf[..., 2:4] * 2) ** 2 * anchor_wh      # 宽高放大
 
             # 组合输出
-            output = torch.cat((pred_boxes.view(batch_size, -1, 4),
-                                conf.view(batch_size, -1, 1),
-                                pred_cls.view(batch_size, -1, self.num_classes)), -1)
+            output = torch.cat((box_xy, box_wh, box_conf[..., 4:], pred_cls), -1).view(batch_size, -1, self.bbox_attrs)
             outputs.append(output)
 
         return torch.cat(outputs,dim=1)
 
 
 
+## 推理后端：输入 [N, 3, H, W] 的张量，输出三个特征层的张量列表
+## fixed_input_size 为 True 的后端只接受 engine.imgsz 大小的输入（ROI 推理时不能缩小输入）
+class TorchBackend(object):
+    name = "torch"
+    fixed_input_size = False
+
+    def __init__(self, engine):
+        self.model = engine.model
+
+    def __call__(self, img_tensor):
+        return self.model(img_tensor)
+
+# TorchScript 后端：trace 一次并缓存到权重旁边，之后直接加载
+class TorchScriptBackend(object):
+    name = "torchscript"
+    fixed_input_size = False    # 全卷积网络，trace 后仍可用其它输入大小
+
+    def __init__(self, engine):
+        self.device = engine.device
+        tag = "fused-ts" if engine.deploy else "ts"
+        artifact_path = engine.get_artifact_path(engine.model_path, tag, ".pt")
+        if not os.path.exists(artifact_path):
+            example = torch.zeros((1, 3) + tuple(engine.imgsz), device=self.device)
+            with torch.no_grad():
+                traced = torch.jit.trace(engine.model, example, check_trace=False)
+            traced.save(artifact_path)
+            print(f"Saved TorchScript model: {artifact_path}")
+        self.model = torch.jit.load(artifact_path, map_location=self.device)
+        self.model.eval()
+        print(f"Using TorchScript model: {artifact_path}")
+
+    def __call__(self, img_tensor):
+        return self.model(img_tensor)
+
+# ONNX Runtime 后端（CPU）：导出一次 ONNX 模型并缓存到权重旁边，batch 维为动态维度
+class OnnxRuntimeBackend(object):
+    name = "onnxruntime"
+    fixed_input_size = True     # 导出时只有 batch 维是动态的
+
+    def __init__(self, engine, num_threads=None):
+        import onnxruntime
+
+        self.device = engine.device
+        tag = "fused-onnx" if engine.deploy else "onnx"
+        artifact_path = engine.get_artifact_path(engine.model_path, tag, ".onnx")
+        if not os.path.exists(artifact_path):
+            self.export(engine.model, artifact_path, engine.imgsz)
+            print(f"Saved ONNX model: {artifact_path}")
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads is not None:
+            options.intra_op_num_threads = num_threads
+        self.session = onnxruntime.InferenceSession(artifact_path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        print(f"Using ONNX Runtime model: {artifact_path}")
+
+    @staticmethod
+    def export(model, artifact_path, imgsz):
+        model = copy.deepcopy(model).cpu().eval()
+        example = torch.zeros((1, 3) + tuple(imgsz))
+        output_names = ["output0", "output1", "output2"]
+        kwargs = {}
+        # 新版 torch 默认使用 dynamo 导出，这里固定使用与 yolo.py 中 convert_to_onnx 相同的导出方式
+        if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+            kwargs["dynamo"] = False
+        torch.onnx.export(model,
+                          example,
+                          f                   = artifact_path,
+                          verbose             = False,
+                          opset_version       = 12,
+                          do_constant_folding = True,
+                          input_names         = ["images"],
+                          output_names        = output_names,
+                          dynamic_axes        = {name: {0: "batch"} for name in ["images"] + output_names},
+                          **kwargs)
+
+    def __call__(self, img_tensor):
+        img = img_tensor.detach().cpu().numpy().astype(np.float32, copy=False)
+        outputs = self.session.run(None, {self.input_name: img})
+        return [torch.from_numpy(output).to(self.device) for output in outputs]
+
+# INT8 量化后端（CPU）：量化一次后保存为 TorchScript 并缓存到权重旁边
+class QuantizedBackend(object):
+    name = "int8"
+    fixed_input_size = False
+
+    def __init__(self, engine):
+        from utils.quantization import list_calibration_images, load_calibration_blobs, quantize_model
+
+        self.mode = engine.quantize
+        tag = "fused-int8-" if engine.deploy else "int8-"
+        self.artifact_path = engine.get_artifact_path(engine.model_path, tag + self.mode, ".pt")
+        if not os.path.exists(self.artifact_path):
+            blobs = []
+            if self.mode == "static":
+                paths = list_calibration_images(engine.calibration_dirs)
+                print(f"Calibrating with {len(paths)} images")
+                blobs = load_calibration_blobs(engine.preprocessor, paths)
+            model, self.mode = quantize_model(engine.model, self.mode, engine.imgsz, blobs)
+            # 回退为动态量化时按实际方式保存
+            self.artifact_path = engine.get_artifact_path(engine.model_path, tag + self.mode, ".pt")
+            example = torch.zeros((1, 3) + tuple(engine.imgsz))
+            with torch.no_grad():
+                traced = torch.jit.trace(model, example, check_trace=False)
+            traced.save(self.artifact_path)
+            print(f"Saved INT8 model: {self.artifact_path}")
+        self.model = torch.jit.load(self.artifact_path, map_location="cpu")
+        self.model.eval()
+        self.device = engine.device
+        print(f"Using INT8 model: {self.artifact_path}")
+
+    def __call__(self, img_tensor):
+        outputs = self.model(img_tensor.cpu())
+        return [output.to(self.device) for output in outputs]
+
+INFERENCE_BACKENDS = {
+    TorchBackend.name: TorchBackend,
+    TorchScriptBackend.name: TorchScriptBackend,
+    OnnxRuntimeBackend.name: OnnxRuntimeBackend,
+    QuantizedBackend.name: QuantizedBackend,
+}
+
+def create_backend(name, engine):
+    """
+    按名称创建推理后端，依赖缺失或导出失败时退回 PyTorch eager
+    """
+    if name not in INFERENCE_BACKENDS:
+        raise ValueError("Unsupported backend: {}, choose from {}".format(name, list(INFERENCE_BACKENDS)))
+    try:
+        backend = INFERENCE_BACKENDS[name](engine)
+    except Exception as e:
+        if name == TorchBackend.name:
+            raise
+        print(f"Failed to create {name} backend, falling back to torch: {e}")
+        backend = TorchBackend(engine)
+    print(f"Using backend: {backend.name}")
+    return backend
+
 ## 用于加载目标检测模型的类
 class BaseEngine(object):
-    def __init__(self, model_path, use_gpu=True):
+    # 部署模式融合前后解码输出允许的最大绝对误差（像素）
+    DEPLOY_PARITY_ATOL = 1e-2
+
+    def __init__(self, model_path, use_gpu=True, deploy=False, backend="torch", quantize="static",
+                 calibration_dirs=("data/capture_imgs",)):
         """
         初始化推理引擎
+        deploy: 部署模式，加载融合了 Conv-BN 与重参数化 RepConv 的推理图，
+                融合后的权重按原始权重的哈希缓存到磁盘，下次启动直接加载
+        backend: 推理后端，可选 "torch"、"torchscript"、"onnxruntime"、"int8"
+        quantize: int8 后端的量化方式，"static"（用 calibration_dirs 中的图像校准）或 "dynamic"
         """
         self.mean = None
         self.std = None
@@ -92,6 +261,8 @@ class BaseEngine(object):
         # 类别相关信息
         self.n_classes = 6      # 种类的个数
         self.imgsz = (640, 640)  # 默认值或文档中指定的大小
+        self.preprocessor = LetterboxPreprocessor(self.imgsz, self.mean, self.std)  # 复用缓冲区的预处理器
+        self.roi_preprocessors = {}     # ROI 推理的输入大小 -> 预处理器
 
         # 设备选择
         self.device = torch.device('cuda' if use_gpu and torch.cuda.is_available() else 'cpu')
@@ -99,11 +270,113 @@ class BaseEngine(object):
         print(f"Using device: {self.device}")
         print(f"Using model: {model_path}")
 
-        self.model = YoloBody(self.anchors_mask, self.n_classes, self.phi, pretrained=False, phi_attention=0)
-        self.model.load_state_dict(torch.load(model_path, map_location=self.device))
+        self.model_path = model_path
+        self.deploy = deploy
+        self.quantize = quantize
+        self.calibration_dirs = calibration_dirs
+        if deploy:
+            self.model = self.load_deploy_model(model_path)
+        else:
+            self.model = self.build_model()
+            self.model.load_state_dict(torch.load(model_path, map_location=self.device))
         self.model.to(self.device)
         self.model.eval()
 
+        # 推理后端：torch / torchscript / onnxruntime
+        self.backend = create_backend(backend, self)
+
+    def build_model(self, fused=False):
+        """
+        构建网络结构，fused=True 时返回融合后的推理图结构（权重未加载）
+        """
+        model = YoloBody(self.anchors_mask, self.n_classes, self.phi, pretrained=False, phi_attention=0)
+        if fused:
+            model.eval()
+            with torch.no_grad():
+                model.fuse()
+        return model
+
+    @staticmethod
+    def get_artifact_path(model_path, tag, ext):
+        """
+        由原始权重派生的缓存文件路径，与原始权重放在同一目录，文件名中带原始权重的哈希
+        例如 data/models/xxx.pth -> data/models/xxx.fused-<hash>.pth
+        """
+        sha = hashlib.sha256()
+        with open(model_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                sha.update(chunk)
+        root, _ = os.path.splitext(model_path)
+        return "{}.{}-{}{}".format(root, tag, sha.hexdigest()[:16], ext)
+
+    @staticmethod
+    def get_fused_cache_path(model_path):
+        """
+        融合权重的缓存路径
+        """
+        return BaseEngine.get_artifact_path(model_path, "fused", ".pth")
+
+    def load_deploy_model(self, model_path):
+        """
+        加载部署模式的模型：优先读取磁盘上的融合权重缓存，没有则融合一次并写入缓存
+        融合后先与原始模型对比输出，不一致时不写缓存，退回原始模型
+        """
+        cache_path = self.get_fused_cache_path(model_path)
+        if os.path.exists(cache_path):
+            model = self.build_model(fused=True)
+            try:
+                model.load_state_dict(torch.load(cache_path, map_location=self.device))
+                print(f"Using fused model: {cache_path}")
+                return model
+            except (RuntimeError, OSError) as e:
+                print(f"Fused cache invalid, rebuilding: {e}")
+
+        model = self.build_model()
+        model.load_state_dict(torch.load(model_path, map_location=self.device))
+        model.to(self.device).eval()
+        reference = copy.deepcopy(model)
+        with torch.no_grad():
+            model.fuse()
+
+        max_diff = self.output_diff(reference, model)
+        if max_diff > self.DEPLOY_PARITY_ATOL:
+            print(f"Fused model mismatch (max diff {max_diff:.4g} > {self.DEPLOY_PARITY_ATOL}), using unfused model")
+            return reference
+        print(f"Fused model parity check passed (max diff {max_diff:.4g})")
+        try:
+            torch.save(model.state_dict(), cache_path)
+            print(f"Saved fused model: {cache_path}")
+        except OSError as e:
+            print(f"Failed to save fused model: {e}")
+        return model
+
+    def output_diff(self, reference, model, img=None):
+        """
+        两个模型在同一输入上解码后输出的最大绝对误差（框坐标为输入图像的像素尺度）
+        img: 原始图像，为空时使用固定种子的随机图像
+        """
+        if img is None:
+            img = np.random.RandomState(0).randint(0, 256, (self.imgsz[0], self.imgsz[1], 3), dtype=np.uint8)
+        blob, _ = self.preprocessor(img)
+        blob = torch.from_numpy(np.array(blob)).unsqueeze(0).to(self.device)
+        with torch.no_grad():
+            expected = self.boxutil.decode_box(reference(blob))
+            actual = self.boxutil.decode_box(model(blob))
+        return (expected - actual).abs().max().item()
+
+    def check_deploy_parity(self, img=None, atol=None):
+        """
+        对比部署模式（融合）与原始训练图的输出是否一致
+        img: 原始图像，为空时使用随机图像
+        atol: 允许的最大绝对误差，默认为 DEPLOY_PARITY_ATOL
+        返回: (是否一致, 解码后输出的最大绝对误差)
+        """
+        reference = self.build_model()
+        reference.load_state_dict(torch.load(self.model_path, map_location=self.device))
+        reference.to(self.device).eval()
+        max_diff = self.output_diff(reference, self.model, img)
+        return max_diff <= (self.DEPLOY_PARITY_ATOL if atol is None else atol), max_diff
+
 
     def infer(self, img_tensor):
         """
@@ -128,7 +401,7 @@ class BaseEngine(object):
         # 禁用梯度计算以提高推理性能
         with torch.no_grad():
             # 执行推理
-            outputs = self.boxutil.decode_box(self.model(img_tensor))    
+            outputs = self.boxutil.decode_box(self.backend(img_tensor), input_shape=img_tensor.shape[2:])
             # 输出形状为 [batch_size,3 * (20*20 + 40*40 + 80*80), 5 + num_classes]
        
         # print(outputs.shape)
@@ -148,6 +421,32 @@ class BaseEngine(object):
 
         return outputs[0]
 
+    def infer_batch(self, img_tensors, max_batch_size=8):
+        """
+        批量推理函数，一次前向处理多帧图像（多架无人机 / 多种相机模态 / 缓存帧）
+        img_tensors: 预处理后的图像列表 [C,H,W]，或者形状为 [N,C,H,W] 的数组
+        max_batch_size: 单次前向的最大帧数，防止显存 / 内存占用过大
+        返回: 形状为 [N, 3 * (20*20 + 40*40 + 80*80), 5 + num_classes] 的 NumPy 数组
+        """
+        if isinstance(img_tensors, np.ndarray) and len(img_tensors.shape) == 4:
+            batch = img_tensors
+        else:
+            batch = np.stack([np.asarray(img, dtype=np.float32) for img in img_tensors], axis=0)
+        batch = np.ascontiguousarray(batch, dtype=np.float32)
+
+        self.model.eval()
+
+        outputs = []
+        with torch.no_grad():
+            for start in range(0, batch.shape[0], max_batch_size):
+                # 按块送入模型，每块共享一次前向
+                chunk = torch.from_numpy(batch[start:start + max_batch_size]).to(self.device)
+                outputs.append(self.boxutil.decode_box(self.backend(chunk), input_shape=chunk.shape[2:]).cpu().numpy())
+
+        if len(outputs) == 0:
+            return np.zeros((0, 0, 5 + self.n_classes), dtype=np.float32)
+        return np.concatenate(outputs, axis=0)
+
 
     # 处理视频中的目标检测
     def detect_video(self, video_path, conf=0.5, end2end=False):
@@ -192,7 +491,7 @@ class BaseEngine(object):
 
     # 将原始图像中的内容 + 检测框
     def inference(self, origin_img, conf=0.5, end2end=False):
-        img, ratio = preproc(origin_img, self.imgsz, self.mean, self.std)
+        img, ratio = self.preprocessor(origin_img)
         data = self.infer(img)
         if end2end:
             num, final_boxes, final_scores, final_cls_inds = data
@@ -213,7 +512,7 @@ class BaseEngine(object):
 
     # 对原始图像中内容检测，返回符合conf的检测结果
     def inference_dets(self, origin_img, conf=0.5, end2end=False, white_list=None):
-        img, ratio = preproc(origin_img, self.imgsz, self.mean, self.std)
+        img, ratio = self.preprocessor(origin_img)
         data = self.infer(img)
         if end2end:
             num, final_boxes, final_scores, final_cls_inds = data
@@ -223,18 +522,74 @@ class BaseEngine(object):
         else:
             dets = self.postprocess(data, ratio, nms_threshold=0.2)
 
-        if dets is not None:
-            final_dets = []
-            for i in range(dets.shape[0]):
-                if (white_list is None or dets[i, 5] in white_list) and dets[i, 4] >= conf:
-                    final_dets = np.concatenate((final_dets, dets[i, :]))
-            if np.array(final_dets).shape != (0,):
-                final_dets = final_dets.reshape([-1, 6])
-                final_dets = np.concatenate((np.int_(final_dets[:, :4]), final_dets[:, 4:6]), axis=1)
-        else:
-            final_dets = []
+        return self.filter_dets(dets, conf, white_list)
+
+    # 只对图像中的一个区域（如跟踪目标附近）检测，用更小的输入尺寸，检测框映射回原图坐标
+    def inference_dets_roi(self, origin_img, roi, input_size=(320, 320), conf=0.5, white_list=None):
+        """
+        roi: 检测区域 (x1, y1, x2, y2)，原图像素坐标
+        input_size: 网络输入大小 (h, w)，需为32的倍数；后端只支持固定输入时使用 self.imgsz
+        被区域边界截断的框（区域边界不是图像边界处）会被丢弃，避免残缺的框干扰跟踪
+        返回: 与 inference_dets 相同格式的检测结果
+        """
+        height, width = origin_img.shape[:2]
+        x1, y1 = max(int(roi[0]), 0), max(int(roi[1]), 0)
+        x2, y2 = min(int(np.ceil(roi[2])), width), min(int(np.ceil(roi[3])), height)
+        if x2 - x1 < 2 or y2 - y1 < 2:
+            return []
+
+        if getattr(self.backend, "fixed_input_size", True):
+            input_size = self.imgsz
+        input_size = tuple(input_size)
+        preprocessor = self.roi_preprocessors.get(input_size)
+        if preprocessor is None:
+            preprocessor = self.roi_preprocessors.setdefault(
+                input_size, LetterboxPreprocessor(input_size, self.mean, self.std))
+
+        img, ratio = preprocessor(origin_img[y1:y2, x1:x2])
+        dets = self.postprocess(self.infer(img), ratio, nms_threshold=0.2)
+        if dets is None:
+            return []
+
+        dets[:, [0, 2]] += x1
+        dets[:, [1, 3]] += y1
+        margin = 2
+        truncated = ((dets[:, 0] < x1 + margin) & (x1 > 0)) | ((dets[:, 1] < y1 + margin) & (y1 > 0)) | \
+                    ((dets[:, 2] > x2 - margin) & (x2 < width)) | ((dets[:, 3] > y2 - margin) & (y2 < height))
+        return self.filter_dets(dets[~truncated], conf, white_list)
+
+    # 对多帧原始图像批量检测，返回每一帧符合conf的检测结果
+    def inference_dets_batch(self, origin_imgs, conf=0.5, white_list=None, max_batch_size=8):
+        """
+        origin_imgs: 原始图像列表（可以来自多架无人机、多种相机模态或缓存帧）
+        返回: 与 origin_imgs 一一对应的检测结果列表，每个元素与 inference_dets 的返回值格式相同
+        """
+        if len(origin_imgs) == 0:
+            return []
+
+        imgs, ratios = self.preprocessor.batch(origin_imgs)
+        data = self.infer_batch(imgs, max_batch_size=max_batch_size)
+
+        results = []
+        for i in range(len(origin_imgs)):
+            dets = self.postprocess(data[i], ratios[i], nms_threshold=0.2)
+            results.append(self.filter_dets(dets, conf, white_list))
+        return results
+
+    # 按置信度与类别白名单过滤nms后的检测结果
+    @staticmethod
+    def filter_dets(dets, conf=0.5, white_list=None):
+        if dets is None:
+            return []
+
+        mask = dets[:, 4] >= conf
+        if white_list is not None:
+            mask &= np.isin(dets[:, 5], white_list)
+        final_dets = dets[mask]
+        if final_dets.shape[0] == 0:
+            return []
 
-        return final_dets
+        return np.concatenate((np.int_(final_dets[:, :4]), final_dets[:, 4:6]), axis=1)
 
     ## 用于 > yolov8
     # @staticmethod
@@ -340,129 +695,78 @@ class BaseEngine(object):
             _ = self.infer(img)
         print(100 / (time.perf_counter() - t0), 'FPS')
 
-# 改进后的单类别NMS实现
-def nms(boxes, scores, nms_thr):
-    """Single class NMS with improved filtering."""
-    x1 = boxes[:, 0]
-    y1 = boxes[:, 1]
-    x2 = boxes[:, 2]
-    y2 = boxes[:, 3]
-
-    areas = (x2 - x1) * (y2 - y1)
-    order = scores.argsort()[::-1]
-
-    keep = []
-    while order.size > 0:
-        i = order[0]
-        keep.append(i)
-        if order.size == 1:
+# 计算两组框之间的IoU矩阵 [..., N, 4] x [..., M, 4] -> [..., N, M]，支持批量维度
+# offset: 宽高的像素偏移，NMS 按像素坐标计算宽高 (x2 - x1 + 1)，与原来逐框比较的 nms 一致
+def box_iou_matrix(boxes_a, boxes_b, offset=0.):
+    area_a = (boxes_a[..., 2] - boxes_a[..., 0] + offset) * (boxes_a[..., 3] - boxes_a[..., 1] + offset)
+    area_b = (boxes_b[..., 2] - boxes_b[..., 0] + offset) * (boxes_b[..., 3] - boxes_b[..., 1] + offset)
+
+    xx1 = np.maximum(boxes_a[..., :, None, 0], boxes_b[..., None, :, 0])
+    yy1 = np.maximum(boxes_a[..., :, None, 1], boxes_b[..., None, :, 1])
+    xx2 = np.minimum(boxes_a[..., :, None, 2], boxes_b[..., None, :, 2])
+    yy2 = np.minimum(boxes_a[..., :, None, 3], boxes_b[..., None, :, 3])
+
+    inter = np.maximum(0.0, xx2 - xx1 + offset) * np.maximum(0.0, yy2 - yy1 + offset)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return inter / (area_a[..., :, None] + area_b[..., None, :] - inter)
+
+# 向量化的多类别NMS：所有类别一次完成，不再逐类别、逐框循环
+def batched_nms(boxes, scores, classes, nms_thr):
+    """
+    Greedy NMS for all classes at once on a batched IoU matrix.
+    返回保留下来的框的下标，按类别升序、置信度降序排列
+    """
+    if scores.size == 0:
+        return np.zeros((0,), dtype=np.int64)
+
+    # 按类别升序、置信度降序排序，并按类别分组填充成 [G, m] 的批量形式
+    order = np.lexsort((-scores, classes))
+    _, starts, counts = np.unique(classes[order], return_index=True, return_counts=True)
+    group = np.repeat(np.arange(counts.size), counts)
+    rank = np.arange(order.size) - np.repeat(starts, counts)
+
+    padded_boxes = np.zeros((counts.size, counts.max(), 4), dtype=boxes.dtype)
+    padded_boxes[group, rank] = boxes[order]
+    valid = np.zeros((counts.size, counts.max()), dtype=bool)
+    valid[group, rank] = True
+
+    # 上三角抑制矩阵：suppress[g, i, j] 表示同类别中得分更高的框i会抑制框j
+    suppress = box_iou_matrix(padded_boxes, padded_boxes, offset=1.) > nms_thr
+    suppress &= np.triu(np.ones(suppress.shape[1:], dtype=bool), k=1)
+    suppress &= valid[:, :, None] & valid[:, None, :]
+
+    # Cluster-NMS：只有保留下来的框才能抑制其他框，迭代至收敛后与逐个比较的贪心NMS结果一致
+    keep = valid.copy()
+    for _ in range(counts.max()):
+        new_keep = valid & ~np.any(suppress & keep[:, :, None], axis=1)
+        if np.array_equal(new_keep, keep):
             break
-            
-        # 计算交集区域
-        xx1 = np.maximum(x1[i], x1[order[1:]])
-        yy1 = np.maximum(y1[i], y1[order[1:]])
-        xx2 = np.minimum(x2[i], x2[order[1:]])
-        yy2 = np.minimum(y2[i], y2[order[1:]])
-
-        w = np.maximum(0.0, xx2 - xx1)
-        h = np.maximum(0.0, yy2 - yy1)
-        inter = w * h
-
-        # 使用面积比率和IoU双重过滤
-        ovr = inter / (areas[i] + areas[order[1:]] - inter)
-        
-        # 同时满足IoU阈值和面积比例要求
-        inds = np.where((ovr <= nms_thr))[0]
-        order = order[inds + 1]
+        keep = new_keep
+
+    return order[keep[group, rank]]
 
-    return keep
+# 单类别NMS
+def nms(boxes, scores, nms_thr):
+    """Single class NMS, returns kept indices sorted by score."""
+    return batched_nms(boxes, scores, np.zeros(scores.shape[0], dtype=np.int64), nms_thr)
 
 def multiclass_nms(boxes, scores, nms_thr=0.45, score_thr=0.65):
-    """Multiclass NMS with improved thresholds and filtering"""
-    final_dets = []
-    num_classes = scores.shape[1]
-    
-    # 对每个类别分别进行NMS
-    for cls_ind in range(num_classes):
-        cls_scores = scores[:, cls_ind]
-        
-        # 提高置信度阈值的过滤
-        valid_score_mask = cls_scores > score_thr
-        if valid_score_mask.sum() == 0:
-            continue
-        
-        valid_scores = cls_scores[valid_score_mask]
-        valid_boxes = boxes[valid_score_mask]
-        
-        # 应用NMS
-        keep = nms(valid_boxes, valid_scores, nms_thr)
-        if len(keep) > 0:
-            cls_inds = np.ones((len(keep), 1)) * cls_ind
-            dets = np.concatenate(
-                [valid_boxes[keep], valid_scores[keep, None], cls_inds], 1
-            )
-            final_dets.append(dets)
-    
-    if len(final_dets) == 0:
+    """Multiclass NMS, all classes are processed in a single pass"""
+    # 一次性筛选出所有类别中置信度大于阈值的 (框, 类别) 组合
+    box_inds, cls_inds = np.nonzero(scores > score_thr)
+    if box_inds.size == 0:
         return None
-        
-    return np.concatenate(final_dets, 0)
-
-
-
-# # 非极大值抑制，返回满足条件的框
-# def nms(boxes, scores, nms_thr):
-#     """Single class NMS implemented in Numpy."""
-#     x1 = boxes[:, 0]
-#     y1 = boxes[:, 1]
-#     x2 = boxes[:, 2]
-#     y2 = boxes[:, 3]
-
-#     areas = (x2 - x1 + 1) * (y2 - y1 + 1)
-#     order = scores.argsort()[::-1]
-
-#     keep = []
-#     while order.size > 0:
-#         i = order[0]
-#         keep.append(i)
-#         xx1 = np.maximum(x1[i], x1[order[1:]])
-#         yy1 = np.maximum(y1[i], y1[order[1:]])
-#         xx2 = np.minimum(x2[i], x2[order[1:]])
-#         yy2 = np.minimum(y2[i], y2[order[1:]])
-
-#         w = np.maximum(0.0, xx2 - xx1 + 1)
-#         h = np.maximum(0.0, yy2 - yy1 + 1)
-#         inter = w * h
-#         ovr = inter / (areas[i] + areas[order[1:]] - inter)
-
-#         inds = np.where(ovr <= nms_thr)[0]
-#         order = order[inds + 1]
-
-#     return keep
-
-# # 多目标非极大值抑制，返回满足条件的框
-# def multiclass_nms(boxes, scores, nms_thr, score_thr):
-#     """Multiclass NMS implemented in Numpy"""
-#     final_dets = []
-#     num_classes = scores.shape[1]
-#     for cls_ind in range(num_classes):
-#         cls_scores = scores[:, cls_ind]
-#         valid_score_mask = cls_scores > score_thr
-#         if valid_score_mask.sum() == 0:
-#             continue
-#         else:
-#             valid_scores = cls_scores[valid_score_mask]
-#             valid_boxes = boxes[valid_score_mask]
-#             keep = nms(valid_boxes, valid_scores, nms_thr)
-#             if len(keep) > 0:
-#                 cls_inds = np.ones((len(keep), 1)) * cls_ind
-#                 dets = np.concatenate(
-#                     [valid_boxes[keep], valid_scores[keep, None], cls_inds], 1
-#                 )
-#                 final_dets.append(dets)
-#     if len(final_dets) == 0:
-#         return None
-#     return np.concatenate(final_dets, 0)
+
+    valid_boxes = boxes[box_inds]
+    valid_scores = scores[box_inds, cls_inds]
+
+    # 结果按类别升序、置信度降序排列，与逐类别处理的输出顺序相同
+    keep = batched_nms(valid_boxes, valid_scores, cls_inds, nms_thr)
+    dets = np.concatenate(
+        [valid_boxes[keep], valid_scores[keep, None], cls_inds[keep, None].astype(np.float64)], 1
+    )
+    return dets
+
 
 # 将图片内容进行归一化处理(mean,std)   swap:表示交换纬度 将[高，宽，通道]变为[通道，高，宽]
 def preproc(image, input_size, mean, std, swap=(2, 0, 1)):
@@ -496,6 +800,111 @@ def preproc(image, input_size, mean, std, swap=(2, 0, 1)):
     padded_img = np.ascontiguousarray(padded_img, dtype=np.float32)
     return padded_img, r
 
+# 复用缓冲区的letterbox预处理，结果与 preproc 逐字节一致
+class LetterboxPreprocessor(object):
+    def __init__(self, input_size, mean=None, std=None, pad_value=114):
+        """
+        input_size: 模型输入大小 (h, w)
+        mean/std: 与 preproc 相同的归一化参数
+        """
+        self.input_size = tuple(input_size)
+        self.pad_value = pad_value
+        self.mean = mean
+        self.std = std
+        self.ratio = 1.0        # 最近一帧的缩放比例
+
+        # 查找表：uint8像素值 -> 归一化后的float32值，按RGB通道各一张
+        # 先用float64计算再转float32，与 preproc 的计算顺序保持一致
+        lut = np.repeat((np.arange(256, dtype=np.float64) / 255.0)[None, :], 3, axis=0)
+        if mean is not None:
+            lut -= np.asarray(mean, dtype=np.float64).reshape(-1, 1)
+        if std is not None:
+            lut /= np.asarray(std, dtype=np.float64).reshape(-1, 1)
+        self.__lut = lut.astype(np.float32)
+
+        # 每个线程各自的缓冲区：(源图像高, 源图像宽, batch大小) -> 预分配的输入张量
+        # 采集、导航等线程共用同一个 BaseEngine 时，不会覆盖彼此还在使用的输入
+        self.__local = threading.local()
+        self.__max_buffers = 8
+
+    def __get_buffer(self, resized_hw, batch_size):
+        buffers = getattr(self.__local, "buffers", None)
+        if buffers is None:
+            buffers = self.__local.buffers = {}
+        key = (resized_hw[0], resized_hw[1], batch_size)
+        buffer = buffers.get(key)
+        if buffer is None:
+            if len(buffers) >= self.__max_buffers:
+                buffers.pop(next(iter(buffers)))
+            # 填充区域只在创建时写一次，之后每帧只覆盖缩放后的有效区域
+            buffer = np.empty((batch_size, 3) + self.input_size, dtype=np.float32)
+            buffer[:] = self.__lut[:, self.pad_value].reshape(1, 3, 1, 1)
+            buffers[key] = buffer
+        return buffer
+
+    def __resize(self, image):
+        r = min(self.input_size[0] / image.shape[0], self.input_size[1] / image.shape[1])
+        resized_img = cv2.resize(
+            image,
+            (int(image.shape[1] * r), int(image.shape[0] * r)),
+            interpolation=cv2.INTER_LINEAR,
+        )
+        return resized_img, r
+
+    def __fill(self, dst, resized_img):
+        # 一次查表同时完成 BGR->RGB、归一化和 HWC->CHW
+        h, w = resized_img.shape[:2]
+        for c in range(3):
+            np.take(self.__lut[c], resized_img[:, :, 2 - c], out=dst[c, :h, :w], mode='clip')
+
+    @staticmethod
+    def supports(image):
+        return isinstance(image, np.ndarray) and image.dtype == np.uint8 and \
+            len(image.shape) == 3 and image.shape[2] == 3
+
+    def __call__(self, image):
+        """
+        返回 (形状为 [3, H, W] 的输入张量, 缩放比例)
+        注意：返回的张量是当前线程的内部缓冲区，会在本线程下一次调用时被覆盖，需要保留时请复制
+        """
+        if not self.supports(image):
+            padded_img, self.ratio = self.__fallback(image)
+            return padded_img, self.ratio
+
+        resized_img, self.ratio = self.__resize(image)
+        buffer = self.__get_buffer(resized_img.shape[:2], 1)
+        self.__fill(buffer[0], resized_img)
+        return buffer[0], self.ratio
+
+    def batch(self, images):
+        """
+        将多帧图像预处理到同一个 [N, 3, H, W] 的缓冲区中（当前线程的内部缓冲区，同 __call__）
+        返回 (输入张量, 每一帧的缩放比例列表)
+        """
+        resized = [self.__resize(image) if self.supports(image) else None for image in images]
+        shapes = set(item[0].shape[:2] for item in resized if item is not None)
+
+        # 同一分辨率的多帧共用一块缓冲区；分辨率不同时各自的填充区域不同，直接新建
+        if len(shapes) == 1 and all(item is not None for item in resized):
+            buffer = self.__get_buffer(shapes.pop(), len(images))
+        else:
+            buffer = np.empty((len(images), 3) + self.input_size, dtype=np.float32)
+            buffer[:] = self.__lut[:, self.pad_value].reshape(1, 3, 1, 1)
+
+        ratios = []
+        for i, image in enumerate(images):
+            if resized[i] is None:
+                buffer[i], ratio = self.__fallback(image)
+            else:
+                resized_img, ratio = resized[i]
+                self.__fill(buffer[i], resized_img)
+            ratios.append(ratio)
+        return buffer, ratios
+
+    def __fallback(self, image):
+        # 非uint8三通道图像，走原始的 preproc 流程
+        return preproc(image, self.input_size, self.mean, self.std)
+
 # 返回一个(size,3)的颜色三元色数组
 def rainbow_fill(size=50):  # simpler way to generate rainbow color
     cmap = plt.get_cmap('jet')
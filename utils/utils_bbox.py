@@ -1,10 +1,12 @@
+from collections import OrderedDict
+
 import numpy as np
 import torch
 from torchvision.ops import nms
 
 
 class DecodeBox():
-    def __init__(self, anchors, num_classes, input_shape, anchors_mask = [[6,7,8], [3,4,5], [0,1,2]]):
+    def __init__(self, anchors, num_classes, input_shape, anchors_mask = [[6,7,8], [3,4,5], [0,1,2]], max_cache_size = 8):
         super(DecodeBox, self).__init__()
         self.anchors        = anchors
         self.num_classes    = num_classes
@@ -17,6 +19,53 @@ class DecodeBox():
         #-----------------------------------------------------------#
         self.anchors_mask   = anchors_mask
 
+        #-----------------------------------------------------------#
+        #   解码网格缓存，有上限，按最近使用淘汰
+        #-----------------------------------------------------------#
+        self.grid_cache     = OrderedDict()
+        self.max_cache_size = max_cache_size
+
+    def get_grid(self, i, input_height, input_width, device, dtype=torch.float32):
+        #----------------------------------------------------------#
+        #   生成第i个特征层的网格和先验框宽高，并按
+        #   (特征层, 特征层大小, 设备, 类型) 缓存
+        #   grid_xy     1, 1, 20, 20, 2
+        #   anchor_wh   1, 3, 1, 1, 2
+        #   两者在batch维上广播，不同batch大小共用同一份缓存
+        #----------------------------------------------------------#
+        key = (i, input_height, input_width, str(device), dtype)
+        cached = self.grid_cache.get(key)
+        if cached is not None:
+            self.grid_cache.move_to_end(key)
+            return cached
+
+        stride_h = self.input_shape[0] / input_height
+        stride_w = self.input_shape[1] / input_width
+        #-------------------------------------------------#
+        #   此时获得的scaled_anchors大小是相对于特征层的
+        #-------------------------------------------------#
+        scaled_anchors = [(anchor_width / stride_w, anchor_height / stride_h) for anchor_width, anchor_height in self.anchors[self.anchors_mask[i]]]
+
+        grid_x = torch.linspace(0, input_width - 1, input_width).repeat(input_height, 1)
+        grid_y = torch.linspace(0, input_height - 1, input_height).repeat(input_width, 1).t()
+        grid_xy = torch.stack((grid_x, grid_y), -1).to(device=device, dtype=dtype).view(1, 1, input_height, input_width, 2)
+
+        anchor_wh = torch.tensor(scaled_anchors, dtype=torch.float32).to(device=device, dtype=dtype)
+        anchor_wh = anchor_wh.view(1, len(self.anchors_mask[i]), 1, 1, 2)
+
+        #----------------------------------------------------------#
+        #   将输出结果归一化成小数的形式
+        #----------------------------------------------------------#
+        scale = torch.tensor([input_width, input_height, input_width, input_height], dtype=torch.float32).to(device=device, dtype=dtype)
+
+        #----------------------------------------------------------#
+        #   超出上限时淘汰最久未使用的网格
+        #----------------------------------------------------------#
+        if len(self.grid_cache) >= self.max_cache_size:
+            self.grid_cache.popitem(last=False)
+        self.grid_cache[key] = (grid_xy, anchor_wh, scale)
+        return self.grid_cache[key]
+
     def decode_box(self, inputs):
         outputs = []
         for i, input in enumerate(inputs):
@@ -31,17 +80,6 @@ class DecodeBox():
             input_height    = input.size(2)
             input_width     = input.size(3)
 
-            #-----------------------------------------------#
-            #   输入为640x640时
-            #   stride_h = stride_w = 32、16、8
-            #-----------------------------------------------#
-            stride_h = self.input_shape[0] / input_height
-            stride_w = self.input_shape[1] / input_width
-            #-------------------------------------------------#
-            #   此时获得的scaled_anchors大小是相对于特征层的
-            #-------------------------------------------------#
-            scaled_anchors = [(anchor_width / stride_w, anchor_height / stride_h) for anchor_width, anchor_height in self.anchors[self.anchors_mask[i]]]
-
             #-----------------------------------------------#
             #   输入的input一共有三个，他们的shape分别是
             #   batch_size, 3, 20, 20, 85
@@ -50,46 +88,17 @@ class DecodeBox():
             #-----------------------------------------------#
             prediction = input.view(batch_size, len(self.anchors_mask[i]),
                                     self.bbox_attrs, input_height, input_width).permute(0, 1, 3, 4, 2).contiguous()
+            grid_xy, anchor_wh, scale = self.get_grid(i, input_height, input_width, input.device, prediction.dtype)
 
             #-----------------------------------------------#
-            #   先验框的中心位置的调整参数
-            #-----------------------------------------------#
-            x = torch.sigmoid(prediction[..., 0])  
-            y = torch.sigmoid(prediction[..., 1])
+            #   先验框的调整参数和是否有物体的置信度
+            #   按切片计算sigmoid，与逐通道计算的结果逐位一致
             #-----------------------------------------------#
-            #   先验框的宽高调整参数
-            #-----------------------------------------------#
-            w = torch.sigmoid(prediction[..., 2]) 
-            h = torch.sigmoid(prediction[..., 3]) 
-            #-----------------------------------------------#
-            #   获得置信度，是否有物体
-            #-----------------------------------------------#
-            conf        = torch.sigmoid(prediction[..., 4])
+            box_conf    = torch.sigmoid(prediction.data[..., :5])
             #-----------------------------------------------#
             #   种类置信度
             #-----------------------------------------------#
-            pred_cls    = torch.sigmoid(prediction[..., 5:])
-
-            FloatTensor = torch.cuda.FloatTensor if x.is_cuda else torch.FloatTensor
-            LongTensor  = torch.cuda.LongTensor if x.is_cuda else torch.LongTensor
-
-            #----------------------------------------------------------#
-            #   生成网格，先验框中心，网格左上角 
-            #   batch_size,3,20,20
-            #----------------------------------------------------------#
-            grid_x = torch.linspace(0, input_width - 1, input_width).repeat(input_height, 1).repeat(
-                batch_size * len(self.anchors_mask[i]), 1, 1).view(x.shape).type(FloatTensor)
-            grid_y = torch.linspace(0, input_height - 1, input_height).repeat(input_width, 1).t().repeat(
-                batch_size * len(self.anchors_mask[i]), 1, 1).view(y.shape).type(FloatTensor)
-
-            #----------------------------------------------------------#
-            #   按照网格格式生成先验框的宽高
-            #   batch_size,3,20,20
-            #----------------------------------------------------------#
-            anchor_w = FloatTensor(scaled_anchors).index_select(1, LongTensor([0]))
-            anchor_h = FloatTensor(scaled_anchors).index_select(1, LongTensor([1]))
-            anchor_w = anchor_w.repeat(batch_size, 1).repeat(1, 1, input_height * input_width).view(w.shape)
-            anchor_h = anchor_h.repeat(batch_size, 1).repeat(1, 1, input_height * input_width).view(h.shape)
+            pred_cls    = torch.sigmoid(prediction.data[..., 5:])
 
             #----------------------------------------------------------#
             #   利用预测结果对先验框进行调整
@@ -100,19 +109,13 @@ class DecodeBox():
             #   w 0 ~ 1 => 0 ~ 2 => 0 ~ 4 => 先验框的宽高调节范围为0~4倍
             #   h 0 ~ 1 => 0 ~ 2 => 0 ~ 4 => 先验框的宽高调节范围为0~4倍
             #----------------------------------------------------------#
-            pred_boxes          = FloatTensor(prediction[..., :4].shape)
-            pred_boxes[..., 0]  = x.data * 2. - 0.5 + grid_x
-            pred_boxes[..., 1]  = y.data * 2. - 0.5 + grid_y
-            pred_boxes[..., 2]  = (w.data * 2) ** 2 * anchor_w
-            pred_boxes[..., 3]  = (h.data * 2) ** 2 * anchor_h
+            box_xy      = box_conf[..., 0:2] * 2. - 0.5 + grid_xy
+            box_wh      = (box_conf[..., 2:4] * 2) ** 2 * anchor_wh
+            pred_boxes  = torch.cat((box_xy, box_wh), -1)
 
-            #----------------------------------------------------------#
-            #   将输出结果归一化成小数的形式
-            #----------------------------------------------------------#
-            _scale = torch.Tensor([input_width, input_height, input_width, input_height]).type(FloatTensor)
-            output = torch.cat((pred_boxes.view(batch_size, -1, 4) / _scale,
-                                conf.view(batch_size, -1, 1), pred_cls.view(batch_size, -1, self.num_classes)), -1)
-            outputs.append(output.data)
+            output = torch.cat((pred_boxes.view(batch_size, -1, 4) / scale,
+                                box_conf[..., 4].reshape(batch_size, -1, 1), pred_cls.reshape(batch_size, -1, self.num_classes)), -1)
+            outputs.append(output)
         return outputs
 
     def yolo_correct_boxes(self, box_xy, box_wh, input_shape, image_shape, letterbox_image):
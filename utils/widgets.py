@@ -366,7 +366,7 @@ class ChangeWorkModeWidget(QWidget):
         super(ChangeWorkModeWidget, self).__init__()
         self.setWindowIcon(QtGui.QIcon('utils/hhu.jpg'))
         self.setWindowTitle("Change Mode")
-        self.resize(500, 250)
+        self.resize(500, 330)
         
         # Set frameless window and add drop shadow
         self.setWindowFlags(Qt.WindowStaysOnTopHint | Qt.FramelessWindowHint)
@@ -516,6 +516,17 @@ class ChangeWorkModeWidget(QWidget):
             self.cbox.setCurrentIndex(ind)
         
         mode_layout.addWidget(self.cbox)
+
+        # Tracker selection: trade tracking accuracy for frame rate
+        tracker_label = QLabel("Tracker:")
+        tracker_label.setStyleSheet(mode_label.styleSheet())
+        mode_layout.addWidget(tracker_label)
+
+        self.tracker_cbox = QComboBox()
+        self.tracker_cbox.addItems(self.uav.tracker_list)
+        self.tracker_cbox.setStyleSheet(self.cbox.styleSheet())
+        self.tracker_cbox.setCurrentIndex(self.uav.tracker_list.index(self.uav.get_tracker_name()))
+        mode_layout.addWidget(self.tracker_cbox)
         content_layout.addWidget(mode_container)
         
         # Button area
@@ -598,6 +609,7 @@ class ChangeWorkModeWidget(QWidget):
 
     def confirm(self):
         self.current_work_mode = self.cbox.currentText()
+        self.uav.set_tracker(self.tracker_cbox.currentText())
         self.uav.set_work_mode(self.current_work_mode)
         self.mode_changed.emit(self.current_work_mode)  # Emit signal
         self.close()